@@ -1,30 +1,46 @@
-from openai import OpenAI
+from client_pool import get_openai_client
+from llm_metrics import CallTimer
 
 class LLM:
     '''
     LLM 的 Docstring
     ''' 
-    def __init__(self,model:str,api_key:str,base_url:str):
+    def __init__(self,model:str,api_key:str,base_url:str,timeout:float=60):
         self.model = model
-        self.client = OpenAI(api_key=api_key,base_url=base_url)
+        #共享连接池的客户端，避免每个LLM实例都重新握手
+        self.client = get_openai_client(api_key=api_key,base_url=base_url,timeout=timeout)
 
-    def generate_text(self,prompt:str,system_prompt:str)->str:
-        '''调用LLM来生成回应'''
+    def generate_text(self,prompt:str,system_prompt:str,stop:list=None,max_tokens:int=None)->str:
+        '''
+        调用LLM来生成回应
+        stop: 停止序列，生成到这些字符串时服务端直接结束，不再为多余的内容付费
+        max_tokens: 本次调用最多生成的token数
+        '''
         print("loading...正在调用LLM")
+        timer = CallTimer(wrapper="LLM",model=self.model,stream=False)
         try:
             messages = [
                 {"role":'system','content':system_prompt},
                 {'role':'user','content':prompt}
             ]
+            extra_params = {}
+            if stop:
+                extra_params["stop"] = list(stop)[:4] #OpenAI接口最多支持4个停止序列
+            if max_tokens:
+                extra_params["max_tokens"] = max_tokens
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 stream=False,
                 temperature=0.5,
+                **extra_params,
             )
             answer = response.choices[0].message.content
+            #非流式调用没有首token时间，TTFT记为None
+            timer.finish(usage=response.usage)
             print("LLM调用成功")
             return answer
         except Exception as e:
+            timer.finish(error=e)
             print(f"LLM调用失败: {e}")
             return f"错误: LLM调用失败 - {e}"
\ No newline at end of file
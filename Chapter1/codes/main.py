@@ -1,6 +1,8 @@
 import re
 import os
 from llm import LLM
+from client_pool import warm_up
+from llm_metrics import attribution,registry
 from tools.get_weather import get_weather
 from tools.search_attraction import get_attraction
 from dotenv import load_dotenv
@@ -16,6 +18,7 @@ TAVILY_API_KEY = "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"
 os.environ["TAVILY_API_KEY"] = TAVILY_API_KEY
 print(f"使用的LLM模型: {MODEL_ID}，api_key: {API_KEY}，API地址: {BASE_URL}")
 llm = LLM(model=MODEL_ID,api_key=API_KEY,base_url=BASE_URL)
+warm_up([llm.client]) #启动时预热连接池，第一次调用不再承担握手开销
 
 # 将所有工具函数放入一个字典，方便后续调用
 available_tools = {
@@ -54,8 +57,15 @@ for i in range(5):
         请开始吧！
     """
     #3.2 调用LLM
-    llm_output = llm.generate_text(full_prompt,system_prompt=AGENT_SYSTEM_PROMPT)
-    #模型可能输出多余的Thought-Action，需要截断：
+    #通过停止序列让服务端在第一对Thought-Action之后就结束生成，并限制单步的最大token数
+    with attribution(agent="TravelAgent",step=i+1):
+        llm_output = llm.generate_text(
+            full_prompt,
+            system_prompt=AGENT_SYSTEM_PROMPT,
+            stop=["Observation:","\nThought:"],
+            max_tokens=512,
+        )
+    #部分兼容接口会忽略stop参数，仍保留客户端截断作为兜底：
     match = re.search(r'(Thought:.*?Action:.*?)(?=\n\s*(?:Thought:|Action:|Observation:)|\Z)', llm_output, re.DOTALL)
     if match:
         truncated = match.group(1).strip()
@@ -92,5 +102,4 @@ for i in range(5):
     print(f"工具观察结果:\n{observation_str}\n" + '-'*40)
     prompt_hiustory.append(observation_str)
 
-
-
+print(f"LLM调用指标汇总:\n{registry.summary(agent='TravelAgent')}")
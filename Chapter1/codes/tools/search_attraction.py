@@ -1,5 +1,5 @@
 import os
-from tavily import TavilyClient
+from client_pool import get_tavily_client
 
 def get_attraction(city:str,weather:str)->str:
     '''
@@ -10,8 +10,8 @@ def get_attraction(city:str,weather:str)->str:
     if not api_key:
         return "错误：未找到TAVILY_API_KEY环境变量，请设置后重试。"
     
-    #2.初始化Tavily客户端
-    tavily = TavilyClient(api_key=api_key)
+    #2.获取共享的Tavily客户端(同一进程内只创建一次，复用连接)
+    tavily = get_tavily_client(api_key)
 
     #3.构造一个精确的查询以适配景点搜索
     query = f"{city}在{weather}天气下最值得去的旅游景点及理由"
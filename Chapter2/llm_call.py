@@ -1,26 +1,26 @@
-import torch
-from transformers import AutoModelForCausalLM,AutoTokenizer 
+import sys
+import time
+from local_model import LocalChatModel, MODEL_ID, compare_int8
 
 
 '''
 AutoModelForCausalLM and AutoTokenizer are classes from the Hugging Face Transformers library 
 used for loading pre-trained language models and their corresponding tokenizers.
-'''
-
-#设置设备
-device = "cuda" if torch.cuda.is_available() else "cpu"
-print(f"using device:{device}")
-
-#指定model id
-model_id = "Qwen/Qwen1.5-0.5B-Chat"
+模型与分词器的加载封装在 local_model.LocalChatModel 中(本地快照 + safetensors 内存映射)
 
-#加载对应分词器
-tokenizer = AutoTokenizer.from_pretrained(model_id)
+用法：
+    python llm_call.py            # fp32
+    python llm_call.py --int8     # 线性层动态int8量化
+    python llm_call.py --compare-int8  # 实测 int8 与 fp32 的速度/一致率
+'''
 
-#加载模型，并将其移动到对应设备
-model = AutoModelForCausalLM.from_pretrained(model_id).to(device)
+if "--compare-int8" in sys.argv:
+    for name, result in compare_int8(MODEL_ID).items():
+        print(name, result)
+    sys.exit(0)
 
-print("模型和分词器加载完成。")
+#加载分词器和模型，并将其移动到对应设备
+llm = LocalChatModel(MODEL_ID, int8="--int8" in sys.argv)
 
 #准备对话输入
 messages = [
@@ -28,33 +28,26 @@ messages = [
     {'role':'user','content':'你好，请介绍一下中国电信.'},
 ]
 
-#使用model对应tokenizer进行编码
-text = tokenizer.apply_chat_template(
-    messages,
-    tokenize=False,
-    add_generation_prompt=True
-)
-
-#编码输入文本
-model_inputs = tokenizer([text],return_tensors='pt').to(device) #将文本转为张量，并移动到对应设备
+#使用model对应tokenizer的chat模板进行编码
+input_ids = llm.encode_chat(messages)
 
 print("编码后的文本:")
-print(model_inputs)
+print(input_ids)
 
 #使用模型生成回答
-#定义max_new_tokens，限制生成的最大新tokens数
-generated_ids = model.generate(
-    model_inputs.input_ids,
-    max_new_tokens=512,
+#定义max_new_tokens，限制生成的最大新tokens数；generate_batch 只回调新生成的token，不含输入部分
+generated_ids = []
+start = time.perf_counter()
+llm.generate_batch(
+    prompts=[input_ids],
+    max_new_tokens=[512],
+    temperatures=[0.0],
+    on_token=lambda i, token_id: generated_ids.append(token_id) or True,
+    on_finish=lambda i, reason: None,
 )
+elapsed = time.perf_counter() - start
 
-#将生成新的Token ID截取掉输入部分
-#这样只解码模型新生成的部分
-generated_ids = [
-    output_ids[len(input_ids):] for input_ids, output_ids in zip(model_inputs.input_ids, generated_ids) #输入输出绑定
-]
-
-response = tokenizer.batch_decode(generated_ids,skip_special_tokens=True)[0] #解码生成的Token ID为文本
+response = llm.decode(generated_ids) #解码生成的Token ID为文本
 print("模型回答:")
 print(response)
-
+print(f"生成 {len(generated_ids)} 个token，耗时 {elapsed:.2f}s，平均 {1000 * elapsed / max(len(generated_ids), 1):.1f} ms/token")
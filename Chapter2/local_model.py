@@ -0,0 +1,319 @@
+import os
+import json
+import time
+import torch
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
+from transformers import AutoModelForCausalLM,AutoTokenizer
+from prefix_cache import PrefixKVCache
+
+'''
+本地模型的加载与批量解码
+llm_call.py 每次运行只生成一条回答；这里把模型包装成可以长期驻留的对象，
+generate_batch 把多条不同长度的提示左填充(left padding)成一个批次，手写逐token解码循环：
+- 每一步把新token回调给调用方，便于流式输出
+- 每条序列独立结束(EOS、长度上限或调用方要求停止)，全部结束后整批退出
+
+启动加速：
+- 模型只在本地没有快照时才联网下载，之后直接从本地目录加载，不再向 Hub 发起版本检查
+- safetensors 权重通过内存映射(mmap)按需读入，low_cpu_mem_usage 避免先随机初始化再覆盖权重
+- 同一组消息的 chat 模板渲染与分词结果做 LRU 缓存
+可选 int8：对 Transformer 层中的 nn.Linear 做动态量化(权重int8、激活运行时量化)，CPU 上更快、内存更小，
+lm_head 保持 fp32 以减少对输出分布的影响；效果用 compare_int8 实测
+'''
+
+MODEL_ID = "Qwen/Qwen1.5-0.5B-Chat"
+
+
+def resolve_model_path(model_id: str) -> str:
+    '''
+    优先使用本地已下载的快照目录；本地没有时才下载一次
+    '''
+    if os.path.isdir(model_id):
+        return model_id
+    from huggingface_hub import snapshot_download
+    try:
+        return snapshot_download(model_id, local_files_only=True)
+    except Exception:
+        print(f"本地没有 {model_id} 的快照，开始下载...")
+        return snapshot_download(model_id, allow_patterns=["*.json", "*.safetensors", "*.txt", "*.model", "*.jinja"])
+
+
+class LocalChatModel:
+    def __init__(self, model_id: str = MODEL_ID, device: Optional[str] = None, int8: bool = False,
+                 prefix_cache: Optional[PrefixKVCache] = None):
+        '''
+        参数：
+        - model_id (str): Hugging Face 模型id或本地目录
+        - device (str, 可选): 默认有GPU用cuda，否则cpu
+        - int8 (bool): 是否对线性层做动态int8量化(仅CPU)
+        - prefix_cache (PrefixKVCache, 可选): 复用共享前缀的KV，跳过重复的预填充
+        '''
+        self.model_id = model_id
+        self.prefix_cache = prefix_cache
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        #每个实例单独的编码缓存：类级别的 lru_cache 会以 self 为键持有实例，模型永远不会被释放
+        self._encode_cached = lru_cache(maxsize=1024)(self._encode_uncached)
+        print(f"using device:{self.device}")
+
+        started = time.perf_counter()
+        path = resolve_model_path(model_id)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(path, use_fast=True)
+        self.tokenizer.padding_side = "left" #批量生成必须左填充，保证每条序列的最后一个位置都是真实token
+        if self.tokenizer.pad_token_id is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        tokenizer_loaded = time.perf_counter()
+
+        self.model = AutoModelForCausalLM.from_pretrained(
+            path,
+            torch_dtype=torch.float32 if self.device == "cpu" else "auto",
+            low_cpu_mem_usage=True,
+            use_safetensors=True,
+        ).to(self.device)
+        self.model.eval()
+
+        self.int8 = int8 and self.device == "cpu"
+        if self.int8:
+            quantize_int8(self.model)
+
+        eos = self.model.generation_config.eos_token_id
+        self.eos_token_ids = set(eos if isinstance(eos, list) else [eos])
+        self.load_seconds = time.perf_counter() - started
+        print(f"模型和分词器加载完成。分词器 {tokenizer_loaded - started:.2f}s，总计 {self.load_seconds:.2f}s"
+              f"{'，int8量化' if self.int8 else ''}")
+
+    def encode_chat(self, messages: List[dict]) -> List[int]:
+        '''
+        把对话套上模型自带的chat模板并编码为token id
+        '''
+        key = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+        return list(self._encode_cached(key))
+
+    def _encode_uncached(self, messages_json: str) -> Tuple[int, ...]:
+        text = self.tokenizer.apply_chat_template(
+            json.loads(messages_json),
+            tokenize=False,
+            add_generation_prompt=True
+        )
+        return tuple(self.tokenizer(text).input_ids)
+
+    def decode(self, token_ids: List[int]) -> str:
+        return self.tokenizer.decode(token_ids, skip_special_tokens=True)
+
+    @staticmethod
+    def _sample(logits: torch.Tensor, temperatures: torch.Tensor) -> torch.Tensor:
+        '''
+        逐行采样：temperature 为 0 的行取 argmax，其余按温度缩放后的分布采样
+        '''
+        greedy = logits.argmax(dim=-1)
+        sampled_rows = temperatures > 0
+        if not sampled_rows.any():
+            return greedy
+        scaled = logits[sampled_rows] / temperatures[sampled_rows].unsqueeze(-1)
+        probs = torch.softmax(scaled.float(), dim=-1)
+        greedy[sampled_rows] = torch.multinomial(probs, num_samples=1).squeeze(-1)
+        return greedy
+
+    def _prefill(self, prompts: List[List[int]]):
+        '''
+        整批左填充后一次前向，返回 (每行最后位置的logits, past_key_values, attention_mask)
+        '''
+        pad_id = self.tokenizer.pad_token_id
+        max_len = max(len(p) for p in prompts)
+        input_ids = torch.tensor(
+            [[pad_id] * (max_len - len(p)) + p for p in prompts], device=self.device
+        )
+        attention_mask = torch.tensor(
+            [[0] * (max_len - len(p)) + [1] * len(p) for p in prompts], device=self.device
+        )
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=(attention_mask.cumsum(-1) - 1).clamp(min=0),
+            use_cache=True,
+        )
+        return outputs.logits[:, -1, :], outputs.past_key_values, attention_mask
+
+    def _prefill_with_prefix_cache(self, prompts: List[List[int]]):
+        '''
+        逐条预填充：每条提示先从前缀缓存取出最长公共前缀的KV，只对剩余部分做前向；
+        再把各行的KV左填充拼成一个批次，后续解码与 _prefill 完全相同
+        '''
+        rows = []
+        for prompt in prompts:
+            reused, cached = self.prefix_cache.lookup(prompt)
+            outputs = self.model(
+                input_ids=torch.tensor([prompt[reused:]], device=self.device),
+                position_ids=torch.arange(reused, len(prompt), device=self.device).unsqueeze(0),
+                past_key_values=_from_legacy(cached) if cached is not None else None,
+                use_cache=True,
+            )
+            kv = _to_legacy(outputs.past_key_values)
+            self.prefix_cache.insert(prompt, kv)
+            rows.append((outputs.logits[:, -1, :], kv))
+
+        max_len = max(len(p) for p in prompts)
+        attention_mask = torch.tensor(
+            [[0] * (max_len - len(p)) + [1] * len(p) for p in prompts], device=self.device
+        )
+        merged = []
+        for layer in range(len(rows[0][1])):
+            keys, values = [], []
+            for (_, kv), prompt in zip(rows, prompts):
+                k, v = kv[layer]
+                pad = max_len - len(prompt)
+                keys.append(torch.nn.functional.pad(k, (0, 0, pad, 0)))
+                values.append(torch.nn.functional.pad(v, (0, 0, pad, 0)))
+            merged.append((torch.cat(keys), torch.cat(values)))
+        last_logits = torch.cat([logits for logits, _ in rows])
+        return last_logits, _from_legacy(tuple(merged)), attention_mask
+
+    @torch.inference_mode()
+    def generate_batch(
+        self,
+        prompts: List[List[int]],
+        max_new_tokens: List[int],
+        temperatures: List[float],
+        on_token: Callable[[int, int], bool],
+        on_finish: Callable[[int, str], None],
+    ):
+        '''
+        对一批提示做带 KV cache 的逐token解码
+        参数：
+        - prompts: 每条请求的提示 token id
+        - max_new_tokens / temperatures: 每条请求各自的生成上限与温度
+        - on_token(i, token_id): 第 i 条序列生成了新token，返回 False 表示调用方要求提前停止(命中stop序列或客户端断开)
+        - on_finish(i, reason): 第 i 条序列结束，reason 为 "stop" 或 "length"
+        '''
+        batch_size = len(prompts)
+        pad_id = self.tokenizer.pad_token_id
+        if self.prefix_cache is not None:
+            last_logits, past_key_values, attention_mask = self._prefill_with_prefix_cache(prompts)
+        else:
+            last_logits, past_key_values, attention_mask = self._prefill(prompts)
+        #左填充后位置编码要从每条序列的第一个真实token开始计数
+        position_ids = attention_mask.sum(-1, keepdim=True) - 1
+        temps = torch.tensor(temperatures, dtype=torch.float32, device=self.device)
+
+        finished = [False] * batch_size
+        generated = [0] * batch_size
+
+        for _ in range(max(max_new_tokens)):
+            next_tokens = self._sample(last_logits, temps)
+
+            for i, token_id in enumerate(next_tokens.tolist()):
+                if finished[i]:
+                    continue
+                if token_id in self.eos_token_ids:
+                    finished[i] = True
+                    on_finish(i, "stop")
+                    continue
+                generated[i] += 1
+                if not on_token(i, token_id):
+                    finished[i] = True
+                    on_finish(i, "stop")
+                elif generated[i] >= max_new_tokens[i]:
+                    finished[i] = True
+                    on_finish(i, "length")
+
+            if all(finished):
+                break
+
+            #已结束的序列继续喂pad占位，它们的输出会被忽略
+            next_tokens[torch.tensor(finished, device=self.device)] = pad_id
+            attention_mask = torch.cat(
+                [attention_mask, torch.ones((batch_size, 1), dtype=attention_mask.dtype, device=self.device)], dim=-1
+            )
+            position_ids = position_ids + 1
+            outputs = self.model(
+                input_ids=next_tokens.unsqueeze(-1),
+                attention_mask=attention_mask,
+                position_ids=position_ids,
+                past_key_values=past_key_values,
+                use_cache=True,
+            )
+            past_key_values = outputs.past_key_values
+            last_logits = outputs.logits[:, -1, :]
+
+        for i in range(batch_size):
+            if not finished[i]:
+                on_finish(i, "length")
+
+
+def _to_legacy(past_key_values):
+    '''新版 transformers 返回 Cache 对象，统一转换为每层 (key, value) 的元组'''
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return past_key_values.to_legacy_cache()
+    return tuple(past_key_values)
+
+
+def _from_legacy(kv):
+    try:
+        from transformers import DynamicCache
+    except ImportError:
+        return kv
+    if hasattr(DynamicCache, "from_legacy_cache"):
+        return DynamicCache.from_legacy_cache(kv)
+    return DynamicCache(kv)
+
+
+def quantize_int8(model):
+    '''
+    对 Transformer 主体中的 nn.Linear 做动态int8量化(原地替换)，lm_head 不量化
+    '''
+    torch.ao.quantization.quantize_dynamic(
+        model.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+    )
+    return model
+
+
+def compare_int8(model_id: str = MODEL_ID, prompts: Optional[List[str]] = None, max_new_tokens: int = 64) -> dict:
+    '''
+    实测 int8 相对 fp32 的速度与准确度(CPU)：
+    - 每token延迟：贪心解码 max_new_tokens 个token的平均耗时
+    - token一致率：int8 贪心输出与 fp32 逐位置相同的比例
+    - top1一致率：在同一输入(fp32 的输出序列)上，两者下一token预测相同的比例
+    '''
+    prompts = prompts or ["你好，请介绍一下中国电信.", "用三句话解释什么是ReAct智能体。", "把下面的句子翻译成英文：今天天气很好。"]
+    results = {}
+    outputs = {}
+    for int8 in (False, True):
+        model = LocalChatModel(model_id, device="cpu", int8=int8)
+        name = "int8" if int8 else "fp32"
+        total_tokens, total_time = 0, 0.0
+        outputs[name] = []
+        for prompt in prompts:
+            ids = model.encode_chat([{'role': 'user', 'content': prompt}])
+            tokens = []
+            start = time.perf_counter()
+            model.generate_batch(
+                prompts=[ids], max_new_tokens=[max_new_tokens], temperatures=[0.0],
+                on_token=lambda i, token_id: tokens.append(token_id) or True,
+                on_finish=lambda i, reason: None,
+            )
+            total_time += time.perf_counter() - start
+            total_tokens += len(tokens)
+            outputs[name].append((ids, tokens))
+        results[name] = {"load_seconds": model.load_seconds, "ms_per_token": 1000 * total_time / max(total_tokens, 1)}
+        if int8:
+            #在 fp32 的输出序列上做一次前向，比较两者每个位置的 top1 预测
+            agree, total = 0, 0
+            with torch.inference_mode():
+                for ids, tokens in outputs["fp32"]:
+                    if not tokens:
+                        continue
+                    full = torch.tensor([ids + tokens])
+                    predicted = model.model(full).logits[0, len(ids) - 1:-1].argmax(-1).tolist()
+                    agree += sum(p == t for p, t in zip(predicted, tokens))
+                    total += len(tokens)
+            results["int8"]["top1_agreement"] = agree / total if total else 0.0
+        del model
+
+    same, total = 0, 0
+    for (_, a), (_, b) in zip(outputs["fp32"], outputs["int8"]):
+        same += sum(x == y for x, y in zip(a, b))
+        total += max(len(a), len(b))
+    results["int8"]["token_match"] = same / total if total else 0.0
+    results["int8"]["speedup"] = results["fp32"]["ms_per_token"] / max(results["int8"]["ms_per_token"], 1e-9)
+    return results
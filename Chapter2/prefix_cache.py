@@ -0,0 +1,135 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+'''
+前缀 KV cache
+所有对话都以相同的 system 提示开头，智能体的提示模板(REACT_PROMPT_TEMPLATE、EXECUTOR_PROMPT_TEMPLATE 等)
+也共享上千个token的固定前缀。CPU 上的主要开销是预填充(prefill)，同样的前缀每次都要重算一遍。
+
+这里保存每条提示预填充后的 past_key_values，并用一棵以 token id 为边的字典树(trie)索引：
+- 查询时沿新提示在树上走到分叉点，深度 d 就是与某条已缓存提示的最长公共前缀；
+  因为注意力是因果的，那条提示 KV 的前 d 个位置正好就是这段公共前缀的 KV，切片即可复用
+- 条目按字节数做 LRU 淘汰，淘汰时顺带删除不再被任何条目经过的树节点
+KV 以 legacy 格式保存：每层一个 (key, value)，形状为 (1, num_heads, seq_len, head_dim)
+'''
+
+LegacyKV = Tuple[Tuple["torch.Tensor", "torch.Tensor"], ...]
+
+
+class _TrieNode:
+    __slots__ = ("children", "entries")
+
+    def __init__(self):
+        self.children: Dict[int, "_TrieNode"] = {}
+        self.entries: Set[int] = set()  #路径经过该节点的条目id
+
+
+def kv_nbytes(kv: LegacyKV) -> int:
+    return sum(k.numel() * k.element_size() + v.numel() * v.element_size() for k, v in kv)
+
+
+def slice_kv(kv: LegacyKV, length: int) -> LegacyKV:
+    '''取前 length 个位置的KV(视图，不复制)'''
+    return tuple((k[:, :, :length], v[:, :, :length]) for k, v in kv)
+
+
+class PrefixKVCache:
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, min_prefix: int = 16):
+        '''
+        参数：
+        - max_bytes (int): 所有缓存KV的总字节上限
+        - min_prefix (int): 公共前缀短于该长度时不复用(收益小于切片与拼接的开销)
+        '''
+        self.max_bytes = max_bytes
+        self.min_prefix = min_prefix
+        self.root = _TrieNode()
+        self._entries: "OrderedDict[int, Tuple[List[int], LegacyKV, int]]" = OrderedDict()
+        self._bytes = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+        self.prompt_tokens = 0
+
+    def lookup(self, token_ids: List[int]) -> Tuple[int, Optional[LegacyKV]]:
+        '''
+        返回 (可复用的前缀长度, 该前缀的KV)；未命中时返回 (0, None)
+        至少留最后一个token不复用，因为需要对它做一次前向才能得到下一个token的logits
+        '''
+        with self._lock:
+            self.prompt_tokens += len(token_ids)
+            node, depth, entry_id = self.root, 0, None
+            for token_id in token_ids[:-1]:
+                child = node.children.get(token_id)
+                if child is None or not child.entries:
+                    break
+                node, depth = child, depth + 1
+                entry_id = next(iter(child.entries))
+
+            if entry_id is None or depth < self.min_prefix:
+                self.misses += 1
+                return 0, None
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            self.reused_tokens += depth
+            return depth, slice_kv(self._entries[entry_id][1], depth)
+
+    def insert(self, token_ids: List[int], kv: LegacyKV):
+        '''
+        缓存一条提示的完整KV；已有条目完整覆盖这条提示时只刷新LRU顺序
+        '''
+        size = kv_nbytes(kv)
+        if size > self.max_bytes or len(token_ids) < self.min_prefix:
+            return
+        with self._lock:
+            node = self.root
+            for token_id in token_ids:
+                node = node.children.get(token_id)
+                if node is None:
+                    break
+            if node is not None and node.entries:
+                self._entries.move_to_end(next(iter(node.entries)))
+                return
+
+            while self._entries and self._bytes + size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+            entry_id = self._next_id
+            self._next_id += 1
+            node = self.root
+            for token_id in token_ids:
+                node = node.children.setdefault(token_id, _TrieNode())
+                node.entries.add(entry_id)
+            self._entries[entry_id] = (list(token_ids), kv, size)
+            self._bytes += size
+
+    def _remove(self, entry_id: int):
+        token_ids, _, size = self._entries.pop(entry_id)
+        self._bytes -= size
+        node = self.root
+        for token_id in token_ids:
+            child = node.children[token_id]
+            child.entries.discard(entry_id)
+            if not child.entries:
+                del node.children[token_id] #该子树只属于被淘汰的条目，整棵剪掉
+                break
+            node = child
+
+    def clear(self):
+        with self._lock:
+            self.root = _TrieNode()
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "reused_token_ratio": self.reused_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+        }
@@ -0,0 +1,322 @@
+import json
+import time
+import uuid
+import queue
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+from local_model import LocalChatModel, MODEL_ID
+from prefix_cache import PrefixKVCache
+
+'''
+OpenAI 兼容的本地推理服务
+模型只加载一次并常驻内存，对外提供 /v1/chat/completions(流式与非流式)和 /v1/models。
+并发到达的请求先进入队列，DynamicBatcher 在一个很短的等待窗口内把它们凑成一个批次，
+一次前向同时为整批生成下一个token，CPU 上的吞吐随批大小近似线性增长。
+
+用法：
+    python server.py --port 8000
+    然后把任意智能体的 LLM_BASE_URL 设为 http://127.0.0.1:8000/v1 即可离线运行
+    python server.py --bench  # 测量批大小 1~32 下的生成吞吐(tokens/s)
+'''
+
+
+class GenerationRequest:
+    '''
+    一条排队中的生成请求
+    解码线程通过 push_token/finish 写入，HTTP 线程从 events 队列读取增量文本
+    '''
+    def __init__(self, prompt_ids: List[int], max_tokens: int, temperature: float, stop: List[str]):
+        self.id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        self.created = int(time.time())
+        self.prompt_ids = prompt_ids
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.stop = stop
+        self.token_ids: List[int] = []
+        self.text = ""        #已解码的完整文本
+        self.emitted = 0      #已经发给客户端的字符数
+        self.finish_reason: Optional[str] = None
+        self.cancelled = False
+        self.events: queue.Queue = queue.Queue()
+
+    def push_token(self, decode, token_id: int) -> bool:
+        '''
+        追加一个token；返回 False 表示该序列应当停止(命中stop序列或客户端已断开)
+        '''
+        if self.cancelled:
+            return False
+        self.token_ids.append(token_id)
+        text = decode(self.token_ids)
+        if text.endswith("�"):
+            return True #多字节字符还没解码完整，等下一个token
+        self.text = text
+
+        for s in self.stop:
+            index = self.text.find(s)
+            if index != -1:
+                self.text = self.text[:index]
+                self._emit(len(self.text))
+                return False
+
+        #保留可能是stop序列开头的尾部字符，避免把stop序列的一部分流式发出去
+        hold = max((len(s) - 1 for s in self.stop), default=0)
+        self._emit(len(self.text) - hold)
+        return True
+
+    def _emit(self, upto: int):
+        if upto > self.emitted:
+            self.events.put(("delta", self.text[self.emitted:upto]))
+            self.emitted = upto
+
+    def finish(self, reason: str):
+        self._emit(len(self.text))
+        self.finish_reason = reason
+        self.events.put(("finish", reason))
+
+    def fail(self, error: Exception):
+        self.finish_reason = "error"
+        self.events.put(("error", str(error)))
+
+    def usage(self) -> dict:
+        return {
+            "prompt_tokens": len(self.prompt_ids),
+            "completion_tokens": len(self.token_ids),
+            "total_tokens": len(self.prompt_ids) + len(self.token_ids),
+        }
+
+
+class DynamicBatcher:
+    '''
+    动态批处理：第一条请求到达后最多再等 max_wait 秒，把期间到达的请求(不超过 max_batch_size 条)合成一个批次
+    '''
+    def __init__(self, model: LocalChatModel, max_batch_size: int = 16, max_wait: float = 0.01):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.pending: queue.Queue = queue.Queue()
+        self.batches = 0
+        self.batched_requests = 0
+        self._thread = threading.Thread(target=self._loop, name="batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, request: GenerationRequest):
+        self.pending.put(request)
+
+    def _collect(self) -> List[GenerationRequest]:
+        batch = [self.pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return [r for r in batch if not r.cancelled]
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                continue
+            self.batches += 1
+            self.batched_requests += len(batch)
+            try:
+                self.model.generate_batch(
+                    prompts=[r.prompt_ids for r in batch],
+                    max_new_tokens=[r.max_tokens for r in batch],
+                    temperatures=[r.temperature for r in batch],
+                    on_token=lambda i, token_id: batch[i].push_token(self.model.decode, token_id),
+                    on_finish=lambda i, reason: batch[i].finish(reason),
+                )
+            except Exception as e:
+                print(f"❌ 批量生成失败: {e}")
+                for r in batch:
+                    if r.finish_reason is None:
+                        r.fail(e)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.pending.qsize(),
+            "batches": self.batches,
+            "avg_batch_size": self.batched_requests / self.batches if self.batches else 0.0,
+        }
+
+
+class ChatCompletionsHandler(BaseHTTPRequestHandler):
+    '''
+    实现 OpenAI chat.completions 协议中智能体会用到的部分
+    '''
+    model: LocalChatModel = None
+    batcher: DynamicBatcher = None
+    default_max_tokens = 512
+
+    def log_message(self, format, *args):
+        pass #每个请求都打印访问日志会拖慢高并发压测
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/v1/models":
+            self._send_json(200, {"object": "list", "data": [{"id": self.model.model_id, "object": "model", "owned_by": "local"}]})
+        elif self.path.rstrip("/") == "/stats":
+            stats = self.batcher.stats()
+            if self.model.prefix_cache is not None:
+                stats["prefix_cache"] = self.model.prefix_cache.stats()
+            self._send_json(200, stats)
+        else:
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            stop = body.get("stop") or []
+            request = GenerationRequest(
+                prompt_ids=self.model.encode_chat(body["messages"]),
+                max_tokens=body.get("max_tokens") or self.default_max_tokens,
+                temperature=float(body.get("temperature") or 0.0),
+                stop=[stop] if isinstance(stop, str) else list(stop),
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            self._send_json(400, {"error": {"message": f"invalid request: {e}"}})
+            return
+
+        self.batcher.submit(request)
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+            self._stream(request, include_usage)
+        else:
+            self._complete(request)
+
+    def _complete(self, request: GenerationRequest):
+        while True:
+            kind, value = request.events.get()
+            if kind == "error":
+                self._send_json(500, {"error": {"message": value}})
+                return
+            if kind == "finish":
+                break
+        self._send_json(200, {
+            "id": request.id,
+            "object": "chat.completion",
+            "created": request.created,
+            "model": self.model.model_id,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": request.text},
+                "finish_reason": request.finish_reason,
+            }],
+            "usage": request.usage(),
+        })
+
+    def _chunk(self, request: GenerationRequest, delta: dict, finish_reason: Optional[str] = None, usage: Optional[dict] = None) -> dict:
+        return {
+            "id": request.id,
+            "object": "chat.completion.chunk",
+            "created": request.created,
+            "model": self.model.model_id,
+            "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            "usage": usage,
+        }
+
+    def _write_event(self, payload):
+        data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+        self.wfile.write(f"data: {data}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _stream(self, request: GenerationRequest, include_usage: bool):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            self._write_event(self._chunk(request, {"role": "assistant", "content": ""}))
+            while True:
+                kind, value = request.events.get()
+                if kind == "delta":
+                    self._write_event(self._chunk(request, {"content": value}))
+                elif kind == "finish":
+                    self._write_event(self._chunk(request, {}, finish_reason=value))
+                    break
+                else:
+                    self._write_event({"error": {"message": value}})
+                    break
+            if include_usage:
+                self._write_event(self._chunk(request, {}, usage=request.usage()))
+            self._write_event("[DONE]")
+        except (BrokenPipeError, ConnectionResetError):
+            #客户端提前断开(例如 ReAct 读到 Action 行就停止)，让解码循环尽快释放这个槽位
+            request.cancelled = True
+
+
+def run_benchmark(model: LocalChatModel, batch_sizes: List[int], max_new_tokens: int = 64):
+    '''
+    固定提示，测量不同批大小下的生成吞吐(按实际生成的token数计算)
+    '''
+    prompt = model.encode_chat([
+        {'role': 'system', 'content': 'you are a helpful assistant.'},
+        {'role': 'user', 'content': '你好，请介绍一下中国电信.'},
+    ])
+    print(f"{'batch':>6} {'tokens':>8} {'seconds':>9} {'tokens/s':>10}")
+    for batch_size in batch_sizes:
+        produced = [0]
+
+        def on_token(i, token_id):
+            produced[0] += 1
+            return True
+
+        start = time.perf_counter()
+        model.generate_batch(
+            prompts=[prompt] * batch_size,
+            max_new_tokens=[max_new_tokens] * batch_size,
+            temperatures=[0.0] * batch_size,
+            on_token=on_token,
+            on_finish=lambda i, reason: None,
+        )
+        elapsed = time.perf_counter() - start
+        print(f"{batch_size:>6} {produced[0]:>8} {elapsed:>9.2f} {produced[0] / elapsed:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI兼容的本地推理服务")
+    parser.add_argument("--model", default=MODEL_ID)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=10.0)
+    parser.add_argument("--int8", action="store_true", help="线性层动态int8量化(仅CPU)")
+    parser.add_argument("--prefix-cache-mb", type=int, default=512, help="前缀KV缓存上限(MB)，0表示关闭")
+    parser.add_argument("--bench", action="store_true", help="只测量批大小 1~32 的吞吐，不启动服务")
+    args = parser.parse_args()
+
+    prefix_cache = PrefixKVCache(max_bytes=args.prefix_cache_mb * 1024 * 1024) if args.prefix_cache_mb > 0 else None
+    model = LocalChatModel(args.model, int8=args.int8, prefix_cache=None if args.bench else prefix_cache)
+    if args.bench:
+        run_benchmark(model, [1, 2, 4, 8, 16, 32])
+        return
+
+    ChatCompletionsHandler.model = model
+    ChatCompletionsHandler.batcher = DynamicBatcher(model, args.max_batch_size, args.max_wait_ms / 1000)
+    server = ThreadingHTTPServer((args.host, args.port), ChatCompletionsHandler)
+    print(f"本地推理服务已启动: http://{args.host}:{args.port}/v1 (model={args.model})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
 import os
 import re
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from llm_call import AgentLLM
-from typing import List
+from llm_metrics import attribution
+from typing import List, Dict, Any, Set
 
 EXECUTOR_PROMPT_TEMPLATE = """
 # Role
@@ -12,7 +15,7 @@ EXECUTOR_PROMPT_TEMPLATE = """
 === 原始问题 ===
 {question}
 
-=== 完整计划 ===
+=== 相关计划步骤(当前步骤及其依赖) ===
 {plan}
 
 === 已完成的历史步骤与结果 (Reference) ===
@@ -33,39 +36,145 @@ EXECUTOR_PROMPT_TEMPLATE = """
 请在此处直接输出【当前步骤】的执行结果：
 """
 
+#步骤描述里对其它步骤的引用："第2步"、"步骤3"、"step 1"、"上一步"、"前两步"
+_NUMERALS = {"一":1,"二":2,"两":2,"三":3,"四":4,"五":5,"六":6,"七":7,"八":8,"九":9,"十":10}
+#只认"第N步"、"步骤N"、"step N"，"第2次考试"、"第一名"之类的序数不算引用
+_STEP_REF = re.compile(r"第\s*([0-9一二两三四五六七八九十]+)\s*步|步骤\s*([0-9一二两三四五六七八九十]+)|(?<![A-Za-z])step\s*(\d+)",re.IGNORECASE)
+_FIRST_N_REF = re.compile(r"前\s*([0-9一二两三四五六七八九十]+)\s*(?:个)?步")
+_PREVIOUS_REF = re.compile(r"上一步|前一步")
+_SPACES = re.compile(r"\s+")
+
+
+def _to_int(text:str)->int:
+    return int(text) if text.isdigit() else _NUMERALS.get(text,0)
+
+
+def find_references(step:Dict[str,Any],plan:List[Dict[str,Any]])->Set[int]:
+    '''
+    从步骤描述中检测对其它步骤的引用，只保留计划中排在它之前的步骤(不会引入环)
+    '''
+    position = next(i for i,s in enumerate(plan) if s["id"] == step["id"])
+    earlier = [s["id"] for s in plan[:position]]
+    text = step["step"]
+    refs = {_to_int(next(g for g in groups if g)) for groups in _STEP_REF.findall(text)}
+    for m in _FIRST_N_REF.findall(text):
+        refs.update(earlier[:_to_int(m)])
+    if earlier and _PREVIOUS_REF.search(text):
+        refs.add(earlier[-1])
+    return refs & set(earlier)
+
+
+def digest(text:str,width:int = 60)->str:
+    '''一行摘要：去掉多余空白后截断'''
+    text = _SPACES.sub(" ",str(text)).strip()
+    return text if len(text) <= width else text[:width] + "…"
+
+
 class Executor:
-    def __init__(self,llm_client:AgentLLM):
+    def __init__(self,llm_client:AgentLLM,max_workers:int = 4,scoped_context:bool = True,digest_chars:int = 60,
+                 max_digests:int = 5):
+        '''
+        参数：
+        - llm_client (AgentLLM): 用于与LLM交互的客户端实例
+        - max_workers (int, 可选): 同时执行的步骤数上限，默认为4
+        - scoped_context (bool, 可选): 每一步只带上它引用的步骤(声明的 depends_on 或描述中检测到的引用)的完整结果，
+          更早的间接依赖压缩为一行摘要，无关步骤不再进入提示；为 False 时带上全部历史
+        - digest_chars (int, 可选): 摘要的最大字符数
+        - max_digests (int, 可选): 最多保留的间接依赖摘要条数(取计划中最靠后的几条)，保证长链计划每一步的上下文有上界
+        '''
         self.llm_client = llm_client
-        self.history = [] #记录已完成的历史步骤与结果
+        self.max_workers = max_workers
+        self.scoped_context = scoped_context
+        self.digest_chars = digest_chars
+        self.max_digests = max_digests
+        self.history = [] #记录已完成的历史步骤与结果(按完成顺序)
+        self.results: Dict[int,str] = {} #步骤id -> 执行结果
 
-    def execute(self,query:str,plan:list[str])->str:
+    def _context(self,plan:List[Dict[str,Any]],step:Dict[str,Any],deps:Dict[int,Set[int]]):
         '''
-        根据计划与问题，逐步执行并解决问题
+        当前步骤的上下文，返回 (计划视图, 历史结果列表)：
+        - 计划视图只列出当前步骤和它的(直接与保留的间接)依赖，不再是整份计划
+        - 直接依赖给完整结果，间接依赖给摘要，按计划顺序排列
+        每一步的上下文只与依赖的数量有关，不随计划长度增长
         '''
-        print("\n---正在执行计划---")
+        if not self.scoped_context:
+            return [s["step"] for s in plan], list(self.history)
+        direct = deps[step["id"]]
+        ancestors,frontier = set(),list(direct)
+        while frontier:
+            for parent in deps[frontier.pop()]:
+                if parent not in ancestors and parent not in direct:
+                    ancestors.add(parent)
+                    frontier.append(parent)
+        order = [s["id"] for s in plan]
+        ancestors = set(sorted(ancestors,key=order.index)[-self.max_digests:] if self.max_digests else [])
+        plan_view,context = [],[]
+        for s in plan:
+            if s["id"] in direct:
+                context.append(f"第{s['id']}步: {s['step']}\n结果: {self.results[s['id']]}")
+            elif s["id"] in ancestors:
+                context.append(f"第{s['id']}步: {s['step']}\n摘要: {digest(self.results[s['id']],self.digest_chars)}")
+            else:
+                if s["id"] != step["id"]:
+                    continue
+            plan_view.append(s["step"])
+        return plan_view,context
 
-        final_answer = ""
+    def _run_step(self,query:str,step:Dict[str,Any],plan_view:List[str],context:List[str])->str:
+        #构建prompt
+        prompt = EXECUTOR_PROMPT_TEMPLATE.format(
+            question=query,
+            plan=plan_view,
+            history="\n".join(context) if context else "无历史上下文",
+            current_step=step["step"],
+        )
 
-        for i,step in enumerate(plan): #按序取出
-            print(f"正在执行第{i+1}步: {step}，总步数为{len(plan)}")
+        message = [
+            {"role":"user","content":prompt}
+        ]
+        with attribution(agent="PlanAndSolveAgent",step=f"execute-{step['id']}"):
+            return self.llm_client.think(messages=message)
 
-            #构建prompt
-            prompt = EXECUTOR_PROMPT_TEMPLATE.format(
-                question=query,
-                plan=plan,
-                history="\n".join(self.history) if self.history else "无历史上下文",
-                current_step=step,
-            )
+    def execute(self,query:str,plan:List[Dict[str,Any]])->str:
+        '''
+        根据计划依赖图与问题执行并解决问题
+        依赖都已完成的步骤(就绪步骤)会被同时提交到有界线程池，
+        互不依赖的步骤并行执行，总耗时取决于关键路径而不是步骤数之和
+        '''
+        print("\n---正在执行计划---")
+        #每次执行都是新的计划，上一次的结果按步骤id残留会让依赖被误判为已完成
+        self.history = []
+        self.results = {}
 
-            message = [
-                {"role":"user","content":prompt}
-            ]
-            response = self.llm_client.think(messages=message)
-            final_answer = response
-            self.history.append(f"第{i+1}步: {step}\n结果: {response}")
+        steps = {step["id"]:step for step in plan}
+        #实际依赖 = 声明的 depends_on ∪ 描述中引用的步骤
+        deps = {step["id"]:set(step["depends_on"]) | find_references(step,plan) for step in plan}
+        pending = dict(steps) #尚未提交的步骤
+        running = {}          #future -> 步骤
+        with ThreadPoolExecutor(max_workers=self.max_workers,thread_name_prefix="pas-step") as pool:
+            while pending or running:
+                #提交所有依赖已完成的步骤
+                for step_id,step in list(pending.items()):
+                    if all(d in self.results for d in deps[step_id]):
+                        del pending[step_id]
+                        print(f"正在执行第{step_id}步: {step['step']}，总步数为{len(plan)}")
+                        #每个线程复制一份当前上下文，attribution 标签才能带到线程里
+                        plan_view,context = self._context(plan,step,deps)
+                        future = pool.submit(contextvars.copy_context().run,self._run_step,
+                                             query,step,plan_view,context)
+                        running[future] = step
+                if not running:
+                    break #依赖无法满足(normalize_plan 已保证无环，这里只是防御)
 
-            print(f"✅ 步骤 {i+1} 已完成，结果: {response}")
-        #循环结束后，最后一步的响应就为最终答案
-        return self.history[-1]
+                #等待任意一个步骤完成，再看有没有新的就绪步骤
+                done,_ = wait(running,return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    response = future.result()
+                    self.results[step["id"]] = response
+                    self.history.append(f"第{step['id']}步: {step['step']}\n结果: {response}")
+                    print(f"✅ 步骤 {step['id']} 已完成，结果: {response}")
 
-        
+        #计划的最后一步汇总了最终答案
+        last = plan[-1]
+        return f"第{last['id']}步: {last['step']}\n结果: {self.results.get(last['id'])}"
@@ -0,0 +1,159 @@
+'''
+尾延迟控制：对冲请求(hedged request) + 带抖动的指数退避重试
+一次 ReAct / Plan-and-Solve 会串行调用 5~10 次 LLM，单次调用的 p99 会被逐级放大。
+- 对冲：请求发出后若在阈值(观测到的 p95 首token延迟)内仍没有首个token，就再发一个相同请求，
+  谁先开始输出就用谁，另一个立即取消。
+- 重试：可重试的错误(连接错误、超时、429、5xx)按 full jitter 指数退避重试，
+  并且所有重试共享同一个截止时间(deadline)，每次请求的超时都不超过剩余时间。
+'''
+import time
+import random
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Optional, Tuple, Any
+
+import openai
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    '''对冲请求使用的共享线程池(延迟创建)'''
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+        return _executor
+
+
+class RetryPolicy:
+    '''
+    重试策略
+    参数：
+    - max_retries (int): 最多重试次数(不含第一次)
+    - base_delay / max_delay (float): 退避时间的基数与上限，第n次重试等待 uniform(0, min(max_delay, base_delay * 2**n))
+    - deadline (float, 可选): 一次调用(含所有重试)的总时间预算(秒)，None 表示只受单次超时限制
+    '''
+    def __init__(self, max_retries: int = 2, base_delay: float = 0.5, max_delay: float = 8.0,
+                 deadline: Optional[float] = None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    @staticmethod
+    def retryable(error: Exception) -> bool:
+        '''
+        只有暂时性错误才重试：连接中断、超时、408/409/429、5xx
+        其余4xx说明请求本身有问题；TypeError、KeyError 之类的程序错误更不能重试，否则真正的报错会被退避重试掩盖到截止时间
+        '''
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code in (408, 409, 429) or error.status_code >= 500
+        return isinstance(error, (openai.APIConnectionError, openai.APITimeoutError,
+                                  TimeoutError, asyncio.TimeoutError))
+
+
+def adaptive_hedge_delay(metrics, model: str, quantile: str = "p95", min_samples: int = 20,
+                         default: float = 2.0, floor: float = 0.05) -> float:
+    '''
+    对冲阈值：取该模型历史首token延迟的 p95；样本不足时使用默认值
+    '''
+    histogram = metrics.histogram("ttft", wrapper="AgentLLM", model=model)
+    if histogram.get("count", 0) < min_samples:
+        return default
+    return max(floor, histogram[quantile])
+
+
+def _close_quietly(response: Any):
+    try:
+        response.close()
+    except Exception:
+        pass
+
+
+def _close_late(future):
+    '''落后的请求如果之后才返回，拿到连接后立即关闭'''
+    if future.cancelled() or future.exception() is not None:
+        return
+    _close_quietly(future.result()[0])
+
+
+def hedged_open(open_fn: Callable[[list], Any], hedge_delay: Optional[float]) -> Tuple[Any, bool]:
+    '''
+    同步对冲
+    open_fn(holder) 负责发起请求并阻塞到首个token到达，返回值的第一个元素是响应对象；
+    响应对象创建后需立即放入 holder，以便在对冲失败时被提前关闭
+    返回 (open_fn 的返回值, 是否发出了对冲请求)
+    hedge_delay 为 None 时不对冲，直接在当前线程执行
+    '''
+    if hedge_delay is None:
+        return open_fn([]), False
+
+    executor = _get_executor()
+    holders = {}
+
+    def submit():
+        holder = []
+        future = executor.submit(open_fn, holder)
+        holders[future] = holder
+        return future
+
+    primary = submit()
+    done, _ = wait([primary], timeout=hedge_delay)
+    if done:
+        return primary.result(), False
+
+    print(f"首token超过{hedge_delay:.2f}s未到达，发出对冲请求")
+    pending = {primary, submit()}
+    first_error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is not None:
+                first_error = first_error or future.exception()
+                continue
+            # 取消落后的请求：已建立的连接立即关闭，尚未返回的在返回后关闭
+            for loser in pending:
+                loser.cancel()
+                for response in holders[loser]:
+                    _close_quietly(response)
+                loser.add_done_callback(_close_late)
+            return future.result(), True
+    raise first_error
+
+
+async def ahedged_open(open_fn: Callable[[], Any], hedge_delay: Optional[float]) -> Tuple[Any, bool]:
+    '''
+    异步对冲：open_fn() 是协程函数，落后的任务直接 cancel()
+    '''
+    if hedge_delay is None:
+        return await open_fn(), False
+
+    primary = asyncio.ensure_future(open_fn())
+    done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+    if done:
+        return primary.result(), False
+
+    print(f"首token超过{hedge_delay:.2f}s未到达，发出对冲请求")
+    pending = {primary, asyncio.ensure_future(open_fn())}
+    first_error = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is not None:
+                first_error = first_error or task.exception()
+                continue
+            for loser in pending:
+                loser.cancel()
+            return task.result(), True
+    raise first_error
+
+
+def remaining(deadline_at: Optional[float]) -> Optional[float]:
+    '''距离截止时间还剩多少秒，没有截止时间时返回 None'''
+    return None if deadline_at is None else deadline_at - time.monotonic()
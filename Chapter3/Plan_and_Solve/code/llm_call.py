@@ -1,7 +1,13 @@
 import os
-from openai import OpenAI
+import time
+import asyncio
+import itertools
 from dotenv import load_dotenv
-from typing import List,Dict
+from typing import List,Dict,Iterator,Optional
+from client_pool import get_openai_client,get_async_openai_client,get_limiter,warm_up,pool_stats
+from response_cache import ResponseCache
+from llm_metrics import CallTimer,registry as metrics_registry
+from hedging import RetryPolicy,adaptive_hedge_delay,hedged_open,ahedged_open,remaining
 
 #加载.env文件中的环境变量
 load_dotenv(override=True)
@@ -15,7 +21,7 @@ class AgentLLM:
     封装LLM交互逻辑
     它用于调用任何兼容OpenAI接口的服务
     '''
-    def __init__(self,model:str=None,apiKey:str=None,baseurl:str=None,timeout:int=None):
+    def __init__(self,model:str=None,apiKey:str=None,baseurl:str=None,timeout:int=None,warmup:bool=False,max_concurrency:int=None,cache:ResponseCache=None,retry_policy:RetryPolicy=None,hedge:bool=None):
         self.model = model or os.getenv("LLM_MODEL_ID")
         apiKey = apiKey or os.getenv("LLM_API_KEY")
         baseurl = baseurl or os.getenv("LLM_BASE_URL")
@@ -24,21 +30,144 @@ class AgentLLM:
         if not all([self.model,apiKey,baseurl]): #检查列表中是否有None或空值
             raise ValueError("缺少必要的LLM配置信息，请检查环境变量设置")
         
-        self.client = OpenAI(api_key=apiKey,base_url=baseurl,timeout=timeout)
+        #从进程级注册表获取共享客户端，相同配置的AgentLLM复用同一个连接池
+        self.client = get_openai_client(api_key=apiKey,base_url=baseurl,timeout=timeout)
+        self.timeout = timeout
+        #异步客户端在athink第一次调用时(事件循环内)再获取
+        self._client_config = {"api_key":apiKey,"base_url":baseurl,"timeout":timeout}
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY",16))
+        self._limiter = None
+        #响应缓存默认关闭：显式传入cache，或设置环境变量LLM_CACHE_PATH时开启
+        cache_path = os.getenv("LLM_CACHE_PATH")
+        self.cache = cache or (ResponseCache(cache_path) if cache_path else None)
+        #流式响应最后附带一个usage块(prompt/completion token数)，个别兼容接口不支持时可通过环境变量关闭
+        self.include_usage = os.getenv("LLM_STREAM_USAGE","true").lower() == "true"
+        self.metrics = metrics_registry
+        #尾延迟控制：可重试错误按带抖动的指数退避重试；开启对冲后首token过慢时会补发一个请求
+        self.retry_policy = retry_policy or RetryPolicy(max_retries=int(os.getenv("LLM_MAX_RETRIES",2)))
+        self.hedge = hedge if hedge is not None else os.getenv("LLM_HEDGE","false").lower() == "true"
+        if warmup:
+            warm_up([self.client])
 
-    def think(self,messages:List[Dict[str,str]],temperature:float=0):
+    def _request_params(self,messages:List[Dict[str,str]],temperature:float,stop:Optional[List[str]]=None,max_tokens:Optional[int]=None)->dict:
+        '''
+        组装请求参数
+        stop: 停止序列，模型生成到这些字符串时由服务端直接结束(最多4个)，不必再在客户端截断
+        max_tokens: 本次调用最多生成的token数
+        '''
+        params = {"model":self.model,"messages":messages,"temperature":temperature}
+        if stop:
+            params["stop"] = list(stop)[:4]
+        if max_tokens:
+            params["max_tokens"] = max_tokens
+        return params
+
+    def _stream_options(self)->dict:
+        return {"stream_options":{"include_usage":True}} if self.include_usage else {}
+
+    def _cache_key(self,params:dict):
+        '''
+        缓存键：只有开启缓存时才计算，stop和max_tokens不同的请求结果不同，也一并参与哈希；
+        服务地址不同的请求即使模型名相同也不共享缓存
+        '''
+        if self.cache is None:
+            return None
+        return ResponseCache.make_key(self._client_config["base_url"],**params)
+
+    def _deadline_at(self,deadline:Optional[float])->Optional[float]:
+        deadline = deadline if deadline is not None else self.retry_policy.deadline
+        return time.monotonic() + deadline if deadline else None
+
+    def _attempt_timeout(self,deadline_at:Optional[float])->float:
+        '''
+        截止时间向下传递：每次请求的超时不超过剩余时间
+        '''
+        left = remaining(deadline_at)
+        if left is None:
+            return self.timeout
+        if left <= 0:
+            raise TimeoutError("已超过本次调用的截止时间")
+        return min(self.timeout,left)
+
+    def _backoff_delay(self,error:Exception,timer:CallTimer,deadline_at:Optional[float]):
+        '''
+        判断是否还能重试：返回需要等待的秒数，不能重试时返回None
+        '''
+        policy = self.retry_policy
+        if timer.retries >= policy.max_retries or not policy.retryable(error):
+            return None
+        delay = policy.backoff(timer.retries)
+        left = remaining(deadline_at)
+        if left is not None and left <= delay:
+            return None
+        timer.retries += 1
+        timer.restart()
+        print(f"调用LLM模型出错({error})，{delay:.2f}s后进行第{timer.retries}次重试")
+        return delay
+
+    def _hedge_delay(self)->Optional[float]:
+        return adaptive_hedge_delay(self.metrics,self.model) if self.hedge else None
+
+    def _open_stream(self,params:dict,timeout:float,holder:list):
+        '''
+        发起一次流式请求并阻塞读到第一个内容块，返回(response, 已读取的块, 剩余块的迭代器)
+        '''
+        client = self.client.with_options(timeout=timeout,max_retries=0) #重试由本类统一控制
+        response = client.chat.completions.create(
+            **params,
+            **self._stream_options(),
+            stream=True,#流式响应，有输出就返回一个块
+        )
+        holder.append(response)
+        chunks = iter(response)
+        buffered = []
+        for chunk in chunks:
+            buffered.append(chunk)
+            if chunk.choices and chunk.choices[0].delta.content:
+                break
+        return response,buffered,chunks
+
+    def _connect(self,params:dict,timer:CallTimer,deadline_at:Optional[float]):
+        '''
+        建立流式连接(可选对冲)，连接失败时按策略退避重试，返回(response, 块迭代器)
+        '''
+        while True:
+            try:
+                timeout = self._attempt_timeout(deadline_at)
+                (response,buffered,chunks),hedged = hedged_open(
+                    lambda holder: self._open_stream(params,timeout,holder),
+                    self._hedge_delay(),
+                )
+                timer.hedged = timer.hedged or hedged
+                return response,itertools.chain(buffered,chunks)
+            except Exception as e:
+                delay = self._backoff_delay(e,timer,deadline_at)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    def think(self,messages:List[Dict[str,str]],temperature:float=0,use_cache:bool=True,stop:Optional[List[str]]=None,max_tokens:Optional[int]=None,deadline:Optional[float]=None):
         '''
         调用大语言模型并进行思考，返回响应
+        use_cache=False 时跳过缓存(既不读也不写)
+        deadline: 本次调用(含重试)的总时间预算(秒)，默认使用retry_policy.deadline
+        可重试的错误会按退避策略重试，重试用尽或遇到不可重试的错误时返回None
         '''
+        params = self._request_params(messages,temperature,stop,max_tokens)
+        cache_key = self._cache_key(params) if use_cache else None
+        timer = CallTimer(wrapper="AgentLLM",model=self.model)
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print(f"命中响应缓存，跳过{self.model}模型调用")
+                timer.finish(cached=True)
+                return cached
+
         print(f"正在调用{self.model}模型...")
+        deadline_at = self._deadline_at(deadline)
 
+        usage = None
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature,
-                stream=True,#流式响应，有输出就返回一个块
-            )   
             '''
             流式响应输出示例：
             Chunk(
@@ -57,25 +186,197 @@ class AgentLLM:
                 }]
             )
             '''
-            #处理流失响应
-            print("LLM响应:")
-            collected_content = []
-            for chunk in response:
-                content = None
+            while True:
+                response,chunks = self._connect(params,timer,deadline_at)
+                #处理流失响应
+                print("LLM响应:")
+                collected_content = []
+                usage = None
+                try:
+                    for chunk in chunks:
+                        content = None
+                        if chunk.choices and len(chunk.choices) > 0:
+                            delta = chunk.choices[0].delta
+                            if hasattr(delta, 'content') and delta.content:
+                                content = delta.content
+                        if getattr(chunk, 'usage', None):
+                            usage = chunk.usage #include_usage开启时，最后一个块choices为空，只携带usage
+                        if content:
+                            #print(content,end="",flush=True)
+                            timer.on_token()
+                            collected_content.append(content)
+                        left = remaining(deadline_at)
+                        if left is not None and left <= 0:
+                            raise TimeoutError("读取流式响应时超过截止时间")
+                    break
+                except Exception as e:
+                    #读到一半断开：丢弃已收到的部分，整体重试
+                    response.close()
+                    delay = self._backoff_delay(e,timer,deadline_at)
+                    if delay is None:
+                        raise
+                    time.sleep(delay)
+            print() #流式输出结束后换行
+
+            result = "".join(collected_content)#最后把列表所有打印合并为整个输出
+            timer.finish(usage=usage)
+            if cache_key:
+                self.cache.set(cache_key,result)
+            return result
+            
+        except Exception as e:
+            print(f"调用LLM模型时出错: {e}")
+            timer.finish(usage=usage,error=e)
+            return None
+
+    def think_stream(self,messages:List[Dict[str,str]],temperature:float=0,use_cache:bool=True,stop:Optional[List[str]]=None,max_tokens:Optional[int]=None,deadline:Optional[float]=None)->Iterator[str]:
+        '''
+        流式版本的think：每收到一个文本块就立刻yield出去，调用方可以边收边解析
+        调用方提前停止迭代(break 或 close())时会关闭底层HTTP流，服务端随之停止生成
+        只有完整读完的响应才会写入缓存
+        重试与对冲只作用于首个token到达之前，已经输出的内容无法撤回
+        '''
+        params = self._request_params(messages,temperature,stop,max_tokens)
+        cache_key = self._cache_key(params) if use_cache else None
+        timer = CallTimer(wrapper="AgentLLM",model=self.model)
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                timer.finish(cached=True)
+                yield cached
+                return
+
+        print(f"正在调用{self.model}模型(流式)...")
+        deadline_at = self._deadline_at(deadline)
+        try:
+            response,chunks = self._connect(params,timer,deadline_at)
+        except Exception as e:
+            print(f"调用LLM模型时出错: {e}")
+            timer.finish(error=e)
+            return
+
+        collected_content = []
+        usage = None
+        error = None
+        completed = False
+        try:
+            for chunk in chunks:
+                if getattr(chunk, 'usage', None):
+                    usage = chunk.usage
                 if chunk.choices and len(chunk.choices) > 0:
                     delta = chunk.choices[0].delta
                     if hasattr(delta, 'content') and delta.content:
-                        content = delta.content
-                if content:
-                    #print(content,end="",flush=True)
-                    collected_content.append(content)
-            print() #流式输出结束后换行
+                        timer.on_token()
+                        collected_content.append(delta.content)
+                        yield delta.content
+            completed = True
+            if cache_key:
+                self.cache.set(cache_key,"".join(collected_content))
+        except Exception as e:
+            error = e
+            print(f"读取LLM流式响应时出错: {e}")
+        finally:
+            response.close() #提前退出时断开连接，停止继续生成
+            #提前断开时拿不到服务端的usage，completion_tokens记为None，stopped_early标记该情况
+            timer.finish(usage=usage,error=error,stopped_early=not completed and error is None)
+
+    async def _aopen_stream(self,client,params:dict,timeout:float):
+        '''
+        _open_stream的异步版本；任务被取消(对冲落败)时立即关闭连接
+        '''
+        response = None
+        try:
+            response = await client.with_options(timeout=timeout,max_retries=0).chat.completions.create(
+                **params,
+                **self._stream_options(),
+                stream=True,
+            )
+            chunks = response.__aiter__()
+            buffered = []
+            async for chunk in chunks:
+                buffered.append(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    break
+            return response,buffered,chunks
+        except asyncio.CancelledError:
+            if response is not None:
+                await response.close()
+            raise
+
+    async def athink(self,messages:List[Dict[str,str]],temperature:float=0,use_cache:bool=True,stop:Optional[List[str]]=None,max_tokens:Optional[int]=None,deadline:Optional[float]=None):
+        '''
+        think的异步版本：基于AsyncOpenAI，在同一个事件循环里并发驱动多个会话
+        同一客户端上的并发请求数受信号量限制，超出的请求排队等待
+        '''
+        params = self._request_params(messages,temperature,stop,max_tokens)
+        cache_key = self._cache_key(params) if use_cache else None
+        timer = CallTimer(wrapper="AgentLLM",model=self.model)
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                timer.finish(cached=True)
+                return cached
+
+        client = get_async_openai_client(**self._client_config)
+        limiter = get_limiter(limit=self.max_concurrency,**self._client_config)
+        self._limiter = limiter
+
+        usage = None
+        try:
+            async with limiter:
+                #排队等待的时间不计入本次调用的延迟
+                timer = CallTimer(wrapper="AgentLLM",model=self.model)
+                deadline_at = self._deadline_at(deadline)
+                print(f"正在调用{self.model}模型(异步)...")
+                while True:
+                    response = None
+                    try:
+                        timeout = self._attempt_timeout(deadline_at)
+                        (response,buffered,chunks),hedged = await ahedged_open(
+                            lambda: self._aopen_stream(client,params,timeout),
+                            self._hedge_delay(),
+                        )
+                        timer.hedged = timer.hedged or hedged
+                        #与think相同的流式收集逻辑
+                        collected_content = []
+                        usage = None
+                        for chunk in buffered:
+                            if chunk.choices and chunk.choices[0].delta.content:
+                                timer.on_token()
+                                collected_content.append(chunk.choices[0].delta.content)
+                        async for chunk in chunks:
+                            if getattr(chunk, 'usage', None):
+                                usage = chunk.usage
+                            if chunk.choices and len(chunk.choices) > 0:
+                                delta = chunk.choices[0].delta
+                                if hasattr(delta, 'content') and delta.content:
+                                    timer.on_token()
+                                    collected_content.append(delta.content)
+                        break
+                    except Exception as e:
+                        if response is not None:
+                            await response.close()
+                        delay = self._backoff_delay(e,timer,deadline_at)
+                        if delay is None:
+                            raise
+                        await asyncio.sleep(delay)
+
+                result = "".join(collected_content)
+                timer.finish(usage=usage)
+                if cache_key:
+                    self.cache.set(cache_key,result)
+                return result
 
-            return "".join(collected_content)#最后把列表所有打印合并为整个输出
-            
         except Exception as e:
             print(f"调用LLM模型时出错: {e}")
+            timer.finish(usage=usage,error=e)
             return None
+
+    def concurrency_stats(self)->Dict[str,int]:
+        '''
+        返回当前客户端的并发与排队深度指标(尚未调用过athink时返回空字典)
+        '''
+        return self._limiter.stats() if self._limiter else {}
         
 
 #测试代码
@@ -92,6 +393,19 @@ if __name__ == "__main__":
         if response:
             print("LLM完整响应内容:")
             print(response)
+        print(f"连接池统计: {pool_stats()}")
+        print(f"调用指标: {llmClient.metrics.summary()}")
+
+        #异步并发调用示例：多个会话共享一个事件循环
+        async def _demo():
+            questions = ["1+1等于几？","用一句话介绍Python。","今天是星期几？"]
+            results = await asyncio.gather(*[
+                llmClient.athink([{"role":"user","content":q}]) for q in questions
+            ])
+            for q,r in zip(questions,results):
+                print(f"{q} -> {r}")
+            print(f"并发统计: {llmClient.concurrency_stats()}")
+        asyncio.run(_demo())
     except ValueError as e:
         print(f"配置错误: {e}")
 
@@ -3,11 +3,17 @@ import re
 from planner import Planner
 from executor import Executor
 from llm_call import AgentLLM
+from plan_cache import PlanCache
 
 class PlanAndSolveAgent:
-    def __init__(self,llm_client:AgentLLM):
+    def __init__(self,llm_client:AgentLLM,plan_cache:PlanCache = None):
+        '''
+        参数：
+        - llm_client (AgentLLM): 用于与LLM交互的客户端实例
+        - plan_cache (PlanCache, 可选): 计划模板缓存，例如 PlanCache(path="plan_cache.json")；默认不开启
+        '''
         self.llm_client = llm_client
-        self.planner = Planner(llm_client)
+        self.planner = Planner(llm_client,plan_cache=plan_cache)
         self.executor = Executor(llm_client)
 
     def run(self,query:str):
@@ -20,13 +26,16 @@ class PlanAndSolveAgent:
         #1.首先调用Planner生成plan
         plan = self.planner.plan(query)
 
-        #对输出进行检验
-        if plan is None:
+        #对输出进行检验(解析失败时Planner返回空列表)
+        if not plan:
             print("\n-----任务终止，规划失败-----\n")
             return
         
         #2.调用Executor执行plan
         final_answer = self.executor.execute(query=query,plan=plan)
+        #每一步都拿到了结果才算成功执行，这样的计划才值得作为模板复用
+        if all(self.executor.results.get(step["id"]) is not None for step in plan):
+            self.planner.remember(query,plan)
         if final_answer:
             print(f"\n----任务完成----\n最终答案:{final_answer}")
         else:
@@ -35,9 +44,10 @@ class PlanAndSolveAgent:
 
 if __name__ == "__main__":
     llm_client = AgentLLM(
-        model="gpt-4o"
+        model="gpt-4o",
+        warmup=True,
     )
-    plan_and_solve = PlanAndSolveAgent(llm_client=llm_client)
+    plan_and_solve = PlanAndSolveAgent(llm_client=llm_client,plan_cache=PlanCache(path="plan_cache.json"))
     query = "小明5次月考总分分别为:630,640,620,590,620,而武大华科分数线是630，请帮我分析一下小明考上武大华科的概率,最好用数字来表示考上概率大小。"
     plan_and_solve.run(query)
 
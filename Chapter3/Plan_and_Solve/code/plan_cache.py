@@ -0,0 +1,256 @@
+'''
+计划模板缓存
+用户经常用同一种问法问不同的对象，例如"比较北大和清华的录取概率"与"比较武大和华科的录取概率"。
+Planner 每次都要付出一次完整的LLM调用和容易出错的解析。这里把成功执行过的计划存成模板：
+1. 实体遮蔽：把问题中的数字、英文词、引号内容、"X和Y"并列的对象替换为占位符 <N0>/<E0>…
+2. 本地向量化：遮蔽后的问题用哈希向量化器(与 Chapter4 semantic_cache 相同的做法)编码
+3. 检索：占位符种类和数量一致、余弦相似度达到阈值即命中
+4. 重新实例化：把模板计划中的占位符替换为新问题的实体
+未命中时由 Planner 回退到LLM规划，执行成功后再写入缓存。
+'''
+import re
+import os
+import json
+import math
+import zlib
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+SparseVector = Dict[int, float]
+
+FILLER_WORDS = ["怎么样", "如何", "什么", "请问", "一下", "的", "吗", "呢", "了", "啊"]
+
+
+class HashingEmbedder:
+    '''
+    哈希向量化器：无需模型、无需联网
+    文本 -> 去掉虚词 -> 字符n-gram -> 哈希到固定维度的桶 -> L2归一化的稀疏向量
+    '''
+    def __init__(self, dim: int = 4096, ngram_range: Tuple[int, int] = (1, 2)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def _ngrams(self, text: str) -> List[str]:
+        text = "".join(ch for ch in text.lower() if ch.isalnum())
+        for word in FILLER_WORDS:
+            text = text.replace(word, "")
+        grams = []
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            grams.extend(text[i:i + n] for i in range(len(text) - n + 1))
+        return grams
+
+    def embed(self, text: str) -> SparseVector:
+        counts = Counter(zlib.crc32(g.encode("utf-8")) % self.dim for g in self._ngrams(text))
+        norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+        return {k: v / norm for k, v in counts.items()}
+
+
+def cosine(a: SparseVector, b: SparseVector) -> float:
+    '''两个已归一化稀疏向量的余弦相似度'''
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+_QUOTED = re.compile(r"[“\"「『《]([^”\"」』》]{1,30})[”\"」』》]")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?%?")
+_LATIN = re.compile(r"[A-Za-z][A-Za-z0-9.+#-]*")
+_COORDINATION = re.compile(r"和|与|跟|及|、|还是|vs|VS")
+_STOP_CHARS = set("的了吗呢啊在是把被从到给和与及跟、，。？！；：,.?!;: ")
+_POLITE_PREFIX = re.compile(r"^(?:请帮我|帮我|请问|麻烦你?|请)")
+_LEADING_VERBS = ["请帮我", "帮我", "请", "比较一下", "比较", "对比", "分析", "查询", "搜索", "计算", "看看"]
+
+
+def _strip_leading_verbs(text: str) -> str:
+    changed = True
+    while changed:
+        changed = False
+        for verb in _LEADING_VERBS:
+            if text.startswith(verb) and len(text) > len(verb):
+                text, changed = text[len(verb):], True
+    return text
+
+
+def extract_entities(query: str) -> List[Tuple[str, str]]:
+    '''
+    启发式的实体抽取，返回按出现顺序排列的 [(种类, 文本)]，种类为 "N"(数字) 或 "E"(其它实体)
+    其它实体按文本去重；数字每次出现都是一个槽位(成绩列表里常有重复的分数，去重会让同类问题的槽位数对不上)
+    - 引号/书名号中的内容、英文词、数字
+    - 中文并列结构 "X和Y"、"X、Y"、"X还是Y" 两侧不超过4个字的词(去掉"比较""帮我"之类的前缀)
+    '''
+    found = []  #(起始位置, 种类, 文本)
+    for m in _QUOTED.finditer(query):
+        found.append((m.start(1), "E", m.group(1)))
+    for m in _LATIN.finditer(query):
+        found.append((m.start(), "E", m.group()))
+    for m in _NUMBER.finditer(query):
+        found.append((m.start(), "N", m.group()))
+    for m in _COORDINATION.finditer(query):
+        left = m.start()
+        while left > 0 and m.start() - left < 6 and query[left - 1] not in _STOP_CHARS \
+                and "一" <= query[left - 1] <= "鿿":
+            left -= 1
+        right = m.end()
+        while right < len(query) and right - m.end() < 4 and query[right] not in _STOP_CHARS \
+                and "一" <= query[right] <= "鿿":
+            right += 1
+        left_text = _strip_leading_verbs(query[left:m.start()])[-4:]
+        right_text = query[m.end():right]
+        if len(left_text) >= 2 and len(right_text) >= 2:
+            found.append((m.start() - len(left_text), "E", left_text))
+            found.append((m.end(), "E", right_text))
+
+    entities, seen = [], set()
+    for _, kind, text in sorted(found):
+        if kind == "N" or text not in seen:
+            seen.add(text)
+            entities.append((kind, text))
+    return entities
+
+
+def mask(text: str, entities: List[Tuple[str, str]], by_occurrence: bool = True) -> str:
+    '''
+    把实体替换为占位符；一次性正则替换，较长的实体优先匹配，
+    避免短实体截断长实体，也避免替换到已经插入的占位符里
+    数字两侧不能紧挨着数字或小数点，"5%" 不会匹配到 "15%" 里面
+    同一文本对应多个槽位时(重复出现的数字)：
+    - by_occurrence=True(问题本身)：按出现顺序依次使用，用完后沿用最后一个，槽位与 entities 一一对应
+    - by_occurrence=False(计划步骤)：始终使用第一个槽位，同一个值在所有步骤中都是同一个占位符
+    '''
+    if not entities:
+        return text
+    slots: Dict[str, List[str]] = {}
+    kinds: Dict[str, str] = {}
+    for (kind, value), placeholder in zip(entities, _placeholders(entities)):
+        slots.setdefault(value, []).append(placeholder)
+        kinds[value] = kind
+    used: Counter = Counter()
+
+    def replace(m):
+        value = m.group()
+        placeholders = slots[value]
+        if not by_occurrence:
+            return placeholders[0]
+        placeholder = placeholders[min(used[value], len(placeholders) - 1)]
+        used[value] += 1
+        return placeholder
+
+    def alternative(value: str) -> str:
+        if kinds[value] == "N":
+            return rf"(?<![\d.]){re.escape(value)}(?!\.?\d)"
+        return re.escape(value)
+
+    pattern = "|".join(alternative(value) for value in sorted(slots, key=len, reverse=True))
+    return re.sub(pattern, replace, text)
+
+
+def shape_of(query: str, entities: List[Tuple[str, str]]) -> str:
+    '''问题的"形状"：遮蔽实体并去掉"请帮我"之类的礼貌前缀'''
+    return _POLITE_PREFIX.sub("", mask(query, entities).strip())
+
+
+def _placeholders(entities: List[Tuple[str, str]]) -> List[str]:
+    counters: Dict[str, int] = Counter()
+    placeholders = []
+    for kind, _ in entities:
+        placeholders.append(f"<{kind}{counters[kind]}>")
+        counters[kind] += 1
+    return placeholders
+
+
+def _signature(entities: List[Tuple[str, str]]) -> str:
+    '''占位符的种类与数量，新问题必须与模板一致才能重新实例化'''
+    counts = Counter(kind for kind, _ in entities)
+    return ",".join(f"{kind}{counts[kind]}" for kind in sorted(counts))
+
+
+class PlanCache:
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        max_entries: int = 500,
+        path: Optional[str] = None,
+        embedder: Optional[HashingEmbedder] = None,
+        entity_extractor: Callable[[str], List[Tuple[str, str]]] = extract_entities,
+    ):
+        '''
+        参数：
+        - threshold (float): 遮蔽后问题的余弦相似度阈值
+        - max_entries (int): 最多保存的模板数，超过后淘汰最早写入的
+        - path (str, 可选): JSON文件路径，提供时模板在进程之间持久化
+        - entity_extractor (callable): 实体抽取函数，返回 [(种类, 文本)]；可替换为基于词典或NER的实现
+        '''
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.path = path
+        self.embedder = embedder or HashingEmbedder()
+        self.entity_extractor = entity_extractor
+        self.hits = 0
+        self.misses = 0
+        self._entries: List[Dict[str, Any]] = []  #{"shape", "signature", "plan", "vector"}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for entry in json.load(f):
+                    entry["vector"] = self.embedder.embed(entry["shape"])
+                    self._entries.append(entry)
+
+    def lookup(self, query: str) -> Optional[List[Dict[str, Any]]]:
+        '''命中时返回用新实体实例化后的计划，否则返回 None'''
+        entities = self.entity_extractor(query)
+        shape = shape_of(query, entities)
+        signature = _signature(entities)
+        vector = self.embedder.embed(shape)
+        with self._lock:
+            best, best_score = None, 0.0
+            for entry in self._entries:
+                if entry["signature"] != signature:
+                    continue
+                score = cosine(vector, entry["vector"])
+                if score > best_score:
+                    best, best_score = entry, score
+            if best is None or best_score < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        values = {placeholder: value for placeholder, (_, value) in zip(_placeholders(entities), entities)}
+        plan = []
+        for step in best["plan"]:
+            text = re.sub(r"<[A-Z]\d+>", lambda m: values.get(m.group(), m.group()), step["step"])
+            plan.append({"id": step["id"], "step": text, "depends_on": list(step["depends_on"])})
+        print(f"⚡ 命中计划模板(相似度{best_score:.2f})，跳过LLM规划")
+        return plan
+
+    def add(self, query: str, plan: List[Dict[str, Any]]):
+        '''把一次成功执行的计划存为模板'''
+        if not plan:
+            return
+        entities = self.entity_extractor(query)
+        shape = shape_of(query, entities)
+        entry = {
+            "shape": shape,
+            "signature": _signature(entities),
+            "plan": [{"id": s["id"], "step": mask(s["step"], entities, by_occurrence=False), "depends_on": list(s["depends_on"])}
+                     for s in plan],
+        }
+        with self._lock:
+            #同一形状只保留最新的计划
+            self._entries = [e for e in self._entries if e["shape"] != shape]
+            entry["vector"] = self.embedder.embed(shape)
+            self._entries.append(entry)
+            del self._entries[:-self.max_entries]
+            if self.path:
+                self._save()
+
+    def _save(self):
+        data = [{k: v for k, v in e.items() if k != "vector"} for e in self._entries]
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -1,6 +1,8 @@
-from typing import List, Dict
+from typing import List, Dict, Any
 import ast
 from llm_call import AgentLLM
+from llm_metrics import attribution
+from plan_cache import PlanCache
 
 # 1. 修改 Prompt：使用标准的 Markdown 反引号 (```) 作为示例
 Planner_prompt_template = """
@@ -9,26 +11,85 @@ Planner_prompt_template = """
 
 # Task
 分析用户的问题: "{question}"
-请先在内心思考解决这个问题的最佳路径，识别潜在的依赖关系，然后生成一个详细的步骤列表。
+请先在内心思考解决这个问题的最佳路径，识别步骤之间的依赖关系，然后生成一个详细的步骤列表。
 
 # Constraints
-1. 列表必须是合法的Python List[str]。
+1. 列表必须是合法的Python List[dict]，每个步骤包含 "id"(从1开始的整数)、"step"(步骤描述)、"depends_on"(依赖的步骤id列表)。
 2. 步骤描述需要包含动词，具有可执行性（如“搜索...”、“计算...”、“生成...”）。
-3. **输出中严禁包含除Python代码块以外的任何文字。**
+3. 只有确实需要用到其它步骤结果时才写进 depends_on；互不依赖的步骤(如分别搜索A和B)会被并行执行。
+4. 最后一步汇总得出最终答案。
+5. **输出中严禁包含除Python代码块以外的任何文字。**
 
 # Output Format
 ```python
-["Step 1", "Step 2", ...]
+[{{"id": 1, "step": "Step 1", "depends_on": []}}, {{"id": 2, "step": "Step 2", "depends_on": []}}, {{"id": 3, "step": "Step 3", "depends_on": [1, 2]}}]
 """
 
+
+def normalize_plan(raw: list) -> List[Dict[str, Any]]:
+    '''
+    把模型输出规整为依赖图：[{"id": int, "step": str, "depends_on": [int]}, ...]
+    - 兼容旧格式 List[str]：视为线性链，每一步依赖前一步
+    - 去掉不存在的依赖和自依赖；存在环时退化为按列表顺序的线性链
+    '''
+    if all(isinstance(item, str) for item in raw):
+        return [{"id": i + 1, "step": step, "depends_on": [i] if i else []} for i, step in enumerate(raw)]
+
+    steps, seen = [], set()
+    for i, item in enumerate(raw):
+        if not isinstance(item, dict):
+            item = {"step": str(item)}
+        step_id = item.get("id")
+        if not isinstance(step_id, int) or step_id in seen:
+            step_id = max(seen, default=0) + 1
+        seen.add(step_id)
+        depends_on = item.get("depends_on") or []
+        if not isinstance(depends_on, (list, tuple)):
+            depends_on = [depends_on]
+        steps.append({"id": step_id, "step": str(item.get("step", "")), "depends_on": list(depends_on)})
+    for step in steps:
+        step["depends_on"] = sorted({d for d in step["depends_on"] if d in seen and d != step["id"]})
+
+    #Kahn 拓扑排序检查环
+    remaining = {step["id"]: set(step["depends_on"]) for step in steps}
+    while True:
+        ready = [step_id for step_id, deps in remaining.items() if not deps]
+        if not ready:
+            break
+        for step_id in ready:
+            del remaining[step_id]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    if remaining:
+        print(f"⚠️ 计划中的依赖存在环，按列表顺序线性执行")
+        for i, step in enumerate(steps):
+            step["depends_on"] = [steps[i - 1]["id"]] if i else []
+    return steps
+
 class Planner: 
-    def __init__(self, llm_client: AgentLLM): 
+    def __init__(self, llm_client: AgentLLM, plan_cache: PlanCache = None): 
+        '''
+        参数：
+        - llm_client (AgentLLM): 用于与LLM交互的客户端实例
+        - plan_cache (PlanCache, 可选): 计划模板缓存，同类问题命中时直接复用成功执行过的计划，不再调用LLM
+        '''
         self.llm_client = llm_client
+        self.plan_cache = plan_cache
+
+    def remember(self, query: str, plan: List[Dict[str, Any]]):
+        '''计划执行成功后调用，把它存为模板'''
+        if self.plan_cache is not None:
+            self.plan_cache.add(query, plan)
 
-    def plan(self, query: str) -> List[str]:
+    def plan(self, query: str) -> List[Dict[str, Any]]:
         '''
-        根据用户的问题，生成一个解决问题的步骤列表
+        根据用户的问题，生成一个解决问题的步骤依赖图(格式见 normalize_plan)
         '''
+        if self.plan_cache is not None:
+            plan = self.plan_cache.lookup(query)
+            if plan is not None:
+                return plan
+
         prompt = Planner_prompt_template.format(question=query)
 
         message = [
@@ -37,7 +98,8 @@ class Planner:
 
         print("正在生成计划...")
         
-        response = self.llm_client.think(messages=message)
+        with attribution(agent="PlanAndSolveAgent",step="plan"):
+            response = self.llm_client.think(messages=message)
 
         print(f"✅ 计划已生成:\n{response}")
 
@@ -59,7 +121,7 @@ class Planner:
 
             # 4. 类型检查：确保得到的是列表
             if isinstance(plan, list):
-                return plan
+                return normalize_plan(plan)
             else:
                 print(f"❌ 解析错误: 得到的类型是 {type(plan)}，而不是 list")
                 return []
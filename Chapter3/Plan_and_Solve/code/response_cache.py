@@ -0,0 +1,130 @@
+'''
+基于SQLite的LLM响应缓存(精确匹配)
+think 默认 temperature=0，同样的提示词反复发送给服务商既慢又花钱。
+缓存键是 (服务地址 base_url, model, messages, temperature 等请求参数) 的规范化哈希，命中时直接返回上一次的完整响应。
+支持：LRU + 总大小淘汰、TTL 过期、命中/未命中计数。
+'''
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional, Dict, Any
+
+
+class ResponseCache:
+    '''
+    磁盘持久化的响应缓存
+    '''
+    def __init__(self, path: str = "llm_cache.sqlite", max_entries: int = 10000,
+                 max_bytes: int = 64 * 1024 * 1024, ttl: Optional[float] = 7 * 24 * 3600):
+        '''
+        参数：
+        - path (str): SQLite 文件路径，传 ":memory:" 则只在进程内缓存
+        - max_entries (int): 最多保留的条目数
+        - max_bytes (int): 所有响应的总字节上限，超过后按最近最少使用(LRU)淘汰
+        - ttl (float, 可选): 条目的存活秒数，None 表示永不过期
+        '''
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT, size INTEGER, created REAL, accessed REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON cache(accessed)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(base_url: str, **params) -> str:
+        '''
+        把请求参数规范化为JSON(键排序、紧凑分隔符)后取sha256，保证同样的请求得到同样的键
+        base_url 必须参与哈希：本地推理服务和云端服务商可能用同一个模型名，回答却不能互相复用
+        '''
+        canonical = json.dumps({"base_url": base_url, "params": params}, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        '''
+        查询缓存，命中时刷新访问时间；过期条目视为未命中并删除
+        '''
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM cache WHERE key=?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created = row
+            if self.ttl is not None and now - created > self.ttl:
+                self._conn.execute("DELETE FROM cache WHERE key=?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE cache SET accessed=? WHERE key=?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: str):
+        '''
+        写入缓存，然后按LRU淘汰直到满足条目数和总大小的上限
+        '''
+        if value is None:
+            return
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache(key, value, size, created, accessed) VALUES (?,?,?,?,?)",
+                (key, value, size, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        '''
+        先删除过期条目，再从最久未访问的条目开始删除，直到满足上限
+        '''
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM cache WHERE created < ?", (time.time() - self.ttl,))
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM cache ORDER BY accessed ASC").fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM cache WHERE key=?", (key,))
+            count -= 1
+            total -= size
+
+    def clear(self):
+        '''清空缓存与计数'''
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        '''
+        返回命中率、条目数和占用字节数
+        '''
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": count,
+            "bytes": total,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
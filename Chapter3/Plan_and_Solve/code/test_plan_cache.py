@@ -0,0 +1,42 @@
+from plan_cache import PlanCache, extract_entities, mask
+
+
+def test_number_not_matched_inside_longer_number():
+    '''
+    "5%" 不能匹配到 "15%"、"0.5%" 里面，句末的小数点不影响匹配
+    '''
+    entities = [("N", "5%"), ("N", "620")]
+    assert mask("先增长15%再增长5%", entities) == "先增长15%再增长<N0>"
+    assert mask("0.5%与5%", entities) == "0.5%与<N0>"
+    assert mask("总分为1620，不是620.", entities) == "总分为1620，不是<N1>."
+
+
+def test_repeated_value_uses_first_slot_in_steps():
+    '''
+    问题里重复出现的数字，在所有计划步骤中都用第一个槽位
+    '''
+    entities = extract_entities("语文620分、数学580分、英语620分，总分排名如何")
+    assert entities == [("N", "620"), ("N", "580"), ("N", "620")]
+    for step in ["计算620与580的差", "把620和620相加", "查询620分对应的排名"]:
+        masked = mask(step, entities, by_occurrence=False)
+        assert "<N2>" not in masked and masked.count("<N0>") == step.count("620")
+    assert mask("语文620分、英语620分", entities) == "语文<N0>分、英语<N2>分"
+
+
+def test_reinstantiated_plan_uses_new_values():
+    cache = PlanCache()
+    cache.add("语文620分、数学580分、英语620分，总分排名如何", [
+        {"id": 1, "step": "计算620+580+620", "depends_on": []},
+        {"id": 2, "step": "查询1820分在全省的排名", "depends_on": [1]},
+    ])
+    plan = cache.lookup("语文600分、数学590分、英语600分，总分排名如何")
+    assert plan is not None
+    assert plan[0]["step"] == "计算600+590+600"
+    assert plan[1]["step"] == "查询1820分在全省的排名"  #1820不是问题中的实体，保持原样
+
+
+if __name__ == "__main__":
+    test_number_not_matched_inside_longer_number()
+    test_repeated_value_uses_first_slot_in_steps()
+    test_reinstantiated_plan_uses_new_values()
+    print("✅ 计划模板缓存测试通过")
@@ -2,11 +2,12 @@ import os
 import re
 # 假设 AgentLLM 在同级目录下，如果是文件夹里，请确保路径正确
 from llm_call import AgentLLM 
+from llm_metrics import attribution
 # 【修改点1】去掉相对导入的点
 from tool.tool_excute import ToolExecutor
 from tool.search_tool import search, __dec__ as search_description
 
-REACT_PROMPT_TEMPLATE = """
+REACT_INSTRUCTIONS_TEMPLATE = """
 你是一个可以调用外部工具的智能助手。请一步步思考并解决用户的问题。
 
 【可用工具】
@@ -29,18 +30,35 @@ Action: Search[100美元兑换人民币汇率]
 Observation: 1美元 ≈ 7.24人民币，100美元 ≈ 724元。
 Thought: 我已经获取了汇率信息，可以计算并回答用户了。
 Action: Finish[根据最新汇率，100美元大约可以兑换724人民币。]
+"""
 
+# 单条消息模式：每一步把指令、问题和全部历史重新渲染成一条 user 消息
+REACT_PROMPT_TEMPLATE = REACT_INSTRUCTIONS_TEMPLATE + """
 【开始任务】
 Question: {question}
 History:
 {history}
 """
 
+# 多轮增量模式：指令与工具放在固定的 system 消息中，Question 是第一条 user 消息，
+# 之后每一步只追加 assistant(Thought/Action) 和 user(Observation) 两个新轮次
+REACT_SYSTEM_PROMPT_TEMPLATE = REACT_INSTRUCTIONS_TEMPLATE
+
+# 服务端停止序列：模型一旦开始编造 Observation 或下一轮 Thought 就立刻结束生成
+REACT_STOP_SEQUENCES = ["Observation:", "\nThought:"]
+
 class ReactAgent:
-    def __init__(self, llm_client: AgentLLM, tool_executor: ToolExecutor, max_steps: int = 10):
+    def __init__(self, llm_client: AgentLLM, tool_executor: ToolExecutor, max_steps: int = 10, streaming: bool = True, step_max_tokens: int = 512, incremental: bool = True):
         self.llm_client = llm_client
         self.tool_executor = tool_executor
         self.max_steps = max_steps
+        # 多轮增量模式：消息前缀在各步之间保持不变，服务商的提示缓存和本地KV前缀缓存都能命中，
+        # 每一步需要预填充的只有新增的 Thought/Action/Observation；关闭后回到每步重新渲染整个模板的方式
+        self.incremental = incremental
+        # 每一步只需要一对 Thought/Action，限制单步最多生成的 token 数
+        self.step_max_tokens = step_max_tokens
+        # 流式模式下边接收边解析，一旦拿到完整的 Action 行就断开流，不再为模型编造的 Observation 付费
+        self.streaming = streaming
         self.history = [] 
 
         # 添加 Search 工具
@@ -74,6 +92,34 @@ class ReactAgent:
         action = action_match.group(1).strip() if action_match else None
         return thought, action
 
+    def _think_until_action(self, messages: list):
+        """流式调用 LLM，收到第一行完整的 Action 后立即停止生成。"""
+        buffer = ""
+        stream = self.llm_client.think_stream(
+            messages=messages,
+            stop=REACT_STOP_SEQUENCES,
+            max_tokens=self.step_max_tokens,
+        )
+        try:
+            for piece in stream:
+                # 只需要从上一块的末尾附近开始查找，避免每次都扫描整个缓冲区
+                search_from = max(0, len(buffer) - len("Observation:"))
+                buffer += piece
+
+                # 模型开始自己编造 Observation，截断并停止
+                obs_index = buffer.find("Observation:", search_from)
+                if obs_index != -1:
+                    return buffer[:obs_index].rstrip()
+
+                # 第一行 Action 已经以换行结束，说明这一步的输出已完整
+                if "\n" in piece:
+                    action_index = buffer.find("Action:")
+                    if action_index != -1 and "\n" in buffer[action_index:]:
+                        return buffer[:buffer.index("\n", action_index)]
+        finally:
+            stream.close()
+        return buffer or None
+
     def _parse_action(self, action_text: str):
         """解析 Action 字符串，提取工具名称和输入。"""
         # 兼容 Action: Search[华为] 这种格式
@@ -82,27 +128,54 @@ class ReactAgent:
             return match.group(1), match.group(2)
         return None, None
 
+    def _build_messages(self, query: str) -> list:
+        """构建本次任务的初始消息(仅增量模式)。"""
+        system_prompt = REACT_SYSTEM_PROMPT_TEMPLATE.format(tools=self.tool_executor.getAvailableTools())
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Question: {query}"},
+        ]
+
+    def _record_step(self, messages: list, response_text: str, history_entry: str, feedback: str):
+        """
+        记录一步的结果：单条消息模式写入 history；增量模式追加 assistant 输出和一条 user 反馈
+        """
+        self.history.append(history_entry)
+        if self.incremental:
+            messages.append({"role": "assistant", "content": response_text})
+            messages.append({"role": "user", "content": feedback})
+
     def run(self, query: str):
         self.history = [] 
         current_step = 0
+        messages = self._build_messages(query) if self.incremental else None
 
         while current_step < self.max_steps:
             current_step += 1
             print(f"\n🚀 第 {current_step} 轮思考...")
 
-            # 1. 格式化提示词
-            tools_desc = self.tool_executor.getAvailableTools()
-            history_str = "\n".join(self.history)
-            
-            prompt = REACT_PROMPT_TEMPLATE.format(
-                tools=tools_desc,
-                question=query,
-                history=history_str
-            )
-
-            # 2. 调用 LLM
-            messages = [{"role": "user", "content": prompt}]
-            response_text = self.llm_client.think(messages=messages)
+            # 1. 格式化提示词(增量模式下直接沿用上一步的消息列表)
+            if not self.incremental:
+                tools_desc = self.tool_executor.getAvailableTools()
+                history_str = "\n".join(self.history)
+                
+                prompt = REACT_PROMPT_TEMPLATE.format(
+                    tools=tools_desc,
+                    question=query,
+                    history=history_str
+                )
+                messages = [{"role": "user", "content": prompt}]
+
+            # 2. 调用 LLM(指标按智能体和步数归属)
+            with attribution(agent="ReactAgent", step=current_step):
+                if self.streaming:
+                    response_text = self._think_until_action(messages)
+                else:
+                    response_text = self.llm_client.think(
+                        messages=messages,
+                        stop=REACT_STOP_SEQUENCES,
+                        max_tokens=self.step_max_tokens,
+                    )
 
             if not response_text:
                 print("LLM 返回空响应，结束思考")
@@ -116,7 +189,8 @@ class ReactAgent:
             if not action:
                 print("⚠️ 警告: LLM 未返回有效 Action，尝试继续或结束")
                 # 这里可以根据情况决定是 break 还是 continue，通常如果没有 action 只有 thought，可能需要把 thought 加入历史继续
-                self.history.append(f"Thought: {thought}")
+                self._record_step(messages, response_text, f"Thought: {thought}",
+                                  "Observation: 没有检测到 Action，请按格式给出下一步的 Action。")
                 continue 
 
             # 检查终止条件 Finish[答案]
@@ -130,7 +204,8 @@ class ReactAgent:
             tool_name, tool_input = self._parse_action(action)
             if not tool_name or not tool_input:
                 print(f"❌ 无法解析 Action 格式: {action}")
-                self.history.append(f"Thought: {thought}\nInvalid Action format: {action}")
+                self._record_step(messages, response_text, f"Thought: {thought}\nInvalid Action format: {action}",
+                                  f"Observation: 无法解析 Action 格式: {action}，请使用 工具名称[工具参数] 的格式。")
                 continue
 
             print(f"🎬 执行工具: {tool_name} 参数: [{tool_input}]")
@@ -145,7 +220,8 @@ class ReactAgent:
             print(f"👀 观察结果: {observation}")
 
             # 将本轮交互添加到历史
-            self.history.append(f"Thought: {thought}\nAction: {action}\nObservation: {observation}")
+            self._record_step(messages, response_text, f"Thought: {thought}\nAction: {action}\nObservation: {observation}",
+                              f"Observation: {observation}")
             
         # 【修改点2】这一段必须在 while 循环外面
         print("❌ 已达到最大步数，流程终止。")
@@ -154,7 +230,7 @@ class ReactAgent:
 # 测试代码
 if __name__ == "__main__":
     # 1. 实例化依赖组件
-    llm = AgentLLM()            # 确保 llm_call.py 里有这个类
+    llm = AgentLLM(warmup=True) # 启动时预热连接池
     executor = ToolExecutor()   # 确保 ToolExecutor 类没问题
 
     # 2. 【修改点3】传入参数实例化 Agent
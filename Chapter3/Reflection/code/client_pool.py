@@ -0,0 +1,220 @@
+'''
+进程级共享的客户端注册表
+每次 new 一个 OpenAI / TavilyClient 都会新建一套连接池，意味着新的 TCP/TLS 握手。
+这里按 (base_url, api_key, timeout) 缓存客户端实例，同一进程内的所有智能体、工具共用同一个 keep-alive 连接池。
+'''
+import asyncio
+import weakref
+import threading
+from typing import Dict, Tuple, Any, Optional, List
+from openai import OpenAI, AsyncOpenAI
+
+_lock = threading.Lock()
+_openai_clients: Dict[Tuple[str, str, float], OpenAI] = {}
+_tavily_clients: Dict[str, Any] = {}
+_stats: Dict[str, Dict[str, int]] = {}  # 每个客户端的创建/复用计数
+
+
+def _mask(api_key: str) -> str:
+    '''统计信息中不暴露完整的API Key'''
+    return f"***{api_key[-4:]}" if api_key else "None"
+
+
+def _stat_name(kind: str, api_key: str, base_url: str = "", timeout: Any = "") -> str:
+    return f"{kind}|{base_url}|{_mask(api_key)}|{timeout}"
+
+
+def _record(name: str, created: bool):
+    stat = _stats.setdefault(name, {"created": 0, "reused": 0})
+    stat["created" if created else "reused"] += 1
+
+
+def get_openai_client(api_key: str, base_url: str, timeout: float = 60) -> OpenAI:
+    '''
+    获取(或创建)一个共享的 OpenAI 客户端
+    相同 (base_url, api_key, timeout) 的调用方拿到的是同一个实例，从而复用底层连接池
+    '''
+    key = (base_url, api_key, float(timeout))
+    with _lock:
+        client = _openai_clients.get(key)
+        created = client is None
+        if created:
+            client = OpenAI(api_key=api_key, base_url=base_url, timeout=timeout)
+            _openai_clients[key] = client
+        _record(_stat_name("openai", api_key, base_url, key[2]), created)
+    return client
+
+
+class ConcurrencyLimiter:
+    '''
+    每个异步客户端一个的并发闸门：用信号量限制同时在途的请求数，并记录排队深度
+    用法：async with limiter: ...
+    '''
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+        self.in_flight = 0      # 正在执行的请求数
+        self.waiting = 0        # 正在排队等待的请求数(队列深度)
+        self.max_waiting = 0    # 历史最大排队深度
+        self.total = 0          # 累计完成的请求数
+
+    async def __aenter__(self):
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.in_flight -= 1
+        self.total += 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "total": self.total,
+        }
+
+
+class _LoopRegistry:
+    '''
+    按事件循环分组的注册表：异步客户端的连接池和信号量都绑定在事件循环上
+    以事件循环对象本身为弱引用键(而不是 id，id 在事件循环回收后会被复用)，
+    已关闭的事件循环在下一次访问时整组移除，客户端随之释放
+    调用方需持有 _lock
+    '''
+    def __init__(self):
+        self._by_loop: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+        self._no_loop: dict = {}  # 不在事件循环中调用时使用
+
+    def current(self) -> dict:
+        for loop in [loop for loop in self._by_loop if loop.is_closed()]:
+            del self._by_loop[loop]
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return self._no_loop
+        entries = self._by_loop.get(loop)
+        if entries is None:
+            entries = self._by_loop[loop] = {}
+        return entries
+
+    def items(self) -> List[Tuple[Tuple[str, str, float], Any]]:
+        groups = [self._no_loop, *self._by_loop.values()]
+        return [item for group in groups for item in group.items()]
+
+    def clear(self):
+        self._by_loop.clear()
+        self._no_loop.clear()
+
+
+_async_clients = _LoopRegistry()  # 事件循环 -> {(base_url, api_key, timeout): AsyncOpenAI}
+_limiters = _LoopRegistry()       # 事件循环 -> {(base_url, api_key, timeout, limit): ConcurrencyLimiter}
+
+
+def get_async_openai_client(api_key: str, base_url: str, timeout: float = 60) -> AsyncOpenAI:
+    '''
+    获取(或创建)当前事件循环内共享的 AsyncOpenAI 客户端
+    '''
+    key = (base_url, api_key, float(timeout))
+    with _lock:
+        clients = _async_clients.current()
+        client = clients.get(key)
+        created = client is None
+        if created:
+            client = AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout)
+            clients[key] = client
+        _record(_stat_name("async_openai", api_key, base_url, key[2]), created)
+    return client
+
+
+def get_limiter(api_key: str, base_url: str, timeout: float = 60, limit: int = 16) -> ConcurrencyLimiter:
+    '''
+    获取异步客户端上的并发闸门，同一客户端、同一上限的所有协程共享同一个闸门
+    上限也是键的一部分：max_concurrency 不同的调用方各用各的闸门，而不是悄悄沿用先创建的上限
+    '''
+    key = (base_url, api_key, float(timeout), limit)
+    with _lock:
+        limiters = _limiters.current()
+        limiter = limiters.get(key)
+        if limiter is None:
+            limiter = ConcurrencyLimiter(limit)
+            limiters[key] = limiter
+    return limiter
+
+
+def get_tavily_client(api_key: str):
+    '''
+    获取(或创建)一个共享的 TavilyClient
+    tavily 是可选依赖，只有真正用到时才导入
+    '''
+    from tavily import TavilyClient
+
+    with _lock:
+        client = _tavily_clients.get(api_key)
+        created = client is None
+        if created:
+            client = TavilyClient(api_key=api_key)
+            _tavily_clients[api_key] = client
+        _record(_stat_name("tavily", api_key), created)
+    return client
+
+
+def warm_up(clients: Optional[List[OpenAI]] = None) -> int:
+    '''
+    预热连接池：对每个客户端发一次轻量请求(models.list)，提前完成 TCP/TLS 握手
+    返回预热成功的客户端数量，预热失败不影响后续正常调用
+    '''
+    with _lock:
+        targets = list(clients) if clients is not None else list(_openai_clients.values())
+
+    warmed = 0
+    for client in targets:
+        try:
+            client.models.list()
+            warmed += 1
+        except Exception as e:
+            print(f"连接预热失败({client.base_url}): {e}")
+    return warmed
+
+
+def pool_stats() -> Dict[str, Any]:
+    '''
+    返回连接池统计信息：客户端数量以及每个客户端的创建/复用次数
+    '''
+    with _lock:
+        return {
+            "openai_clients": len(_openai_clients),
+            "async_openai_clients": len(_async_clients.items()),
+            "tavily_clients": len(_tavily_clients),
+            "clients": {name: dict(stat) for name, stat in _stats.items()},
+            "limiters": {
+                f"{_stat_name('async_openai', key[1], key[0], key[2])}|limit={key[3]}": limiter.stats()
+                for key, limiter in _limiters.items()
+            },
+        }
+
+
+def close_all():
+    '''
+    关闭所有共享客户端并清空注册表(一般在进程退出前调用)
+    '''
+    with _lock:
+        for client in _openai_clients.values():
+            try:
+                client.close()
+            except Exception:
+                pass
+        _openai_clients.clear()
+        # 异步客户端需要在各自的事件循环里 await close()，这里只丢弃引用
+        _async_clients.clear()
+        _limiters.clear()
+        _tavily_clients.clear()
+        _stats.clear()
@@ -0,0 +1,113 @@
+'''
+Reflection 迭代的收敛检测
+原先只有反馈里出现"无需改进"才会提前结束，否则总要跑满 max_iteration 轮"反思+优化"。
+实际运行中后几轮经常只是把同一份代码重新排版一遍。这里在每一轮检查三种收敛信号：
+1. 归一化AST哈希：去掉文档字符串、注释与排版后，新代码与之前任一版本完全相同
+2. AST编辑距离：新代码相对上一版本只改动了极少的语法节点
+3. 反馈重复：评审反馈与之前某一轮几乎一致，说明评审已经提不出新意见
+'''
+import re
+import ast
+import hashlib
+import difflib
+from typing import List, Optional
+
+from sandbox import extract_code
+
+_SPACES = re.compile(r"\s+")
+
+
+def _strip_docstrings(tree: ast.AST) -> ast.AST:
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            body = node.body
+            if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+                    and isinstance(body[0].value.value, str):
+                node.body = body[1:] or [ast.Pass()]
+    return tree
+
+
+def parse_normalized(code: str) -> Optional[ast.AST]:
+    '''解析并去掉文档字符串；语法错误或没有代码时返回 None'''
+    if not code:
+        return None
+    try:
+        return _strip_docstrings(ast.parse(extract_code(code)))
+    except SyntaxError:
+        return None
+
+
+def ast_hash(tree: ast.AST) -> str:
+    '''与排版、注释、文档字符串无关的结构哈希'''
+    return hashlib.sha1(ast.dump(tree, annotate_fields=False).encode("utf-8")).hexdigest()
+
+
+def ast_tokens(tree: ast.AST) -> List[str]:
+    '''广度优先遍历得到的节点序列：节点类型 + 标识符/常量，用于计算编辑距离'''
+    tokens = []
+    for node in ast.walk(tree):
+        label = type(node).__name__
+        for field in ("id", "arg", "attr", "name"):
+            value = getattr(node, field, None)
+            if isinstance(value, str):
+                label = f"{label}:{value}"
+                break
+        if isinstance(node, ast.Constant):
+            label = f"{label}:{node.value!r}"
+        tokens.append(label)
+    return tokens
+
+
+def edit_distance(a: List[str], b: List[str]) -> int:
+    '''基于 SequenceMatcher 的近似编辑距离：不相同的片段长度之和'''
+    distance = 0
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag != "equal":
+            distance += max(i2 - i1, j2 - j1)
+    return distance
+
+
+def normalize_feedback(feedback: str) -> str:
+    return _SPACES.sub(" ", feedback or "").strip()
+
+
+class ConvergenceDetector:
+    def __init__(self, min_edit_ratio: float = 0.01, feedback_similarity: float = 0.9):
+        '''
+        参数：
+        - min_edit_ratio (float): 相对上一版本改动的AST节点比例不超过该值时视为收敛
+        - feedback_similarity (float): 与之前某轮反馈的相似度达到该值时视为重复
+        '''
+        self.min_edit_ratio = min_edit_ratio
+        self.feedback_similarity = feedback_similarity
+        self._hashes: List[str] = []
+        self._last_tokens: Optional[List[str]] = None
+        self._feedbacks: List[str] = []
+
+    def check_code(self, code: str) -> Optional[str]:
+        '''记录一个新版本的代码；已收敛时返回原因，否则返回 None'''
+        tree = parse_normalized(code)
+        if tree is None:
+            return None  #语法错误的版本不参与比较，交给下一轮反思
+        digest, tokens = ast_hash(tree), ast_tokens(tree)
+        reason = None
+        if digest in self._hashes:
+            reason = f"代码与第{self._hashes.index(digest) + 1}个版本等价(归一化AST相同)"
+        elif self._last_tokens is not None:
+            distance = edit_distance(self._last_tokens, tokens)
+            if distance <= self.min_edit_ratio * max(len(tokens), len(self._last_tokens)):
+                reason = f"代码相对上一版本只改动了{distance}个语法节点"
+        self._hashes.append(digest)
+        self._last_tokens = tokens
+        return reason
+
+    def check_feedback(self, feedback: str) -> Optional[str]:
+        '''记录一条反馈；与之前的反馈重复时返回原因，否则返回 None'''
+        text = normalize_feedback(feedback)
+        reason = None
+        for i, previous in enumerate(self._feedbacks):
+            if difflib.SequenceMatcher(None, previous, text, autojunk=False).ratio() >= self.feedback_similarity:
+                reason = f"反馈与第{i + 1}轮几乎相同"
+                break
+        self._feedbacks.append(text)
+        return reason
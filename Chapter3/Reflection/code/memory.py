@@ -1,87 +1,163 @@
 '''
 Reflection 的核心在于迭代，而迭代的前提是能够记住之前的尝试和获得的反馈。因此，一个“短期记忆”模块是实现该范式的必需品。这个记忆模块将负责存储每一次“执行-反思”循环的完整轨迹。
+
+存储结构：
+- 每条记录是带 __slots__ 的 Record 对象(类型固定、没有逐条的 __dict__ 开销)
+- 轨迹文本在写入时增量渲染，get_trajector() 直接返回缓存，不再每次重建整个字符串
+- 最近一次执行结果单独持有引用，get_last_execution() 为 O(1)
+- 超过 max_records 条后，最早的记录被折叠为一行摘要，正文释放；
+  指定 persist_dir 时正文写入磁盘，折叠后仍可按需读回
+- 与原来一样接受任意类型的记录；只有 execution/reflection 会渲染进轨迹，其它类型只保存、可按类型查询
 '''
-from typing import List,Dict,Any,Optional
+import os
+from typing import List, Dict, Any, Optional
+
+RECORD_TYPES = ("execution", "reflection")  #渲染进轨迹的记录类型
+
+
+class Record:
+    '''
+    一条执行或反思记录
+    正文折叠后 _content 为 None，如果落过盘则从 path 读回
+    '''
+    __slots__ = ("index", "type", "_content", "path", "digest", "meta")
+
+    def __init__(self, index: int, record_type: str, content: str, meta: Optional[Dict[str, Any]] = None):
+        self.index = index
+        self.type = record_type
+        self._content: Optional[str] = content
+        self.path: Optional[str] = None
+        self.digest = _digest(record_type, content)
+        self.meta = meta #附加信息，例如耗时测量、收敛原因
+
+    @property
+    def content(self) -> Optional[str]:
+        if self._content is None and self.path is not None:
+            with open(self.path, encoding="utf-8") as f:
+                return f.read()
+        return self._content
+
+    @property
+    def collapsed(self) -> bool:
+        return self._content is None
+
+    def render(self) -> Optional[str]:
+        '''渲染为轨迹中的一段文本；已折叠的记录只渲染摘要；不属于 RECORD_TYPES 的记录不进入轨迹，返回 None'''
+        if self.type not in RECORD_TYPES:
+            return None
+        title = "上一轮尝试" if self.type == "execution" else "评审员反馈"
+        if self.collapsed:
+            return f"--- {title}(已折叠) ---\n{self.digest}"
+        return f"--- {title} ---\n{self._content}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": self.type, "content": self.content, "meta": self.meta}
+
+
+def _digest(record_type: str, content: Optional[str], width: int = 80) -> str:
+    '''一行摘要：执行记录取行数和首个非空行，反思记录取开头一句'''
+    content = content or ""
+    lines = [line.strip() for line in content.splitlines() if line.strip()]
+    first = lines[0] if lines else ""
+    if len(first) > width:
+        first = first[:width] + "…"
+    if record_type == "execution":
+        return f"代码共{len(lines)}行：{first}"
+    return first
+
 
 class Memory:
     '''
     短期记忆模块，用于存储智能体的行动与反思轨迹
     '''
-    def __init__(self):
+    def __init__(self, max_records: Optional[int] = None, persist_dir: Optional[str] = None):
         '''
-        初始化一个空的列表来存储所有记录
-        '''
-        self.records:List[Dict[str,Any]] = []
-        '''
-        举例说明records内容：
-        self.records = [
-            # 第一条记录：第1步的操作
-            {
-                "step_index": 0,                    # 整数 (int)
-                "action": "Google搜索",              # 字符串 (str)
-                "query": "武大华科 2025 分数线",      # 字符串 (str)
-                "status": "success",                # 字符串 (str)
-                "output": "搜索结果: 630分...",      # 字符串 (str)
-                "timestamp": 1716920000             # 浮点数 (float) -> 这就是为什么值是 Any
-            },
-
-            # 第二条记录：第2步的操作
-            {
-                "step_index": 1,
-                "action": "Python代码计算",
-                "code": "print(630 > 600)",
-                "status": "error",
-                "error_msg": "NameError: ...",      # 这一行只有出错时才有，体现了 Dict 的灵活性
-                "retry_count": 1
-            },
-
-            # 第三条记录：第3步的操作 (Reflect后的重试)
-            {
-                "step_index": 1,
-                "action": "Python代码计算(修正版)",
-                "code": "score = 630; print(score)",
-                "status": "success",
-                "output": "630"
-            }
-        ]
+        参数：
+        - max_records (int, 可选): 保留完整正文的最近记录数，超出后最早的记录折叠为摘要；None 表示不限制
+        - persist_dir (str, 可选): 记录正文的落盘目录，折叠后的正文仍可通过 Record.content 读回
         '''
+        self.max_records = max_records
+        self.persist_dir = persist_dir
+        if persist_dir:
+            os.makedirs(persist_dir, exist_ok=True)
+        self._records: List[Record] = []
+        self._parts: List[Optional[str]] = []  #每条记录渲染后的文本，与 _records 一一对应(不进入轨迹的为 None)
+        self._trajectory: Optional[str] = ""
+        self._last_execution: Optional[Record] = None
+        self._next_uncollapsed = 0         #最早一条尚未折叠的记录下标
 
-    def add_record(self,record_type:str,content:str):
+    def add_record(self, record_type: str, content: str, meta: Optional[Dict[str, Any]] = None) -> Record:
         '''
         向记忆中添加一条新纪录
 
         参数：
-        - record_type (str): 记录的类型 ('execution' 或 'reflection')。
+        - record_type (str): 记录的类型 ('execution' 或 'reflection'；其它类型只保存，不渲染进轨迹)。
         - content (str): 记录的具体内容 (例如，生成的代码或反思的反馈)。
+        - meta (dict, 可选): 附加信息
         '''
-        record = {
-            "type":record_type,
-            "content":content,
-        }
-        self.records.append(record)
+        record = Record(len(self._records), record_type, content, meta)
+        if self.persist_dir:
+            record.path = os.path.join(self.persist_dir, f"{record.index:04d}-{record_type}.txt")
+            with open(record.path, "w", encoding="utf-8") as f:
+                f.write(content or "")
+
+        self._records.append(record)
+        part = record.render()
+        self._parts.append(part)
+        if self._trajectory is not None and part is not None:
+            self._trajectory = f"{self._trajectory}\n\n{part}" if self._trajectory else part
+        if record_type == "execution":
+            previous, self._last_execution = self._last_execution, record
+            #上一次执行结果此前因为"最近一次执行"而被跳过折叠，现在补上
+            if previous is not None and previous.index < self._next_uncollapsed:
+                self._collapse(previous)
+
+        self._collapse_old()
         print(f"📝 记忆已更新，新增一条 '{record_type}' 记录。")
+        return record
 
+    def _collapse_old(self):
+        '''
+        把超出 max_records 的最早记录折叠为摘要；最近一次执行结果始终保留完整正文
+        '''
+        if self.max_records is None:
+            return
+        while len(self._records) - self._next_uncollapsed > self.max_records:
+            record = self._records[self._next_uncollapsed]
+            self._next_uncollapsed += 1
+            if record is not self._last_execution:
+                self._collapse(record)
 
-    def get_trajector(self)->str:
+    def _collapse(self, record: Record):
+        record._content = None
+        self._parts[record.index] = record.render()
+        self._trajectory = None  #折叠改变了中间部分，下次读取时重新拼接一次
+
+    @property
+    def records(self) -> List[Dict[str, Any]]:
+        '''兼容旧接口：以字典形式返回所有记录'''
+        return [record.to_dict() for record in self._records]
+
+    def get_records(self, record_type: Optional[str] = None) -> List[Record]:
+        return [r for r in self._records if record_type is None or r.type == record_type]
+
+    def get_trajector(self) -> str:
         '''
         将所有记忆记录格式化为一个连贯的字符串文本，用于后续构建提示词
         '''
-        trajectory_parts = []
-        for record in self.records:
-            if record['type'] == 'execution':#执行记录
-                trajectory_parts.append(f"--- 上一轮尝试 ---\n{record['content']}")
-            elif record['type'] == 'reflection':
-                trajectory_parts.append(f"--- 评审员反馈 ---\n{record['content']}")
-        
-        return "\n\n".join(trajectory_parts)
-    
+        if self._trajectory is None:
+            self._trajectory = "\n\n".join(part for part in self._parts if part is not None)
+        return self._trajectory
+
     def get_last_execution(self) -> Optional[str]: #Optional[str]指返回的这个变量，要么是一个字符串（String），要么什么都不是（None）。
         """
         获取最近一次的执行结果 (例如，最新生成的代码)。
         如果不存在，则返回 None。
         """
-        for record in reversed(self.records):
-            if record['type'] == 'execution':
-                return record['content']
-        return None
-    
\ No newline at end of file
+        return self._last_execution.content if self._last_execution is not None else None
+
+    def get_last_execution_record(self) -> Optional[Record]:
+        return self._last_execution
+
+    def __len__(self) -> int:
+        return len(self._records)
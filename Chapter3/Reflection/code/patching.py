@@ -0,0 +1,140 @@
+'''
+补丁式优化
+REFINE_PROMPT_TEMPLATE 每一轮都让模型重新输出整段代码，输出token是优化阶段延迟的主要来源。
+补丁模式下模型只输出修改的部分，本地再应用到上一轮的代码上：
+- 支持 SEARCH/REPLACE 块和 unified diff 两种格式，统一转换为 (查找片段, 替换片段)
+- 查找片段先精确匹配，再忽略行首尾空白匹配，最后按行窗口做模糊匹配(相似度不低于阈值)
+- 任何一处无法定位都抛出 PatchError，由调用方回退为整段重新生成
+'''
+import re
+import difflib
+from typing import List, Tuple
+
+from sandbox import extract_code
+
+_SEARCH_REPLACE = re.compile(
+    r"<{5,}\s*SEARCH[^\n]*\n(.*?)^={5,}[^\n]*\n(.*?)^>{5,}\s*REPLACE", re.DOTALL | re.MULTILINE)
+_HUNK_HEADER = re.compile(r"^@@[^@]*@@")
+
+
+class PatchError(ValueError):
+    '''补丁无法解析或无法应用'''
+
+
+def parse_search_replace(text: str) -> List[Tuple[str, str]]:
+    return [(search, replace) for search, replace in _SEARCH_REPLACE.findall(text)]
+
+
+def parse_unified_diff(text: str) -> List[Tuple[str, str]]:
+    '''把每个 hunk 转换为 (上下文+删除的行, 上下文+新增的行)'''
+    edits, search, replace, in_hunk = [], [], [], False
+
+    def flush():
+        if search or replace:
+            edits.append(("".join(search), "".join(replace)))
+        search.clear()
+        replace.clear()
+
+    lines = [line for line in text.splitlines(keepends=True) if not line.startswith("```")]
+    for i, line in enumerate(lines):
+        if _HUNK_HEADER.match(line):
+            flush()
+            in_hunk = True
+        elif line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "):
+            flush()
+            in_hunk = False  #文件头
+        elif not in_hunk:
+            continue
+        elif line.startswith("-"):
+            search.append(line[1:])
+        elif line.startswith("+"):
+            replace.append(line[1:])
+        elif line.startswith(" ") or line in ("\n", ""):
+            search.append(line[1:] if line.startswith(" ") else line)
+            replace.append(line[1:] if line.startswith(" ") else line)
+        elif line.startswith("\\"):
+            continue  #"\ No newline at end of file"
+        else:
+            flush()
+            in_hunk = False
+    flush()
+    return edits
+
+
+def parse_patch(text: str) -> List[Tuple[str, str]]:
+    edits = parse_search_replace(text or "")
+    if not edits and "@@" in (text or ""):
+        edits = parse_unified_diff(text)
+    if not edits:
+        raise PatchError("回答中没有找到 SEARCH/REPLACE 块或 unified diff")
+    return edits
+
+
+def _indent(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+
+def _reindent(lines: List[str], old: str, new: str) -> List[str]:
+    '''模型给出的片段缩进与原代码不同时，整体平移缩进'''
+    if old == new:
+        return lines
+    result = []
+    for line in lines:
+        if line.strip() and line.startswith(old):
+            line = new + line[len(old):]
+        result.append(line)
+    return result
+
+
+def _locate(lines: List[str], search: List[str], threshold: float) -> Tuple[int, float]:
+    '''返回最佳匹配窗口的起始行和相似度；先比较去空白后的行，都不相等时再做模糊匹配'''
+    stripped = [line.strip() for line in lines]
+    target = [line.strip() for line in search]
+    size = len(target)
+    for start in range(len(lines) - size + 1):
+        if stripped[start:start + size] == target:
+            return start, 1.0
+    best_start, best_ratio = -1, 0.0
+    joined = "\n".join(target)
+    for start in range(len(lines) - size + 1):
+        ratio = difflib.SequenceMatcher(None, "\n".join(stripped[start:start + size]), joined).ratio()
+        if ratio > best_ratio:
+            best_start, best_ratio = start, ratio
+    if best_ratio < threshold:
+        raise PatchError(f"无法定位查找片段(最高相似度{best_ratio:.2f})：{target[0] if target else ''}")
+    return best_start, best_ratio
+
+
+def apply_edits(code: str, edits: List[Tuple[str, str]], threshold: float = 0.85) -> str:
+    '''按顺序应用所有 (查找片段, 替换片段)；失败时抛出 PatchError'''
+    for search, replace in edits:
+        if search and search in code:
+            code = code.replace(search, replace, 1)
+            continue
+        lines = code.splitlines(keepends=True)
+        search_lines = search.splitlines(keepends=True)
+        while search_lines and not search_lines[0].strip():
+            search_lines.pop(0)
+        while search_lines and not search_lines[-1].strip():
+            search_lines.pop()
+        if not search_lines:
+            raise PatchError("查找片段为空")
+        start, _ = _locate(lines, search_lines, threshold)
+        replace_lines = replace.splitlines(keepends=True)
+        if replace_lines and not replace_lines[-1].endswith("\n"):
+            replace_lines[-1] += "\n"
+        replace_lines = _reindent(replace_lines, _indent(search_lines[0]), _indent(lines[start]))
+        lines[start:start + len(search_lines)] = replace_lines
+        code = "".join(lines)
+    return code
+
+
+def apply_patch(last_code: str, response: str, threshold: float = 0.85) -> str:
+    '''
+    把模型返回的补丁应用到上一轮的代码上，返回与其它轮次相同格式(```python 代码块)的新代码
+    '''
+    code = extract_code(last_code)
+    if not code.endswith("\n"):
+        code += "\n"
+    patched = apply_edits(code, parse_patch(response), threshold)
+    return f"```python\n{patched}```"
@@ -19,7 +19,10 @@ REFLECT_PROMPT_TEMPLATE = """
 {code}
 ```
 
-请分析该代码的时间复杂度，并思考是否存在一种<strong>算法上更优</strong>的解决方案来显著提升性能。
+# 沙箱实测的运行时间:
+{measurements}
+
+请结合实测数据分析该代码的时间复杂度，并思考是否存在一种<strong>算法上更优</strong>的解决方案来显著提升性能。
 如果存在，请清晰地指出当前算法的不足，并提出具体的、可行的改进算法建议（例如，使用筛法替代试除法）。
 如果代码在算法层面已经达到最优，才能回答“无需改进”。
 
@@ -40,4 +43,25 @@ REFINE_PROMPT_TEMPLATE = """
 请根据评审员的反馈，生成一个优化后的新版本代码。
 你的代码必须包含完整的函数签名、文档字符串，并遵循PEP 8编码规范。
 请直接输出优化后的代码，不要包含任何额外的解释。
-"""
\ No newline at end of file
+"""
+#补丁模式：只输出修改的部分，本地应用到上一轮代码上，输出token比整段重写少得多
+PATCH_REFINE_PROMPT_TEMPLATE = """
+你是一位资深的Python程序员。你正在根据一位代码评审专家的反馈来修改你的代码。
+
+# 原始任务:
+{task}
+
+# 你上一轮尝试的代码:
+{last_code_attempt}
+评审员的反馈：
+{feedback}
+
+请根据评审员的反馈修改代码，但不要输出完整代码，只输出一个或多个修改块，格式如下：
+<<<<<<< SEARCH
+需要被替换的原代码片段(必须与上一轮代码中的内容逐字一致)
+=======
+替换后的新代码片段
+>>>>>>> REPLACE
+
+每个修改块只包含需要改动的连续几行，保持原有缩进，不要包含任何额外的解释。
+"""
@@ -5,22 +5,122 @@
 3.最后需要一个根据评审结果,进行优化结果的Prompt
 构建结果放在prompt_template.py文件中
 '''
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from llm_call import AgentLLM
 from memory import Memory
-from prompt_template import INITIAL_PROMPT_TEMPLATE,REFLECT_PROMPT_TEMPLATE,REFINE_PROMPT_TEMPLATE
+from llm_metrics import attribution
+from sandbox import CodeSandbox, faster
+from convergence import ConvergenceDetector, parse_normalized
+from patching import apply_patch, PatchError
+from prompt_template import INITIAL_PROMPT_TEMPLATE,REFLECT_PROMPT_TEMPLATE,REFINE_PROMPT_TEMPLATE,PATCH_REFINE_PROMPT_TEMPLATE
 
 class ReflectionAgent:
-    def __init__(self,llm_clent:AgentLLM,max_iteration:int = 3):
+    def __init__(self,llm_clent:AgentLLM,max_iteration:int = 3,memory:Memory = None,sandbox:CodeSandbox = None,
+                 convergence:bool = True,refine_candidates:int = 1,refine_temperature:float = 0.7,tests:str = None,
+                 refine_mode:str = "full"):
         '''
         初始化Reflection智能体
 
         参数：
         - llm_client (AgentLLM): 用于与LLM交互的客户端实例。
         - max_iteration (int, 可选): 最大迭代次数，默认值为3。
+        - memory (Memory, 可选): 自定义的记忆模块，例如 Memory(max_records=6, persist_dir="reflection_runs/xxx")
+        - sandbox (CodeSandbox, 可选): 提供时每个候选版本都会在沙箱子进程中实测，
+          实测耗时写进反思提示；优化后的版本不再变快时停止迭代并保留最快的版本
+        - convergence (bool, 可选): 是否做收敛检测(代码AST等价/改动极小/反馈重复时提前结束)，默认开启
+        - refine_candidates (int, 可选): 每次优化并发生成的候选数(best-of-N)，默认为1即原来的单候选
+        - refine_temperature (float, 可选): 多候选时的采样温度，温度为0时N个候选几乎相同
+        - tests (str, 可选): 校验候选的测试代码(assert语句)，在沙箱中与候选代码一起执行；
+          没有提供 sandbox 时自动使用只校验、不计时的 CodeSandbox(sizes=())
+        - refine_mode (str, 可选): "full" 每轮重新生成整段代码；"patch" 只让模型输出 SEARCH/REPLACE 修改块，
+          在本地应用到上一轮代码上，补丁无法应用时回退为整段重新生成
         '''
+        if refine_mode not in ("full","patch"):
+            raise ValueError(f"未知的优化模式: {refine_mode}")
         self.llm_client = llm_clent
         self.max_iteration = max_iteration
-        self.memory = Memory()
+        self.memory = memory if memory is not None else Memory() #空的 Memory 长度为0，不能用 or 判断
+        self.sandbox = sandbox if sandbox is not None else (CodeSandbox(sizes=()) if tests else None)
+        self.tests = tests
+        self.convergence = convergence
+        self.stop_reason = None #最近一次 run 结束迭代的原因
+        self.refine_candidates = max(1,refine_candidates)
+        self.refine_temperature = refine_temperature
+        self.refine_mode = refine_mode
+        self._pool = ThreadPoolExecutor(max_workers=self.refine_candidates,thread_name_prefix="refine") if self.refine_candidates > 1 else None
+
+    def _measure(self,code:str):
+        '''实测一个候选版本，返回 (Measurement, 记录用的meta)；未配置沙箱时返回 (None, None)'''
+        if self.sandbox is None:
+            return None, None
+        measurement = self.sandbox.measure(code,self.tests)
+        print(f"\n沙箱实测结果：\n{measurement.to_prompt()}")
+        meta = {
+            "timings": measurement.timings,
+            "exponent": measurement.exponent,
+            "complexity": measurement.complexity,
+            "error": measurement.error,
+        }
+        return measurement, meta
+
+    def _generate(self,task:str,last_code:str,feedback:str,**kwargs):
+        '''
+        生成一个优化版本，返回 (代码, 实际使用的模式)
+        补丁模式下模型只输出修改块；解析或定位失败时再用完整的优化提示重新生成
+        '''
+        if self.refine_mode == "patch":
+            patch_prompt = PATCH_REFINE_PROMPT_TEMPLATE.format(task=task,last_code_attempt=last_code,feedback=feedback)
+            response = self.llm_client.think(messages=[{"role":"user","content":patch_prompt}],**kwargs)
+            if response is not None:
+                try:
+                    return apply_patch(last_code,response), "patch"
+                except PatchError as e:
+                    print(f"\n补丁无法应用({e}),回退为整段重新生成")
+        refine_prompt = REFINE_PROMPT_TEMPLATE.format(task=task,last_code_attempt=last_code,feedback=feedback)
+        return self.llm_client.think(messages=[{"role":"user","content":refine_prompt}],**kwargs), "full"
+
+    def _candidate(self,task:str,last_code:str,feedback:str):
+        '''生成并校验一个候选：返回 (代码, Measurement, meta, 是否通过校验)；调用失败时返回 None'''
+        code, mode = self._generate(task,last_code,feedback,temperature=self.refine_temperature,use_cache=False)
+        if code is None:
+            return None
+        if parse_normalized(code) is None:
+            return code, None, {"error":"SyntaxError","refine_mode":mode}, False
+        measurement, meta = self._measure(code)
+        return code, measurement, dict(meta or {},refine_mode=mode), measurement is None or measurement.passed
+
+    def _refine(self,task:str,last_code:str,feedback:str):
+        '''
+        生成优化后的代码，返回 (代码, Measurement, meta)
+        多候选时并发请求N个候选，每个线程拿到回答后立即在沙箱中校验，
+        通过校验的候选里取实测最快的一个(没有计时则取第一个)，只有它会写入记忆；
+        全部未通过校验时保留上一版代码，meta 中的 rejected/failures 记录失败原因
+        '''
+        if self._pool is None:
+            code, mode = self._generate(task,last_code,feedback)
+            measurement, meta = self._measure(code)
+            return code, measurement, dict(meta or {},refine_mode=mode)
+
+        #每个线程复制一份当前上下文，attribution 标签才能带到线程里
+        futures = [self._pool.submit(contextvars.copy_context().run,self._candidate,task,last_code,feedback)
+                   for _ in range(self.refine_candidates)]
+        candidates = [f.result() for f in futures]
+        candidates = [c for c in candidates if c is not None]
+        if not candidates:
+            return None, None, None
+        valid = [c for c in candidates if c[3]]
+        if not valid:
+            failures = "\n".join(f"- 候选{i+1}: {(c[2] or {}).get('error') or '未通过校验'}" for i,c in enumerate(candidates))
+            print(f"\n{len(candidates)}个候选均未通过校验,保留上一版代码")
+            return last_code, None, {"rejected":len(candidates),"failures":failures}
+        best = valid[0]
+        for candidate in valid[1:]:
+            if candidate[1] is not None and best[1] is not None and faster(candidate[1],best[1],min_gain=0):
+                best = candidate
+        print(f"\n{len(candidates)}个候选中{len(valid)}个通过校验")
+        meta = dict(best[2] or {},candidates=len(candidates),valid=len(valid))
+        return best[0], best[1], meta
 
     def run(self,task:str):
         '''
@@ -34,9 +134,18 @@ class ReflectionAgent:
         initial_message = [
             {"role":"user","content":initial_prompt}
         ]
-        initial_code = self.llm_client.think(messages=initial_message)
+        with attribution(agent="ReflectionAgent",step="initial"):
+            initial_code = self.llm_client.think(messages=initial_message)
         print(f"初始执行结果：{initial_code}")
-        self.memory.add_record(record_type="execution",content=initial_code)
+        detector = ConvergenceDetector() if self.convergence else None
+        if detector:
+            detector.check_code(initial_code)
+        self.stop_reason = f"达到最大迭代次数({self.max_iteration})"
+        best_measurement, meta = self._measure(initial_code)
+        self.memory.add_record(record_type="execution",content=initial_code,meta=meta)
+        #最快版本的代码和meta放在局部变量里：Memory 设置了 max_records 时旧记录的正文会被折叠释放
+        best_code, best_meta = initial_code, meta
+        rejected_note = None #上一轮候选全部未通过校验时的失败原因，交给下一轮反思
 
 
         #2.迭代循环，反思优化
@@ -49,41 +158,64 @@ class ReflectionAgent:
             reflect_prompt = REFLECT_PROMPT_TEMPLATE.format(
                 task=task,
                 code=last_code,
+                measurements=(best_measurement.to_prompt() if best_measurement else "未进行实测")
+                             + (f"\n\n上一轮按反馈生成的候选均未通过校验，已保留当前代码：\n{rejected_note}" if rejected_note else ""),
             )
+            rejected_note = None
             reflect_message = [
                 {"role":"user","content":reflect_prompt}
             ]
-            feedback = self.llm_client.think(messages=reflect_message)
+            with attribution(agent="ReflectionAgent",step=f"reflect-{i+1}"):
+                feedback = self.llm_client.think(messages=reflect_message)
             print(f"\n反思结果：{feedback}\n")
-            self.memory.add_record("reflection",feedback)
+            reason = "评审认为无需改进" if "无需改进" in feedback else None
+            if detector and reason is None:
+                reason = detector.check_feedback(feedback)
+            self.memory.add_record("reflection",feedback,meta={"stop_reason":reason} if reason else None)
 
-            if "无需改进" in feedback:
-                print(f"\n反思认为代码已无需改进,任务完成")
+            if reason:
+                print(f"\n{reason},停止迭代")
+                self.stop_reason = reason
                 break#退出迭代
 
 
             #2.2 优化
             print(f"\n正在优化代码")
-            
-            refine_prompt = REFINE_PROMPT_TEMPLATE.format(
-                task=task,
-                last_code_attempt=last_code,
-                feedback=feedback,
-            )
-            refine_message = [
-                {"role":"user","content":refine_prompt}
-            ]
-            refined_code = self.llm_client.think(messages=refine_message)
+            with attribution(agent="ReflectionAgent",step=f"refine-{i+1}"):
+                refined_code, measurement, meta = self._refine(task,last_code,feedback)
+            if meta and meta.get("rejected"):
+                #候选全部失败：不写入新的执行记录，失败原因作为反馈记录下来，下一轮重新反思
+                rejected_note = meta["failures"]
+                self.memory.add_record("reflection",f"候选均未通过校验：\n{rejected_note}",meta={"rejected":meta["rejected"]})
+                continue
             print(f"\n优化后的代码：{refined_code}")
-            self.memory.add_record("execution",refined_code)
-        
+            #2.3 收敛检测：代码与之前的版本等价或几乎没变时，再反思一轮也只是重复，直接结束
+            reason = detector.check_code(refined_code) if detector else None
+            if reason:
+                meta = dict(meta or {},stop_reason=reason)
+            self.memory.add_record("execution",refined_code,meta=meta)
+            if reason:
+                print(f"\n{reason},停止迭代")
+                self.stop_reason = reason
+                break
+
+            #2.4 以实测数据决定是否继续：没有变快(或运行失败)就停止，并回退到最快的版本
+            if measurement is not None:
+                if not faster(measurement, best_measurement):
+                    print(f"\n实测运行时间没有改进,停止迭代")
+                    self.stop_reason = "实测运行时间没有改进"
+                    self.memory.add_record("execution",best_code,
+                                           meta=dict(best_meta or {},rollback=True,stop_reason=self.stop_reason))
+                    break
+                best_measurement, best_code, best_meta = measurement, refined_code, meta
+
         final_code = self.memory.get_last_execution()
-        print(f"\n---任务完成---\n最终代码：{final_code}")
+        print(f"\n---任务完成({self.stop_reason})---\n最终代码：{final_code}")
         return final_code
     
 if __name__ == '__main__':
-    llm_client = AgentLLM()
-    reflectionagent = ReflectionAgent(llm_clent=llm_client)
+    llm_client = AgentLLM(warmup=True)
+    reflectionagent = ReflectionAgent(llm_clent=llm_client,sandbox=CodeSandbox())
     task = "编写一个Python函数，找出1到n之间所有的素数 (prime numbers)。"
     final_code = reflectionagent.run(task)
 
@@ -0,0 +1,253 @@
+'''
+候选代码的沙箱实测
+反思提示原先只让LLM"猜"时间复杂度。这里把每个候选版本放进独立的子进程里实际运行：
+- 子进程以 -I(隔离模式)启动，启动后先在子进程内部用 resource 限制CPU时间与内存，超时直接杀掉
+  (不用 preexec_fn：调用方可能在多线程中测量，preexec_fn 在有线程时可能让子进程在 exec 前死锁)
+- 根据入口函数第一个参数的类型注解自动生成不同规模的输入(int -> n，list -> 长度为n的列表，str -> 长度为n的字符串)
+- 每个规模取多次运行的最小值，再用对数坐标的线性回归拟合增长指数，并与常见复杂度模型比较
+- 可选地在计时之前执行一段测试代码(assert语句)，测试不通过的候选不再计时
+多个候选可以在调用方的线程中并行测量，每个候选各占一个子进程。
+'''
+import re
+import ast
+import sys
+import json
+import math
+import subprocess
+from typing import List, Optional, Tuple
+
+# 在子进程中执行：从stdin读取任务，把测量结果以JSON写到stdout
+# 候选代码和测试常带 print 调试输出，结果通道是复制出来的原 stdout，
+# fd 1 本身指向 devnull(连 C 扩展直接写 fd 的输出也一并丢弃，也不会拖慢计时)
+_RUNNER = r'''
+import os, sys, json, time, random
+job = json.loads(sys.stdin.read())
+result_out = os.fdopen(os.dup(1), "w")
+os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+try:
+    import resource
+    resource.setrlimit(resource.RLIMIT_CPU, (job["cpu_seconds"], job["cpu_seconds"]))
+    limit = job["memory_mb"] * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+except ImportError:
+    pass  #Windows 没有 resource 模块，只剩墙钟超时
+namespace = {"__name__": "candidate"}
+result = {"timings": [], "error": None}
+try:
+    exec(compile(job["code"], "<candidate>", "exec"), namespace)
+    func = namespace[job["entry"]]
+    if job["tests"]:
+        try:
+            exec(compile(job["tests"], "<tests>", "exec"), namespace)
+        except BaseException as e:
+            raise AssertionError(f"测试未通过: {type(e).__name__}: {e}") from None
+    rng = random.Random(0)
+    for n in job["sizes"]:
+        if job["kind"] == "list":
+            arg = [rng.randint(0, n) for _ in range(n)]
+        elif job["kind"] == "str":
+            arg = "".join(rng.choice("abcdefghij") for _ in range(n))
+        else:
+            arg = n
+        best = None
+        for _ in range(job["repeats"]):
+            value = list(arg) if isinstance(arg, list) else arg
+            start = time.perf_counter()
+            func(value)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        result["timings"].append([n, best])
+        if best > job["max_seconds_per_size"]:
+            break
+except BaseException as e:
+    result["error"] = f"{type(e).__name__}: {e}"
+sys.stdout.flush()
+result_out.write(json.dumps(result))
+result_out.flush()
+'''
+
+# 复杂度模型：名称 -> f(n)
+COMPLEXITY_MODELS = [
+    ("O(log n)", lambda n: math.log(n)),
+    ("O(n)", lambda n: n),
+    ("O(n log n)", lambda n: n * math.log(n)),
+    ("O(n^1.5)", lambda n: n ** 1.5),
+    ("O(n^2)", lambda n: n ** 2),
+    ("O(n^3)", lambda n: n ** 3),
+]
+
+
+def extract_code(text: str) -> str:
+    '''去掉Markdown代码块标记，只保留代码'''
+    if not text:
+        return ""
+    match = re.search(r"```(?:python)?\s*\n(.*?)```", text, re.DOTALL)
+    return match.group(1) if match else text
+
+
+def find_entry(code: str) -> Tuple[Optional[str], str]:
+    '''
+    找到第一个顶层函数作为入口，并根据第一个参数的类型注解决定输入类型
+    返回 (函数名, "int"/"list"/"str")；语法错误时抛出 SyntaxError
+    '''
+    tree = ast.parse(code)
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef):
+            kind = "int"
+            if node.args.args and node.args.args[0].annotation is not None:
+                annotation = ast.unparse(node.args.args[0].annotation).lower()
+                if "list" in annotation or "sequence" in annotation:
+                    kind = "list"
+                elif "str" in annotation:
+                    kind = "str"
+            return node.name, kind
+    return None, "int"
+
+
+def fit_growth(timings: List[Tuple[int, float]]) -> Tuple[Optional[float], Optional[str]]:
+    '''
+    拟合增长曲线：返回 (对数坐标下的斜率, 最接近的复杂度模型)
+    每个模型用最小二乘求出常数 c，比较相对误差的平方和
+    '''
+    points = [(n, t) for n, t in timings if t > 0 and n > 1]
+    if len(points) < 3:
+        return None, None
+    xs = [math.log(n) for n, _ in points]
+    ys = [math.log(t) for _, t in points]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    denominator = sum((x - mean_x) ** 2 for x in xs)
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / denominator if denominator else None
+
+    best_name, best_error = None, None
+    for name, f in COMPLEXITY_MODELS:
+        # t ≈ c·f(n)，在对数空间里 c 的最优估计是残差的均值
+        residuals = [math.log(t) - math.log(f(n)) for n, t in points]
+        c = sum(residuals) / len(residuals)
+        error = sum((r - c) ** 2 for r in residuals)
+        if best_error is None or error < best_error:
+            best_name, best_error = name, error
+    return slope, best_name
+
+
+class Measurement:
+    '''一个候选版本的实测结果'''
+    __slots__ = ("timings", "error", "exponent", "complexity")
+
+    def __init__(self, timings: List[Tuple[int, float]], error: Optional[str] = None):
+        self.timings = timings
+        self.error = error
+        self.exponent, self.complexity = fit_growth(timings)
+
+    @property
+    def passed(self) -> bool:
+        '''能运行且通过测试(如果有)'''
+        return self.error is None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and bool(self.timings)
+
+    def time_at(self, n: int) -> Optional[float]:
+        for size, seconds in self.timings:
+            if size == n:
+                return seconds
+        return None
+
+    def to_prompt(self) -> str:
+        '''渲染为放进反思提示的文本'''
+        if self.error and not self.timings:
+            return f"运行失败: {self.error}"
+        if not self.timings:
+            return "已通过校验(未测量耗时)"
+        lines = [f"- n={n}: {seconds * 1000:.3f} ms" for n, seconds in self.timings]
+        if self.exponent is not None:
+            lines.append(f"拟合的增长指数约为 {self.exponent:.2f}，最接近 {self.complexity}")
+        if self.error:
+            lines.append(f"在更大的规模上运行失败: {self.error}")
+        return "\n".join(lines)
+
+
+def faster(candidate: Measurement, baseline: Measurement, min_gain: float = 0.05) -> bool:
+    '''
+    比较两次实测：在双方都测到的最大规模上，candidate 至少快 min_gain 才算有改进
+    只做了正确性校验(没有耗时)时，candidate 通过校验即视为可以继续
+    '''
+    if not candidate.passed:
+        return False
+    if not baseline.passed or not candidate.timings or not baseline.timings:
+        return True
+    common = sorted({n for n, _ in candidate.timings} & {n for n, _ in baseline.timings})
+    if not common:
+        #候选在更大的规模上都跑完了，说明更快
+        return max(n for n, _ in candidate.timings) > max(n for n, _ in baseline.timings)
+    n = common[-1]
+    return candidate.time_at(n) < baseline.time_at(n) * (1 - min_gain)
+
+
+class CodeSandbox:
+    def __init__(
+        self,
+        sizes: Tuple[int, ...] = (1000, 2000, 4000, 8000, 16000, 32000),
+        repeats: int = 3,
+        cpu_seconds: int = 10,
+        memory_mb: int = 512,
+        timeout: float = 30.0,
+        max_seconds_per_size: float = 1.0,
+    ):
+        '''
+        参数：
+        - sizes: 自动生成的输入规模；传入空元组时只校验语法和测试，不计时
+        - repeats (int): 每个规模重复次数，取最小值
+        - cpu_seconds / memory_mb: 子进程的CPU时间与地址空间上限
+        - timeout (float): 子进程的墙钟超时
+        - max_seconds_per_size (float): 某个规模单次运行超过该时间后不再测更大的规模
+        '''
+        self.sizes = list(sizes)
+        self.repeats = repeats
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.timeout = timeout
+        self.max_seconds_per_size = max_seconds_per_size
+
+    def measure(self, text: str, tests: Optional[str] = None) -> Measurement:
+        '''
+        在隔离的子进程中运行一个候选版本并测量
+        tests: 可选的测试代码，与候选代码在同一命名空间中执行，可以直接调用入口函数
+        '''
+        code = extract_code(text)
+        try:
+            entry, kind = find_entry(code)
+        except SyntaxError as e:
+            return Measurement([], f"SyntaxError: {e}")
+        if entry is None:
+            return Measurement([], "没有找到顶层函数")
+
+        job = json.dumps({
+            "code": code,
+            "entry": entry,
+            "kind": kind,
+            "tests": tests,
+            "sizes": self.sizes,
+            "repeats": self.repeats,
+            "max_seconds_per_size": self.max_seconds_per_size,
+            "cpu_seconds": self.cpu_seconds,
+            "memory_mb": self.memory_mb,
+        })
+        try:
+            completed = subprocess.run(
+                [sys.executable, "-I", "-c", _RUNNER],
+                input=job,
+                capture_output=True,
+                text=True,
+                timeout=self.timeout,
+            )
+        except subprocess.TimeoutExpired:
+            return Measurement([], f"运行超时({self.timeout}s)")
+        try:
+            result = json.loads(completed.stdout)
+        except ValueError:
+            if completed.returncode < 0:
+                return Measurement([], f"子进程被信号 {-completed.returncode} 终止(可能超出CPU或内存限制)")
+            reason = completed.stderr.strip().splitlines()[-1:] or [f"退出码 {completed.returncode}"]
+            return Measurement([], f"子进程异常退出: {reason[0]}")
+        return Measurement([tuple(t) for t in result["timings"]], result["error"])
@@ -0,0 +1,50 @@
+import contextlib
+import io
+
+from memory import Memory
+
+
+def quiet_memory(**kwargs) -> Memory:
+    memory = Memory(**kwargs)
+    original = memory.add_record
+
+    def add_record(*args, **kw):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return original(*args, **kw)
+    memory.add_record = add_record
+    return memory
+
+
+def test_other_record_types_are_kept():
+    '''
+    与原来的 Memory 一样接受任意类型的记录：保存、可查询，但不渲染进轨迹
+    '''
+    memory = quiet_memory()
+    memory.add_record("execution", "def f(): pass")
+    memory.add_record("note", "用户要求使用标准库")
+    memory.add_record("reflection", "无需改进")
+    assert len(memory) == 3
+    assert [r.content for r in memory.get_records("note")] == ["用户要求使用标准库"]
+    assert memory.records[1] == {"type": "note", "content": "用户要求使用标准库", "meta": None}
+    assert memory.get_trajector() == "--- 上一轮尝试 ---\ndef f(): pass\n\n--- 评审员反馈 ---\n无需改进"
+
+
+def test_trajectory_after_collapse():
+    '''
+    折叠后重新拼接的轨迹同样跳过其它类型的记录，最近一次执行结果保留完整正文
+    '''
+    memory = quiet_memory(max_records=2)
+    memory.add_record("execution", "第一版代码")
+    memory.add_record("note", "备注")
+    memory.add_record("reflection", "建议改用筛法")
+    memory.add_record("reflection", "再次建议改用筛法")
+    trajectory = memory.get_trajector()
+    assert "备注" not in trajectory
+    assert memory.get_last_execution() == "第一版代码"
+    assert trajectory.count("---") == 6
+
+
+if __name__ == "__main__":
+    test_other_record_types_are_kept()
+    test_trajectory_after_collapse()
+    print("✅ 记忆模块测试通过")
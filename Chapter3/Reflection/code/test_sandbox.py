@@ -0,0 +1,39 @@
+from sandbox import CodeSandbox
+
+PRINTING_SIEVE = '''```python
+def find_primes(n: int):
+    print(f"调试: n={n}")
+    is_prime = [True] * (n + 1)
+    is_prime[0:2] = [False, False]
+    for i in range(2, int(n ** 0.5) + 1):
+        if is_prime[i]:
+            is_prime[i * i::i] = [False] * len(range(i * i, n + 1, i))
+    return [i for i, p in enumerate(is_prime) if p]
+
+print("模块加载完成")
+```'''
+
+
+def test_candidate_that_prints():
+    '''
+    候选代码和测试中的 print 不能混进测量结果
+    '''
+    sandbox = CodeSandbox(sizes=(1000, 2000, 4000), repeats=1)
+    measurement = sandbox.measure(PRINTING_SIEVE, tests="print(find_primes(10))\nassert find_primes(10) == [2, 3, 5, 7]")
+    assert measurement.passed, measurement.error
+    assert [n for n, _ in measurement.timings] == [1000, 2000, 4000]
+
+
+def test_failing_tests_reported():
+    '''
+    测试不通过时返回测试错误，而不是子进程异常
+    '''
+    measurement = CodeSandbox(sizes=()).measure(PRINTING_SIEVE, tests="assert find_primes(10) == []")
+    assert not measurement.passed
+    assert measurement.error.startswith("AssertionError: 测试未通过")
+
+
+if __name__ == "__main__":
+    test_candidate_that_prints()
+    test_failing_tests_reported()
+    print("✅ 沙箱测试通过")
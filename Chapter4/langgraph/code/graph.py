@@ -13,15 +13,23 @@ def creat_search_assistant_graph()->StateGraph:
 
     node_config = NodeConfig()
 
+    workflow.add_node("cache_lookup",node_config.cache_lookup_node)
     workflow.add_node("understand",node_config.understand_query_node)
     workflow.add_node("search",node_config.tavily_search_node)
     workflow.add_node("generate",node_config.generate_answer_node)
+    workflow.add_node("cache_store",node_config.cache_store_node)
 
-    #设置线性流程
-    workflow.add_edge(START,"understand")
+    #先查语义缓存：命中直接结束，未命中走原来的线性流程
+    workflow.add_edge(START,"cache_lookup")
+    workflow.add_conditional_edges(
+        "cache_lookup",
+        lambda state: "hit" if state.get("cache_hit") else "miss",
+        {"hit":END,"miss":"understand"},
+    )
     workflow.add_edge("understand","search")
     workflow.add_edge("search","generate")
-    workflow.add_edge("generate",END)
+    workflow.add_edge("generate","cache_store")
+    workflow.add_edge("cache_store",END)
 
     memory = InMemorySaver()
     app = workflow.compile(checkpointer=memory)
@@ -69,8 +77,13 @@ if __name__ == "__main__":
         try:
             for event in app.stream(input_state, config=config):
                 
+                # --- 阶段 0: 语义缓存命中 ---
+                if "cache_lookup" in event:
+                    if event["cache_lookup"].get("cache_hit"):
+                        print(f"\n⚡ 命中缓存，直接回答:\n{event['cache_lookup']['final_answer']}")
+
                 # --- 阶段 1: 理解节点完成 ---
-                if "understand" in event:
+                elif "understand" in event:
                     # 获取 understand 节点返回的消息
                     last_msg = event["understand"]["messages"][-1]
                     content = last_msg.content
@@ -1,11 +1,46 @@
 from langchain_core.messages import SystemMessage, HumanMessage,AIMessage
 from state_creat import SearchState
 from config import LLMConfig
+from semantic_cache import SemanticCache
+from observation import shape_observation
 
 class NodeConfig:
-    def __init__(self):
-        self.llm = LLMConfig().llm
-        self.tavily_client = LLMConfig().tavily_client
+    def __init__(self,observation_budget:int = 800):
+        #只构建一次配置，LLM与Tavily客户端共用同一份连接
+        config = LLMConfig()
+        self.llm = config.llm
+        self.tavily_client = config.tavily_client
+        #语义缓存：近似问题直接复用之前的最终答案
+        self.semantic_cache = SemanticCache()
+        #送入总结提示的搜索结果token预算
+        self.observation_budget = observation_budget
+
+    def cache_lookup_node(self,state:SearchState)->dict:
+        '''
+        步骤0：语义缓存查询
+        用本地哈希向量检索语义相近的历史问题，命中则直接给出答案，跳过理解、搜索、生成三个节点
+        '''
+        user_message = state['messages'][-1].content
+        hit = self.semantic_cache.lookup(user_message)
+        if hit is None:
+            return {"question":user_message,"cache_hit":False,"step":"cache_miss"}
+
+        print(f"命中语义缓存(相似度{hit['score']:.2f}): {hit['question']}")
+        return {
+            "question":user_message,
+            "cache_hit":True,
+            "final_answer":hit['answer'],
+            "step":"completed",
+            "messages":[AIMessage(content=hit['answer'])]
+        }
+
+    def cache_store_node(self,state:SearchState)->dict:
+        '''
+        步骤4：把成功生成的答案写入语义缓存(搜索失败时的兜底答案不缓存)
+        '''
+        if state.get('step') == 'completed':
+            self.semantic_cache.add(state['question'],state['final_answer'])
+        return {"cache_hit":False}
 
     def understand_query_node(self,state:SearchState)->dict:
         '''
@@ -73,8 +108,8 @@ class NodeConfig:
             
             # --- 修改开始 ---
             
-            # 1. 初始化一个空列表，用来装所有的搜索结果条目
-            all_results = [] 
+            # 1. 按搜索词收集结果条目，交给整形阶段统一去重、排序、截断
+            results_by_query = []
             
             # 遍历每个关键词进行搜索
             for search_term in search_query.split(","):
@@ -93,10 +128,12 @@ class NodeConfig:
                 # response.get('results', []) 保证如果没搜到也不会报错
                 results = response.get('results', [])
                 if results:
-                    all_results.extend(results)
+                    results_by_query.append((search_term, results))
             
-            # 2. 现在 raw_content 是所有搜索结果的字符串表示
-            raw_content = str(all_results)
+            # 2. 整形：只保留标题和正文，去重、按相关度排序并截断到token预算
+            raw_content = shape_observation(results_by_query, budget_tokens=self.observation_budget)
+            if not raw_content:
+                raw_content = "没有找到相关的搜索结果。"
             
             # --- 修改结束 ---
 
@@ -139,10 +176,12 @@ class NodeConfig:
         '''
         步骤3：基于搜索结果生成最终答案
         '''
+        step = "completed"
         if state['step'] == 'search failed':
             # 如果搜索失败，执行回退策略，基于LLM自身知识回答
             fallback_prompt = f"搜索API暂时不可用，请基于您的知识回答用户的问题：\n用户问题：{state['user_query']}"
             response = self.llm.invoke([SystemMessage(content=fallback_prompt)])
+            step = "fallback completed"
         else:
             answer_prompt = f"""
             基于以下搜索结果为用户提供完整、准确的答案：
@@ -154,7 +193,7 @@ class NodeConfig:
 
         return {
             "final_answer": response.content,
-            "step": "completed",
+            "step": step,
             "messages": [AIMessage(content=response.content)]
         }
 
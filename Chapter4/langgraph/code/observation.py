@@ -0,0 +1,84 @@
+'''
+搜索结果整形(observation shaping)
+原先把 Tavily 返回的结果列表直接 str() 后塞进总结提示，URL、score、转义字符全都进了提示。
+这里在送给LLM之前做一次整形：
+1. 只保留 title 和 content，去掉多余空白
+2. 多个搜索词的结果之间去重：内容向量余弦相似度超过阈值视为同一片段
+3. 按与搜索词的重合度排序
+4. 用快速的token估计器截断到预算之内
+'''
+import re
+from typing import Dict, List, Tuple
+from semantic_cache import HashingEmbedder, cosine
+
+_CJK = re.compile(r"[　-鿿가-힯＀-￯]")
+_SPACES = re.compile(r"\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    '''中日韩字符按1个token，其余字符约4个字符1个token'''
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    '''截断到不超过 budget 个估计token，尽量停在句末'''
+    if estimate_tokens(text) <= budget:
+        return text
+    low, high = 0, len(text)
+    while low < high:  #二分查找最长的合规前缀
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    cut = text[:low]
+    sentence_end = max(cut.rfind(p) for p in "。！？.!?；;")
+    if sentence_end > low // 2:
+        cut = cut[:sentence_end + 1]
+    return cut + "…"
+
+
+def shape_observation(
+    results_by_query: List[Tuple[str, List[Dict]]],
+    budget_tokens: int = 800,
+    max_snippet_tokens: int = 200,
+    dedup_threshold: float = 0.85,
+    embedder: HashingEmbedder = None,
+) -> str:
+    '''
+    参数：
+    - results_by_query: [(搜索词, Tavily返回的results列表), ...]
+    - budget_tokens (int): 整形后文本的总token预算
+    - max_snippet_tokens (int): 单个片段的token上限，避免一条长结果占满预算
+    - dedup_threshold (float): 片段之间余弦相似度达到该值即视为重复
+    返回编号的 "[i] 标题\\n内容" 文本；没有任何结果时返回空字符串
+    '''
+    embedder = embedder or HashingEmbedder()
+    query_vectors = [embedder.embed(query) for query, _ in results_by_query]
+
+    snippets = []  #(相关度, 标题, 内容, 向量)
+    for query_vector, (_, results) in zip(query_vectors, results_by_query):
+        for result in results:
+            title = _SPACES.sub(" ", str(result.get("title") or "")).strip()
+            content = _SPACES.sub(" ", str(result.get("content") or "")).strip()
+            if not content:
+                continue
+            vector = embedder.embed(f"{title} {content}")
+            if any(cosine(vector, kept[3]) >= dedup_threshold for kept in snippets):
+                continue
+            #相关度取与所有搜索词中最高的重合度，各搜索词的结果放在一起统一排序
+            relevance = max(cosine(vector, q) for q in query_vectors)
+            snippets.append((relevance, title, content, vector))
+
+    snippets.sort(key=lambda s: s[0], reverse=True)
+    parts, used = [], 0
+    for relevance, title, content, _ in snippets:
+        remaining = budget_tokens - used
+        if remaining <= estimate_tokens(title) + 8:
+            break
+        content = truncate_to_tokens(content, min(max_snippet_tokens, remaining - estimate_tokens(title)))
+        part = f"[{len(parts) + 1}] {title}\n{content}"
+        parts.append(part)
+        used += estimate_tokens(part)
+    return "\n\n".join(parts)
@@ -0,0 +1,200 @@
+'''
+语义答案缓存
+"今天北京天气" 和 "北京今天天气如何" 字面不同、意思相同，精确匹配的缓存无法命中。
+这里用一个纯本地、离线的哈希向量化器(字符 1-gram + 2-gram)把问题编码为稀疏向量，
+再通过倒排索引召回候选、余弦相似度精排，超过阈值且未过期即视为命中。
+字符n-gram对数字和专有名词不敏感："2023年诺贝尔物理学奖得主" 与 "2024年…" 只差一个字符，
+相似度仍有0.9左右，而答案完全不同。因此与 Plan_and_Solve 的计划模板缓存一样先抽取问题中的
+数字、英文词、引号内容，以及"今天/明天/本周"这类时间词(天气、新闻的答案随日期变化)，
+这些关键实体完全一致的条目才参与相似度比较。时间词既然已经精确比较过，向量化时就从文本中去掉，
+否则 "今天北京天气" 与 "北京今天天气如何" 会因为词序不同只剩0.85左右的相似度。
+'''
+import re
+import math
+import time
+import zlib
+import threading
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+SparseVector = Dict[int, float]
+
+# 语气词/虚词对语义几乎没有贡献，却会拉低改写问句之间的相似度
+FILLER_WORDS = ["怎么样", "如何", "什么", "请问", "一下", "的", "吗", "呢", "了", "啊"]
+
+
+class HashingEmbedder:
+    '''
+    哈希向量化器：无需模型、无需联网
+    文本 -> 去掉虚词 -> 字符n-gram -> 哈希到固定维度的桶 -> L2归一化的稀疏向量
+    '''
+    def __init__(self, dim: int = 4096, ngram_range: Tuple[int, int] = (1, 2)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def _ngrams(self, text: str) -> List[str]:
+        # 去掉空白、标点和虚词，中英文统一小写
+        text = "".join(ch for ch in text.lower() if ch.isalnum())
+        for word in FILLER_WORDS:
+            text = text.replace(word, "")
+        grams = []
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            grams.extend(text[i:i + n] for i in range(len(text) - n + 1))
+        return grams
+
+    def embed(self, text: str) -> SparseVector:
+        counts = Counter(zlib.crc32(g.encode("utf-8")) % self.dim for g in self._ngrams(text))
+        norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+        return {k: v / norm for k, v in counts.items()}
+
+
+def cosine(a: SparseVector, b: SparseVector) -> float:
+    '''两个已归一化稀疏向量的余弦相似度'''
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+_QUOTED = re.compile(r"[“\"「『《]([^”\"」』》]{1,30})[”\"」』》]")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?%?")
+_LATIN = re.compile(r"[A-Za-z][A-Za-z0-9.+#-]*")
+_TIME = re.compile(
+    r"今天|今日|明天|明日|后天|昨天|昨日|前天|今晚|明晚|昨晚|今早|明早|"
+    r"今年|明年|去年|前年|本周|这周|上周|下周|本月|这个月|上个?月|下个?月|"
+    r"现在|目前|当前|最近|(?:周|星期|礼拜)[一二三四五六日天]"
+)
+# 同义的时间词归一为同一个键
+_TIME_ALIASES = {"今日": "今天", "明日": "明天", "昨日": "昨天", "这周": "本周", "这个月": "本月",
+                 "上个月": "上月", "下个月": "下月", "目前": "现在", "当前": "现在"}
+
+
+def _time_key(word: str) -> str:
+    word = _TIME_ALIASES.get(word, word)
+    if word[:2] in ("星期", "礼拜"):
+        word = "周" + word[2:]
+    return "周日" if word == "周天" else word
+
+
+def extract_keys(question: str) -> Tuple[str, ...]:
+    '''
+    问题中必须精确一致的关键实体：数字(年份、金额、数量)、英文词、引号/书名号中的内容、时间词
+    返回排序后的元组，数字按出现次数保留
+    '''
+    keys = [m.group(1) for m in _QUOTED.finditer(question)]
+    keys.extend(m.group().lower() for m in _LATIN.finditer(question))
+    keys.extend(m.group() for m in _NUMBER.finditer(question))
+    keys.extend(_time_key(m.group()) for m in _TIME.finditer(question))
+    return tuple(sorted(keys))
+
+
+def strip_time_words(question: str) -> str:
+    '''去掉时间词后再向量化：时间词已作为关键实体精确比较，留在文本里只会让词序不同的改写句相似度下降'''
+    return _TIME.sub("", question)
+
+
+class SemanticCache:
+    '''
+    内存中的近似最近邻缓存
+    倒排索引(特征桶 -> 条目id)只召回与查询共享特征的条目，避免与全部条目逐一比较
+    '''
+    def __init__(self, threshold: float = 0.85, ttl: Optional[float] = 3600,
+                 max_entries: int = 1000, max_candidates: int = 50,
+                 embedder: Optional[HashingEmbedder] = None,
+                 key_extractor: Callable[[str], Tuple[str, ...]] = extract_keys):
+        '''
+        参数：
+        - threshold (float): 余弦相似度阈值，关键实体一致且达到阈值才视为同一问题
+        - ttl (float, 可选): 答案的有效秒数(天气、新闻类答案会过时)，None 表示不过期
+        - max_entries (int): 最多缓存的问题数，超过后淘汰最早写入的
+        - max_candidates (int): 每次查询最多精排的候选数
+        - key_extractor (callable): 关键实体抽取函数，可替换为基于词典或NER的实现
+        '''
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_candidates = max_candidates
+        self.embedder = embedder or HashingEmbedder()
+        self.key_extractor = key_extractor
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[int, dict] = {}
+        self._index: Dict[int, set] = defaultdict(set)
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for feature in entry["vector"]:
+            bucket = self._index.get(feature)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._index[feature]
+
+    def lookup(self, question: str) -> Optional[dict]:
+        '''
+        查找语义相近的已缓存问题，命中返回 {"question","answer","score"}，否则返回 None
+        '''
+        vector = self.embedder.embed(strip_time_words(question))
+        keys = self.key_extractor(question)
+        now = time.time()
+        with self._lock:
+            # 1.倒排召回：按共享特征数排序取前 max_candidates 个
+            overlap = Counter()
+            for feature in vector:
+                for entry_id in self._index.get(feature, ()):
+                    overlap[entry_id] += 1
+
+            best, best_score = None, 0.0
+            for entry_id, _ in overlap.most_common(self.max_candidates):
+                entry = self._entries[entry_id]
+                if self.ttl is not None and now - entry["created"] > self.ttl:
+                    self._remove(entry_id)
+                    continue
+                # 年份、金额等不一致时相似度再高也是另一个问题
+                if entry["keys"] != keys:
+                    continue
+                # 2.精排：余弦相似度
+                score = cosine(vector, entry["vector"])
+                if score > best_score:
+                    best, best_score = entry, score
+
+            if best is not None and best_score >= self.threshold:
+                self.hits += 1
+                return {"question": best["question"], "answer": best["answer"], "score": best_score}
+            self.misses += 1
+            return None
+
+    def add(self, question: str, answer: str):
+        '''
+        缓存一个问题及其最终答案
+        '''
+        if not answer:
+            return
+        vector = self.embedder.embed(strip_time_words(question))
+        with self._lock:
+            while len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))  # dict按插入顺序，最早的在最前
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "question": question,
+                "answer": answer,
+                "vector": vector,
+                "keys": self.key_extractor(question),
+                "created": time.time(),
+            }
+            for feature in vector:
+                self._index[feature].add(entry_id)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -19,6 +19,8 @@ class SearchState(TypedDict):
     search_results:str # Tavily搜索返回的结果
     final_answer:str  # 最终生成的答案
     step:str  # 标记当前步骤
+    question:str  # 用户的原始提问(语义缓存的键)
+    cache_hit:bool  # 本轮是否命中语义缓存
 
     '''
     我们创建了 SearchState 这个 TypedDict，为状态对象定义了一个清晰的数据模式（Schema）。
@@ -0,0 +1,46 @@
+from semantic_cache import SemanticCache, extract_keys
+
+
+def make_cache(*questions):
+    cache = SemanticCache()
+    for question in questions:
+        cache.add(question, f"答案: {question}")
+    return cache
+
+
+def test_paraphrase_hits():
+    '''
+    词序不同、多了虚词的改写问句应命中
+    '''
+    cache = make_cache("今天北京天气")
+    hit = cache.lookup("北京今天天气如何")
+    assert hit is not None and hit["question"] == "今天北京天气"
+    assert cache.lookup("北京今日的天气怎么样") is not None  #今日与今天是同一个键
+
+
+def test_different_day_misses():
+    '''
+    只差时间词的问题答案不同，不能命中
+    '''
+    cache = make_cache("今天北京天气")
+    assert cache.lookup("明天北京天气怎么样") is None
+    assert cache.lookup("北京天气") is None
+    assert extract_keys("星期天上海天气") == extract_keys("周日上海天气")
+
+
+def test_numbers_and_places_miss():
+    '''
+    年份、金额不同或地点不同的问题不能命中
+    '''
+    cache = make_cache("2023年诺贝尔物理学奖得主", "1美元兑换多少人民币", "北京今天的天气")
+    assert cache.lookup("2024年诺贝尔物理学奖得主") is None
+    assert cache.lookup("100美元兑换多少人民币") is None
+    assert cache.lookup("南京今天的天气") is None
+    assert cache.lookup("2023年诺贝尔物理学奖得主是谁") is not None
+
+
+if __name__ == "__main__":
+    test_paraphrase_hits()
+    test_different_day_misses()
+    test_numbers_and_places_miss()
+    print("✅ 语义缓存测试通过")
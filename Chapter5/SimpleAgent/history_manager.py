@@ -0,0 +1,183 @@
+"""对话历史管理"""
+import re
+import bisect
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, List, Optional, Dict
+
+'''
+MysimpleAgent 原先把 self._history 全部回放进每一次请求，会话越长每一轮越慢、越贵。
+HistoryManager 为每个模型设定历史的 token 预算：
+- 维护每条消息 token 数的前缀和，窗口的切分点用二分查找得到，O(log n)
+- 最近的若干轮原样保留；超出预算(或超过 Config.max_history_length 条)的旧消息折叠进一段滚动摘要
+- 摘要在后台线程中生成，不阻塞当前请求；摘要完成前沿用上一版摘要
+'''
+
+# 各模型的上下文长度(token)，历史最多占用其中的 history_ratio
+MODEL_CONTEXT_WINDOWS: Dict[str, int] = {
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-3.5-turbo": 16385,
+    "deepseek-chat": 64000,
+    "qwen-plus": 131072,
+    "Qwen/Qwen1.5-0.5B-Chat": 32768,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+SUMMARY_PROMPT = """请把下面的对话内容与已有摘要合并成一段新的摘要。
+保留用户的身份信息、偏好、已确认的事实与结论、未完成的任务，省略寒暄与重复内容，不超过300字。
+
+已有摘要：
+{summary}
+
+新的对话内容：
+{conversation}
+
+请直接输出新的摘要："""
+
+_CJK = re.compile(r"[　-鿿가-힯＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    '''
+    粗略估计token数：中日韩字符按1个token，其余字符按约4个字符1个token；每条消息另加4个token的格式开销
+    '''
+    if not text:
+        return 4
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4 + 4
+
+
+class HistoryManager:
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        budget_tokens: Optional[int] = None,
+        max_messages: int = 100,
+        keep_recent: int = 4,
+        history_ratio: float = 0.25,
+        summarizer: Optional[Callable[[str, str], str]] = None,
+        token_counter: Callable[[str], int] = estimate_tokens,
+    ):
+        '''
+        参数：
+        - model (str, 可选): 模型名，用于查找默认预算
+        - budget_tokens (int, 可选): 历史(含摘要)的token预算，默认取模型上下文长度 × history_ratio
+        - max_messages (int): 原样保留的消息条数上限，对应 Config.max_history_length
+        - keep_recent (int): 无论预算如何都原样保留的最近消息条数
+        - summarizer (callable, 可选): summarizer(已有摘要, 待折叠的对话文本) -> 新摘要；为 None 时旧消息直接丢弃
+        - token_counter (callable): 单条消息的token计数函数
+        '''
+        context = MODEL_CONTEXT_WINDOWS.get(model or "", DEFAULT_CONTEXT_WINDOW)
+        self.budget_tokens = budget_tokens or int(context * history_ratio)
+        self.max_messages = max_messages
+        self.keep_recent = keep_recent
+        self.summarizer = summarizer
+        self.token_counter = token_counter
+
+        self._messages: List[dict] = []
+        self._prefix: List[int] = [0]   #_prefix[i] = 前 i 条消息的token总数
+        self._folded = 0                #已经折叠进摘要(或正在折叠)的消息条数
+        self.summary = ""
+        self._summary_tokens = 0
+        self._pending: Optional[Future] = None
+        self._generation = 0            #clear() 之后，旧的后台摘要结果作废
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+        self._lock = threading.Lock()
+
+    def append(self, role: str, content: str):
+        with self._lock:
+            self._messages.append({"role": role, "content": content})
+            self._prefix.append(self._prefix[-1] + self.token_counter(content))
+
+    def _window_start(self) -> int:
+        '''
+        窗口起点：在预算内尽量多保留最近的消息(二分查找前缀和)，同时满足条数上限；
+        起点不能落在 assistant 消息上，避免窗口以半轮对话开头
+        '''
+        n = len(self._messages)
+        budget = max(0, self.budget_tokens - self._summary_tokens)
+        start = bisect.bisect_left(self._prefix, self._prefix[n] - budget, lo=self._folded, hi=n)
+        start = max(start, n - self.max_messages, self._folded)
+        start = min(start, max(self._folded, n - self.keep_recent))
+        while start < n and self._messages[start]["role"] == "assistant":
+            start += 1
+        return start
+
+    def messages(self) -> List[dict]:
+        '''
+        返回应发送给模型的历史：[摘要(system)] + 窗口内的原始消息
+        窗口之外尚未折叠的消息提交给后台线程生成新摘要
+        '''
+        with self._lock:
+            start = self._window_start()
+            #先取窗口再提交折叠：没有 summarizer 时 _schedule_fold 会立即压缩列表，start 随之失效
+            window = self._messages[start:]
+            if start > self._folded:
+                self._schedule_fold(start)
+            summary = self.summary
+        if summary:
+            return [{"role": "system", "content": f"以下是之前对话的摘要：\n{summary}"}] + window
+        return list(window)
+
+    def _schedule_fold(self, start: int):
+        to_fold = self._messages[self._folded:start]
+        self._folded = start
+        if self.summarizer is None:
+            self._compact()
+            return
+        conversation = "\n".join(f"{m['role']}: {m['content']}" for m in to_fold)
+        previous = self._pending
+        generation = self._generation
+
+        def fold():
+            if previous is not None:
+                previous.result()  #摘要需要按顺序滚动合并
+            try:
+                summary = self.summarizer(self.summary or "无", conversation)
+            except Exception as e:
+                print(f"⚠️ 生成历史摘要失败，保留原摘要: {e}")
+                return
+            with self._lock:
+                if generation != self._generation:
+                    return
+                self.summary = (summary or "").strip()
+                self._summary_tokens = self.token_counter(self.summary) if self.summary else 0
+                self._compact()
+
+        self._pending = self._executor.submit(fold)
+
+    def _compact(self):
+        '''丢弃已经折叠的消息并重建前缀和(摊还代价)；调用方需持有锁'''
+        if self._folded == 0:
+            return
+        del self._messages[:self._folded]
+        base = self._prefix[self._folded]
+        self._prefix = [t - base for t in self._prefix[self._folded:]]
+        self._folded = 0
+
+    def wait(self, timeout: Optional[float] = None):
+        '''等待正在进行的摘要完成(测试或退出前使用)'''
+        pending = self._pending
+        if pending is not None:
+            pending.result(timeout=timeout)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._pending = None
+            self._messages.clear()
+            self._prefix = [0]
+            self._folded = 0
+            self.summary = ""
+            self._summary_tokens = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "messages": len(self._messages) - self._folded,
+                "tokens": self._prefix[-1] - self._prefix[self._folded],
+                "summary_tokens": self._summary_tokens,
+                "budget_tokens": self.budget_tokens,
+            }
@@ -0,0 +1,179 @@
+'''
+LLM调用的埋点与指标统计
+所有LLM封装类(AgentLLM、LLM、QhLLM)以及MysimpleAgent都把每一次调用的数据上报到这里：
+- prompt/completion token 数(流式调用通过 stream_options.include_usage 获取)
+- 首token延迟(TTFT)、总延迟、生成速率(token/s)
+- 重试次数、是否出错
+- 归属：哪个智能体、第几步发起的调用
+进程内的 registry 提供直方图分位数汇总，并可导出为 JSONL。
+'''
+import os
+import json
+import math
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List
+
+_attribution: contextvars.ContextVar = contextvars.ContextVar("llm_attribution", default={})
+
+
+@contextmanager
+def attribution(**labels):
+    '''
+    标记接下来的LLM调用属于哪个智能体/哪一步，例如：
+        with attribution(agent="ReactAgent", step=3):
+            llm.think(...)
+    基于 contextvars，线程和协程之间互不干扰，嵌套时内层标签覆盖外层
+    '''
+    token = _attribution.set({**_attribution.get(), **labels})
+    try:
+        yield
+    finally:
+        _attribution.reset(token)
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    '''最近秩法计算分位数，输入需已排序'''
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class MetricsRegistry:
+    '''
+    进程内的指标注册表：保存最近 max_records 条调用记录，按需计算直方图分位数
+    设置环境变量 LLM_METRICS_JSONL 后，每条记录会实时追加写入该文件
+    '''
+    HISTOGRAM_FIELDS = ["latency", "ttft", "prompt_tokens", "completion_tokens", "tokens_per_second"]
+
+    def __init__(self, max_records: int = 10000, jsonl_path: Optional[str] = None):
+        self._records: deque = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+        self.jsonl_path = jsonl_path
+
+    def record(self, **fields) -> Dict[str, Any]:
+        record = {"timestamp": time.time(), **_attribution.get(), **fields}
+        with self._lock:
+            self._records.append(record)
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return record
+
+    def records(self, **filters) -> List[Dict[str, Any]]:
+        '''按字段过滤记录，例如 records(agent="ReactAgent")'''
+        with self._lock:
+            return [r for r in self._records if all(r.get(k) == v for k, v in filters.items())]
+
+    def histogram(self, field: str, **filters) -> Dict[str, float]:
+        '''
+        某个数值字段的分布：count/mean/p50/p90/p95/p99/max
+        '''
+        values = sorted(r[field] for r in self.records(**filters) if r.get(field) is not None)
+        if not values:
+            return {"count": 0}
+        return {
+            "count": len(values),
+            "mean": sum(values) / len(values),
+            "p50": _percentile(values, 50),
+            "p90": _percentile(values, 90),
+            "p95": _percentile(values, 95),
+            "p99": _percentile(values, 99),
+            "max": values[-1],
+        }
+
+    def summary(self, **filters) -> Dict[str, Any]:
+        '''
+        汇总：调用次数、出错次数、重试总数、token总量以及各延迟字段的直方图
+        '''
+        records = self.records(**filters)
+        return {
+            "calls": len(records),
+            "errors": sum(1 for r in records if r.get("error")),
+            "retries": sum(r.get("retries") or 0 for r in records),
+            "prompt_tokens": sum(r.get("prompt_tokens") or 0 for r in records),
+            "completion_tokens": sum(r.get("completion_tokens") or 0 for r in records),
+            **{field: self.histogram(field, **filters) for field in self.HISTOGRAM_FIELDS},
+        }
+
+    def export_jsonl(self, path: str) -> int:
+        '''把当前保存的所有记录写入JSONL文件，返回写入条数'''
+        records = self.records()
+        with open(path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return len(records)
+
+    def reset(self):
+        with self._lock:
+            self._records.clear()
+
+
+# 进程级默认注册表
+registry = MetricsRegistry(jsonl_path=os.getenv("LLM_METRICS_JSONL"))
+
+
+class CallTimer:
+    '''
+    单次LLM调用的计时器
+    用法：timer = CallTimer(wrapper="AgentLLM", model=...)；每收到一个文本块调用 on_token()；
+    结束时调用 finish(usage=..., error=...) 上报到 registry
+    '''
+    def __init__(self, wrapper: str, model: str, stream: bool = True, metrics: MetricsRegistry = None):
+        self.wrapper = wrapper
+        self.model = model
+        self.stream = stream
+        self.metrics = metrics or registry
+        self.start = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self.chunks = 0
+        self.retries = 0
+        self.hedged = False
+
+    def restart(self):
+        '''重试时清空上一次尝试的token计时，总延迟仍从第一次尝试开始计算'''
+        self.first_token_at = None
+        self.last_token_at = None
+        self.chunks = 0
+
+    def on_token(self):
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.last_token_at = now
+        self.chunks += 1
+
+    def finish(self, usage: Any = None, error: Optional[Exception] = None, retries: Optional[int] = None, **extra) -> Dict[str, Any]:
+        end = time.perf_counter()
+        prompt_tokens = getattr(usage, "prompt_tokens", None) if usage is not None else None
+        completion_tokens = getattr(usage, "completion_tokens", None) if usage is not None else None
+        ttft = self.first_token_at - self.start if self.first_token_at is not None else None
+
+        # 生成速率(首token之后的token间速率)：优先用服务端返回的 completion_tokens，没有时退化为文本块数
+        tokens_per_second = None
+        if self.chunks > 1:
+            generated = completion_tokens if completion_tokens is not None else self.chunks
+            generation_time = self.last_token_at - self.first_token_at
+            if generation_time > 0:
+                tokens_per_second = (generated - 1) / generation_time
+
+        return self.metrics.record(
+            wrapper=self.wrapper,
+            model=self.model,
+            stream=self.stream,
+            latency=end - self.start,
+            ttft=ttft,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            tokens_per_second=tokens_per_second,
+            chunks=self.chunks,
+            retries=self.retries if retries is None else retries,
+            hedged=self.hedged,
+            error=f"{type(error).__name__}: {error}" if error else None,
+            **extra,
+        )
@@ -2,6 +2,8 @@
 import re
 from typing import Optional,Iterator
 from hello_agents import SimpleAgent,HelloAgentsLLM,Message,Config,ToolRegistry
+from llm_metrics import CallTimer,attribution
+from history_manager import HistoryManager,SUMMARY_PROMPT
 
 class MysimpleAgent(SimpleAgent):
     """
@@ -18,6 +20,12 @@ class MysimpleAgent(SimpleAgent):
         enable_tool_calling:bool=True
     ):
         super().__init__(name, llm, system_prompt, config)
+        #按token预算回放历史，超出部分在后台折叠为摘要；同时落实 Config.max_history_length
+        self.history_manager = HistoryManager(
+            model=getattr(llm,"model",None),
+            max_messages=self.config.max_history_length,
+            summarizer=self._summarize_history,
+        )
         self.tool_registry = tool_registry
         self.enable_tool_calling = enable_tool_calling and tool_registry is not None #确保能够调用工具
         print(f"{name} agent 初始化完成，工具调用:{'启用' if self.enable_tool_calling else '禁用'}")
@@ -37,13 +45,13 @@ class MysimpleAgent(SimpleAgent):
             message.append({"role":"system","content":enhanced_system_prompt})
 
         #访问历史信息并添加至message
-        for msg in self._history:
-            '''
-            self._history.append(message) 说明_history是一个列表，列表中存储的是Message对象
-            Message对象的role属性是字符串，表示消息的角色，如"user"、"assistant"、"system"等
-            Message对象的content属性是字符串，表示消息的内容
-            '''
-            message.append({"role":msg.role,"content":msg.content})
+        '''
+        self._history.append(message) 说明_history是一个列表，列表中存储的是Message对象
+        Message对象的role属性是字符串，表示消息的角色，如"user"、"assistant"、"system"等
+        Message对象的content属性是字符串，表示消息的内容
+        history_manager 只返回预算内的最近消息，更早的内容以摘要形式出现
+        '''
+        message.extend(self.history_manager.messages())
 
         #添加当前用户信息
         message.append({"role":"user","content":input_text})
@@ -51,7 +59,7 @@ class MysimpleAgent(SimpleAgent):
         #如果没有工具调用，调用简单对话逻辑
         if not self.enable_tool_calling:
             # think() 返回生成器，invoke() 返回字符串
-            response = self.llm.invoke(message)
+            response = self._invoke(message,step=1)
             self.add_message(Message(role="user",content=input_text))
             self.add_message(Message(role="assistant",content=response))
             return response
@@ -70,8 +78,7 @@ class MysimpleAgent(SimpleAgent):
         if self.system_prompt:
             messages.append({"role": "system", "content": self.system_prompt})
 
-        for msg in self._history:
-            messages.append({"role": msg.role, "content": msg.content})
+        messages.extend(self.history_manager.messages())
 
         messages.append({"role": "user", "content": input_text})
 
@@ -90,6 +97,44 @@ class MysimpleAgent(SimpleAgent):
         self.add_message(Message(full_response, "assistant"))
         print(f"✅ {self.name} 流式响应完成")
 
+    def _invoke(self,message:list,step,**kwargs)->str:
+        '''
+        带指标的LLM调用：调用按 agent/step 归属
+        如果LLM自身已经上报指标(如QhLLM)，这里只设置归属，否则在智能体层面计时
+        '''
+        with attribution(agent=self.name,step=step):
+            if getattr(self.llm,"instrumented",False):
+                return self.llm.invoke(message,**kwargs)
+            timer = CallTimer(wrapper="MysimpleAgent",model=getattr(self.llm,"model",None),stream=False)
+            try:
+                response = self.llm.invoke(message,**kwargs)
+            except Exception as e:
+                timer.finish(error=e)
+                raise
+            timer.finish()
+            return response
+
+    def add_message(self,message:Message):
+        '''
+        添加消息到历史记录，_history 最多保留 Config.max_history_length 条
+        '''
+        super().add_message(message)
+        self.history_manager.append(message.role,message.content)
+        overflow = len(self._history) - self.config.max_history_length
+        if overflow > 0:
+            del self._history[:overflow]
+
+    def clear_history(self):
+        super().clear_history()
+        self.history_manager.clear()
+
+    def _summarize_history(self,summary:str,conversation:str)->str:
+        '''
+        在后台线程中把被挤出窗口的旧对话合并进滚动摘要
+        '''
+        prompt = SUMMARY_PROMPT.format(summary=summary,conversation=conversation)
+        return self._invoke([{"role":"user","content":prompt}],step="summary")
+
     def _get_enhanced_system_prompt(self)->str:
         '''
         获取增强后的系统提示词
@@ -129,7 +174,7 @@ class MysimpleAgent(SimpleAgent):
         final_response = None
         
         while current_iteration < max_tool_iterations:
-            response = self.llm.invoke(message)  # 直接获得结果
+            response = self._invoke(message,step=current_iteration+1)  # 直接获得结果
 
             #检查是否有工具调用
             tool_calls = self._parse_tool_calls(response)
@@ -165,7 +210,7 @@ class MysimpleAgent(SimpleAgent):
         
         # 如果超过最大迭代次数，获取最后一次回答
         if current_iteration >= max_tool_iterations and not final_response:
-            final_response = self.llm.invoke(message, **kwargs)
+            final_response = self._invoke(message,step=current_iteration+1,**kwargs)
 
         # 保存到历史记录
         self.add_message(Message(role="user",content=input_text))
@@ -26,8 +26,11 @@ class Agent(ABC):
         pass
     
     def add_message(self, message: Message):
-        """添加消息到历史记录"""
+        """添加消息到历史记录，最多保留 config.max_history_length 条"""
         self._history.append(message)
+        overflow = len(self._history) - self.config.max_history_length
+        if overflow > 0:
+            del self._history[:overflow]
     
     def clear_history(self):
         """清空历史记录"""
@@ -1,7 +1,10 @@
 import os
-from typing import Optional
-from openai import OpenAI
-from hello_agents import HelloAgentsLLM
+import time
+from typing import Optional,Iterator,List,Dict,Any
+from hello_agents import HelloAgentsLLM,HelloAgentsException
+from client_pool import get_openai_client
+from llm_metrics import CallTimer
+from router import EndpointRouter
 
 '''
 通过继承HelloAgentsLLM,从而增加对ModelScope平台的支持
@@ -24,11 +27,32 @@ class QhLLM(HelloAgentsLLM):
         provider: Optional[str] = "auto", 
         #Optional[str] 表示该参数可以是 str 或 None
         #调用时不传 provider 时，默认使用 "auto"
+        targets: Optional[List[Dict[str,Any]]] = None,
+        #路由模式：传入多个后端 [{"provider":..,"base_url":..,"model":..,"api_key":..}, ...]
         **kwargs,
         ):
 
+        self.router = None
+        if targets:
+            print(f"正在使用多端点路由模式，共{len(targets)}个后端")
+            self.temperature = kwargs.get('temperature', 0.7)
+            self.max_tokens = kwargs.get('max_tokens', 500)
+            self.timeout = kwargs.get('timeout', 60)
+            self.router = EndpointRouter(
+                [{"timeout":self.timeout,**target} for target in targets],
+                failure_threshold=kwargs.get('failure_threshold', 3),
+                cooldown=kwargs.get('cooldown', 30.0),
+            )
+            #以第一个后端作为默认展示信息，实际请求由路由器挑选
+            first = self.router.endpoints[0]
+            self.provider = "router"
+            self.model = model or first.model
+            self.api_key = None
+            self.base_url = first.base_url
+            self._client = first.client
+
         #检查provider是否为'modelscope'
-        if provider == "modelscope":
+        elif provider == "modelscope":
             print("正在使用自定义的ModelScope Provider")
 
             #解析ModelScope的凭证
@@ -44,9 +68,9 @@ class QhLLM(HelloAgentsLLM):
             self.max_tokens = kwargs.get('max_tokens', 500)
             self.timeout = kwargs.get('timeout', 60)
 
-            #使用获取的参数创建OpenAI客户端
+            #从共享注册表获取OpenAI客户端，相同配置复用同一个连接池
 
-            self._client = OpenAI(api_key=self.api_key,base_url=self.base_url,timeout=self.timeout)#这里无需传递model，是在创建连接
+            self._client = get_openai_client(api_key=self.api_key,base_url=self.base_url,timeout=self.timeout)#这里无需传递model，是在创建连接
             '''
             调用代码：
             response = self._client.chat.completions.create(
@@ -59,8 +83,110 @@ class QhLLM(HelloAgentsLLM):
             '''
         else:
             super().__init__(model,api_key,base_url,provider,**kwargs)
+            #父类创建的是独立客户端，这里替换为共享连接池中的客户端
+            self._client = get_openai_client(api_key=self.api_key,base_url=self.base_url,timeout=self.timeout)
             # - self._client 已创建
             # - self.model 已设置
             # - self.api_key 已设置
             # - 所有父类的功能都可以使用
 
+    #MysimpleAgent等调用方据此判断LLM自身已经上报指标，避免重复统计
+    instrumented = True
+
+    def _targets(self)->list:
+        '''
+        本次请求可尝试的(后端, 客户端, 模型)列表：路由模式下按评分排序，否则只有自身一个
+        '''
+        if self.router is None:
+            return [(None,self._client,self.model)]
+        return [(endpoint,endpoint.client,endpoint.model) for endpoint in self.router.candidates()]
+
+    def think(self,messages:list[dict[str,str]],temperature:Optional[float]=None)->Iterator[str]:
+        '''
+        重写父类的流式调用：行为保持一致(边打印边yield)，同时上报TTFT、生成速率与token用量
+        父类逐块读取choices[0]，遇到include_usage的usage块(choices为空)会出错，所以这里整体重写
+        路由模式下，首个token到达之前出错会自动切换到下一个后端
+        '''
+        last_error = None
+        for endpoint,client,model in self._targets():
+            print(f"🧠 正在调用 {model} 模型...")
+            timer = CallTimer(wrapper="QhLLM",model=model)
+            usage = None
+            started = time.perf_counter()
+            reported = False
+            if endpoint:
+                self.router.acquire(endpoint)
+            try:
+                response = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature if temperature is not None else self.temperature,
+                    max_tokens=self.max_tokens,
+                    stream=True,
+                    stream_options={"include_usage":True},
+                )
+                print("✅ 大语言模型响应成功:")
+                for chunk in response:
+                    if getattr(chunk,'usage',None):
+                        usage = chunk.usage
+                    content = chunk.choices[0].delta.content if chunk.choices else None
+                    if content:
+                        timer.on_token()
+                        print(content,end="",flush=True)
+                        yield content
+                print()
+                timer.finish(usage=usage,endpoint=endpoint.name if endpoint else None)
+                if endpoint:
+                    self.router.report(endpoint,time.perf_counter() - started,success=True)
+                    reported = True
+                return
+            except Exception as e:
+                timer.finish(usage=usage,error=e,endpoint=endpoint.name if endpoint else None)
+                if endpoint:
+                    self.router.report(endpoint,None,success=False)
+                    reported = True
+                print(f"❌ 调用LLM API时发生错误: {e}")
+                last_error = e
+                if timer.chunks > 0:
+                    break #已经输出的内容无法撤回，不再切换后端
+            finally:
+                #调用方提前停止迭代时，只释放在途计数，不计入成功或失败
+                if endpoint and not reported:
+                    self.router.release(endpoint)
+        raise HelloAgentsException(f"LLM调用失败: {str(last_error)}")
+
+    def invoke(self,messages:list[dict[str,str]],**kwargs)->str:
+        '''
+        重写父类的非流式调用，记录总延迟与token用量；路由模式下失败自动切换后端
+        '''
+        last_error = None
+        for endpoint,client,model in self._targets():
+            timer = CallTimer(wrapper="QhLLM",model=model,stream=False)
+            started = time.perf_counter()
+            if endpoint:
+                self.router.acquire(endpoint)
+            try:
+                response = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=kwargs.get('temperature',self.temperature),
+                    max_tokens=kwargs.get('max_tokens',self.max_tokens),
+                    **{k: v for k, v in kwargs.items() if k not in ['temperature','max_tokens']}
+                )
+                timer.finish(usage=response.usage,endpoint=endpoint.name if endpoint else None)
+                if endpoint:
+                    self.router.report(endpoint,time.perf_counter() - started,success=True)
+                return response.choices[0].message.content
+            except Exception as e:
+                timer.finish(error=e,endpoint=endpoint.name if endpoint else None)
+                if endpoint:
+                    self.router.report(endpoint,None,success=False)
+                    print(f"⚠️ 后端 {endpoint.name} 调用失败，尝试下一个: {e}")
+                last_error = e
+        raise HelloAgentsException(f"LLM调用失败: {str(last_error)}")
+
+    def router_stats(self)->Dict[str,Dict[str,Any]]:
+        '''
+        路由模式下各后端的延迟、错误率与熔断状态
+        '''
+        return self.router.stats() if self.router else {}
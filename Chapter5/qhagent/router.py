@@ -0,0 +1,128 @@
+"""多端点路由"""
+import time
+import threading
+from typing import Optional, List, Dict, Any
+from client_pool import get_openai_client
+
+'''
+QhLLM 默认只连接一个端点。当手里有多个 OpenAI 兼容的后端时，
+EndpointRouter 为每个后端维护延迟与错误率的指数滑动平均(EWMA)，每次请求选择"最快且健康"的后端：
+- 评分 = EWMA延迟 × (1 + 在途请求数) × (1 + 错误率惩罚)，在途请求越多评分越差，负载会自然分摊到多个后端
+- 熔断：连续失败达到阈值后熔断一段时间，冷却结束后放行一个探测请求(半开)，成功即恢复
+- 故障转移：调用方按评分顺序依次尝试，当前后端失败时自动换下一个
+'''
+
+class Endpoint:
+    """单个后端的状态"""
+
+    def __init__(
+        self,
+        provider: str,
+        base_url: str,
+        model: str,
+        api_key: Optional[str] = None,
+        timeout: float = 60,
+    ):
+        self.provider = provider
+        self.base_url = base_url
+        self.model = model
+        self.client = get_openai_client(api_key=api_key or "EMPTY", base_url=base_url, timeout=timeout)
+        self.latency: Optional[float] = None  # 延迟EWMA(秒)，None表示还没有样本
+        self.error_rate = 0.0                  # 错误率EWMA
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0                  # 熔断截止时间
+        self.half_open = False                 # 半开状态下只放行一个探测请求
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider}:{self.model}@{self.base_url}"
+
+    def available(self, now: float) -> bool:
+        if now >= self.open_until:
+            return not (self.half_open and self.in_flight > 0)
+        return False
+
+    def score(self, default_latency: float) -> float:
+        latency = self.latency if self.latency is not None else default_latency
+        return latency * (1 + self.in_flight) * (1 + 4 * self.error_rate)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "latency": self.latency,
+            "error_rate": self.error_rate,
+            "in_flight": self.in_flight,
+            "circuit_open": time.monotonic() < self.open_until,
+        }
+
+
+class EndpointRouter:
+    """基于EWMA的延迟感知路由器"""
+
+    def __init__(
+        self,
+        targets: List[Dict[str, Any]],
+        alpha: float = 0.3,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+    ):
+        """
+        targets: [{"provider": ..., "base_url": ..., "model": ..., "api_key": ...}, ...]
+        alpha: EWMA平滑系数，越大越看重最近的样本
+        failure_threshold: 连续失败多少次后熔断
+        cooldown: 熔断持续秒数
+        """
+        if not targets:
+            raise ValueError("路由模式至少需要一个后端")
+        self.endpoints = [Endpoint(**target) for target in targets]
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+
+    def candidates(self) -> List[Endpoint]:
+        """按评分从优到劣返回当前可用的后端；全部熔断时按最早恢复的顺序全部返回，尽量不直接失败"""
+        now = time.monotonic()
+        with self._lock:
+            known = [e.latency for e in self.endpoints if e.latency is not None]
+            # 没有样本的新后端按已知最快延迟估计，保证它能分到流量从而被测量
+            default_latency = min(known) if known else 1.0
+            healthy = [e for e in self.endpoints if e.available(now)]
+            if not healthy:
+                return sorted(self.endpoints, key=lambda e: e.open_until)
+            return sorted(healthy, key=lambda e: e.score(default_latency))
+
+    def acquire(self, endpoint: Endpoint):
+        with self._lock:
+            endpoint.in_flight += 1
+            if time.monotonic() >= endpoint.open_until and endpoint.consecutive_failures >= self.failure_threshold:
+                endpoint.half_open = True
+
+    def release(self, endpoint: Endpoint):
+        """请求被调用方中途放弃：不更新统计，只释放在途计数"""
+        with self._lock:
+            endpoint.in_flight -= 1
+
+    def report(self, endpoint: Endpoint, latency: Optional[float], success: bool):
+        """请求结束后上报结果，更新EWMA与熔断状态"""
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.error_rate = (1 - self.alpha) * endpoint.error_rate + self.alpha * (0.0 if success else 1.0)
+            if success:
+                if latency is not None:
+                    endpoint.latency = latency if endpoint.latency is None else (
+                        (1 - self.alpha) * endpoint.latency + self.alpha * latency
+                    )
+                endpoint.consecutive_failures = 0
+                endpoint.half_open = False
+                endpoint.open_until = 0.0
+            else:
+                endpoint.consecutive_failures += 1
+                if endpoint.half_open or endpoint.consecutive_failures >= self.failure_threshold:
+                    endpoint.open_until = time.monotonic() + self.cooldown
+                    endpoint.half_open = False
+                    print(f"⚠️ 后端 {endpoint.name} 熔断 {self.cooldown:.0f}s")
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {e.name: e.to_dict() for e in self.endpoints}
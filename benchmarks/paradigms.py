@@ -0,0 +1,195 @@
+'''
+单个范式的基准测试执行器(由 run_benchmarks.py 以子进程方式调用)
+每个章节目录下都有同名模块(llm_call、llm_metrics、client_pool ...)，分进程运行才能互不干扰，
+也让峰值内存(RSS)只反映该范式本身。
+外部依赖全部替换为本地实现：LLM 指向桩服务，搜索工具替换为确定性的模拟搜索。
+输出一行JSON：{"paradigm", "tasks": [{"task", "wall", "llm_calls", "prompt_tokens", "completion_tokens", "ok"}], "peak_rss_mb"}
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import contextlib
+import urllib.request
+from typing import Callable, Dict
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+#这些第三方包没有安装时跳过对应范式；其它导入失败(例如章节内模块的错误)说明代码有问题，必须报错
+OPTIONAL_PACKAGES = ("torch", "transformers", "langgraph", "langchain_core", "langchain_openai", "tavily", "hello_agents")
+
+
+def mock_search(query: str) -> str:
+    '''确定性的模拟搜索：同样的查询返回同样的结果'''
+    return "\n\n".join(
+        f"[{i + 1}] 关于“{query}”的模拟结果{i + 1}\n这是一段固定长度的模拟摘要，用于替代真实的搜索引擎返回内容。"
+        for i in range(3)
+    )
+
+
+class MockTavilyClient:
+    def search(self, query: str, **kwargs) -> dict:
+        return {
+            "query": query,
+            "answer": f"关于“{query}”的模拟答案",
+            "results": [
+                {"title": f"模拟结果{i + 1}", "url": f"https://example.com/{i + 1}",
+                 "content": f"关于“{query}”的模拟网页内容{i + 1}。" * 5, "score": 0.9 - 0.1 * i}
+                for i in range(3)
+            ],
+        }
+
+
+def _use_chapter(*parts: str):
+    path = os.path.join(REPO_ROOT, *parts)
+    sys.path.insert(0, path)
+    os.chdir(path)
+
+
+def setup_react() -> Callable[[str], object]:
+    _use_chapter("Chapter3", "ReAct")
+    import ReAct
+    from llm_call import AgentLLM
+    from tool.tool_excute import ToolExecutor
+    ReAct.search = mock_search
+    agent = ReAct.ReactAgent(llm_client=AgentLLM(), tool_executor=ToolExecutor())
+    return agent.run
+
+
+def setup_reflection() -> Callable[[str], object]:
+    _use_chapter("Chapter3", "Reflection", "code")
+    from llm_call import AgentLLM
+    from reflection import ReflectionAgent
+    llm = AgentLLM()
+    #每个任务使用新的智能体，避免记忆在任务之间累积
+    return lambda task: ReflectionAgent(llm_clent=llm).run(task)
+
+
+def setup_plan_and_solve() -> Callable[[str], object]:
+    _use_chapter("Chapter3", "Plan_and_Solve", "code")
+    from llm_call import AgentLLM
+    from plan_and_solve import PlanAndSolveAgent
+    llm = AgentLLM()
+    return lambda task: PlanAndSolveAgent(llm_client=llm).run(task)
+
+
+def setup_langgraph() -> Callable[[str], object]:
+    _use_chapter("Chapter4", "langgraph", "code")
+    import node
+    from graph import creat_search_assistant_graph
+    from langchain_core.messages import HumanMessage
+    original_init = node.NodeConfig.__init__
+
+    def patched_init(self):
+        original_init(self)
+        self.tavily_client = MockTavilyClient()
+
+    node.NodeConfig.__init__ = patched_init
+    app = creat_search_assistant_graph()
+    counter = iter(range(10 ** 6))
+
+    def run(task: str):
+        config = {"configurable": {"thread_id": f"bench-{next(counter)}"}}
+        return app.invoke({"messages": [HumanMessage(content=task)]}, config=config)
+    return run
+
+
+def setup_simple_agent() -> Callable[[str], object]:
+    _use_chapter("Chapter5", "SimpleAgent")
+    from hello_agents import HelloAgentsLLM, ToolRegistry
+    from hello_agents.tools.builtin.calculator import CalculatorTool
+    from my_simpleagent import MysimpleAgent
+    registry = ToolRegistry()
+    registry.register_tool(CalculatorTool())
+    agent = MysimpleAgent(
+        name="BenchAgent",
+        llm=HelloAgentsLLM(),
+        system_prompt="你是一个有用的AI助手，可以使用工具来帮助用户",
+        tool_registry=registry,
+    )
+    return agent.run
+
+
+PARADIGMS: Dict[str, Callable[[], Callable[[str], object]]] = {
+    "react": setup_react,
+    "reflection": setup_reflection,
+    "plan_and_solve": setup_plan_and_solve,
+    "langgraph": setup_langgraph,
+    "simple_agent": setup_simple_agent,
+}
+
+
+def stub_stats(base_url: str) -> dict:
+    with urllib.request.urlopen(base_url.rsplit("/v1", 1)[0] + "/stats") as response:
+        return json.loads(response.read())
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024  #macOS单位是字节，Linux是KB
+
+
+def run_paradigm(name: str, base_url: str, tasks: list, verbose: bool = False) -> dict:
+    os.environ.update({
+        "LLM_BASE_URL": base_url,
+        "LLM_API_KEY": "stub",
+        "LLM_MODEL_ID": "stub",
+        "TAVILY_API_KEY": "stub",
+        "SEARCH_API_KEY": "stub",
+        "LLM_CACHE_PATH": "",   #响应缓存会让后续任务不再请求LLM，测的就不是范式本身了
+        "LLM_HEDGE": "false",
+    })
+    #各章节在导入时会用 .env 覆盖环境变量(override=True)，基准测试必须始终指向桩服务
+    import dotenv
+    dotenv.load_dotenv = lambda *args, **kwargs: False
+
+    devnull = open(os.devnull, "w")
+    quiet = (lambda: contextlib.nullcontext()) if verbose else (lambda: contextlib.redirect_stdout(devnull))
+    try:
+        with quiet():
+            run_task = PARADIGMS[name]()
+    except ModuleNotFoundError as e:
+        if (e.name or "").split(".")[0] not in OPTIONAL_PACKAGES:
+            raise
+        return {"paradigm": name, "skipped": f"缺少依赖: {e}"}
+
+    results = []
+    for task in tasks:
+        before = stub_stats(base_url)
+        start = time.perf_counter()
+        ok = True
+        try:
+            with quiet():
+                run_task(task)
+        except Exception as e:
+            ok = False
+            print(f"任务失败: {task}: {type(e).__name__}: {e}", file=sys.stderr)
+        wall = time.perf_counter() - start
+        after = stub_stats(base_url)
+        results.append({
+            "task": task,
+            "wall": wall,
+            "llm_calls": after["requests"] - before["requests"],
+            "prompt_tokens": after["prompt_tokens"] - before["prompt_tokens"],
+            "completion_tokens": after["completion_tokens"] - before["completion_tokens"],
+            "ok": ok,
+        })
+    return {"paradigm": name, "tasks": results, "peak_rss_mb": peak_rss_mb()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="运行单个范式的基准测试")
+    parser.add_argument("paradigm", choices=list(PARADIGMS))
+    parser.add_argument("--base-url", required=True)
+    parser.add_argument("--tasks", required=True, help="任务集JSON文件")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.tasks, encoding="utf-8") as f:
+        tasks = json.load(f)[args.paradigm]
+    print(json.dumps(run_paradigm(args.paradigm, args.base_url, tasks, args.verbose), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+'''
+端到端智能体基准测试
+在本地桩服务(stub_server.py)和模拟搜索之上，按固定任务集(tasks.json)依次运行各个范式：
+Chapter3 ReAct / Reflection / Plan_and_Solve、Chapter4 LangGraph、Chapter5 MysimpleAgent(带工具)
+统计每个范式的：每任务LLM调用数、每任务prompt/completion token数、单任务耗时 p50/p95、峰值RSS。
+
+与基线(baselines.json)比较，任一指标超过 基线 × (1 + 阈值) + 绝对容差 即判定为回归，退出码为 1。
+用法：
+    python run_benchmarks.py                       # 运行并与基线比较
+    python run_benchmarks.py --update-baseline     # 运行并写入新的基线
+    python run_benchmarks.py --ttft lognormal:-1.6,0.4 --tps normal:60,10   # 带真实感延迟
+    python run_benchmarks.py --paradigms react reflection --threshold wall_p95=0.5
+'''
+import os
+import sys
+import json
+import math
+import argparse
+import subprocess
+from typing import Dict, List
+
+from stub_server import start_stub_server
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PARADIGMS = ["react", "reflection", "plan_and_solve", "langgraph", "simple_agent"]
+
+# 相对阈值：调用次数是确定的，不允许增加；token数允许少量波动；耗时和内存受机器负载影响，放宽
+DEFAULT_THRESHOLDS = {
+    "llm_calls_per_task": 0.0,
+    "prompt_tokens_per_task": 0.05,
+    "completion_tokens_per_task": 0.05,
+    "wall_p50": 0.5,
+    "wall_p95": 0.5,
+    "peak_rss_mb": 0.2,
+}
+# 绝对容差：毫秒级的耗时抖动不应被判为回归
+ABSOLUTE_SLACK = {"wall_p50": 0.02, "wall_p95": 0.05, "peak_rss_mb": 5.0}
+
+
+def _percentile(values: List[float], q: float) -> float:
+    '''最近秩法分位数'''
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, math.ceil(q / 100 * len(values)) - 1))]
+
+
+def summarize(result: dict) -> dict:
+    tasks = result["tasks"]
+    n = len(tasks) or 1
+    walls = [t["wall"] for t in tasks]
+    return {
+        "tasks": len(tasks),
+        "failed": sum(1 for t in tasks if not t["ok"]),
+        "llm_calls_per_task": sum(t["llm_calls"] for t in tasks) / n,
+        "prompt_tokens_per_task": sum(t["prompt_tokens"] for t in tasks) / n,
+        "completion_tokens_per_task": sum(t["completion_tokens"] for t in tasks) / n,
+        "wall_p50": _percentile(walls, 50),
+        "wall_p95": _percentile(walls, 95),
+        "peak_rss_mb": result["peak_rss_mb"],
+    }
+
+
+def run_one(paradigm: str, base_url: str, tasks_path: str, verbose: bool) -> dict:
+    command = [sys.executable, os.path.join(BENCH_DIR, "paradigms.py"), paradigm,
+               "--base-url", base_url, "--tasks", tasks_path]
+    if verbose:
+        command.append("--verbose")
+    completed = subprocess.run(command, capture_output=True, text=True, encoding="utf-8")
+    if completed.returncode != 0:
+        #子进程崩溃(导入错误、任务集缺少该范式等)是失败而不是跳过，必须让门禁报错
+        return {"paradigm": paradigm, "error": f"子进程失败(退出码 {completed.returncode}): {completed.stderr.strip()[-500:]}"}
+    if completed.stderr.strip():
+        print(completed.stderr.strip(), file=sys.stderr)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def compare(current: Dict[str, dict], baseline: Dict[str, dict], thresholds: Dict[str, float]) -> List[str]:
+    '''返回所有回归的描述；基线中没有的范式或指标不参与比较'''
+    regressions = []
+    for paradigm, metrics in current.items():
+        base = baseline.get(paradigm)
+        if not base:
+            continue
+        for metric, threshold in thresholds.items():
+            if metric not in metrics or metric not in base:
+                continue
+            limit = base[metric] * (1 + threshold) + ABSOLUTE_SLACK.get(metric, 0.0)
+            if metrics[metric] > limit:
+                regressions.append(
+                    f"{paradigm}.{metric}: {metrics[metric]:.4g} > 上限 {limit:.4g} (基线 {base[metric]:.4g}, 阈值 {threshold:.0%})"
+                )
+    return regressions
+
+
+def print_table(summaries: Dict[str, dict], skipped: Dict[str, str], errors: Dict[str, str]):
+    header = f"{'paradigm':<16}{'calls/task':>11}{'prompt/task':>13}{'compl/task':>12}{'p50(s)':>9}{'p95(s)':>9}{'rss(MB)':>9}{'failed':>8}"
+    print(header)
+    print("-" * len(header))
+    for paradigm, m in summaries.items():
+        print(f"{paradigm:<16}{m['llm_calls_per_task']:>11.2f}{m['prompt_tokens_per_task']:>13.1f}"
+              f"{m['completion_tokens_per_task']:>12.1f}{m['wall_p50']:>9.3f}{m['wall_p95']:>9.3f}"
+              f"{m['peak_rss_mb']:>9.1f}{m['failed']:>8}")
+    for paradigm, reason in skipped.items():
+        print(f"{paradigm:<16}跳过: {reason}")
+    for paradigm, reason in errors.items():
+        print(f"{paradigm:<16}失败: {reason}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端智能体基准测试")
+    parser.add_argument("--paradigms", nargs="+", choices=PARADIGMS, default=PARADIGMS)
+    parser.add_argument("--tasks", default=os.path.join(BENCH_DIR, "tasks.json"))
+    parser.add_argument("--script", default=os.path.join(BENCH_DIR, "stub_scripts", "agents.json"))
+    parser.add_argument("--baseline", default=os.path.join(BENCH_DIR, "baselines.json"))
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--threshold", action="append", default=[], metavar="METRIC=VALUE",
+                        help="覆盖某个指标的相对阈值，例如 wall_p95=0.5")
+    parser.add_argument("--ttft", default="const:0", help="桩服务首token延迟分布")
+    parser.add_argument("--tps", default="const:0", help="桩服务生成速率分布")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="把本次结果写入JSON文件")
+    parser.add_argument("--verbose", action="store_true", help="显示智能体自身的输出")
+    args = parser.parse_args()
+
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    for item in args.threshold:
+        metric, _, value = item.partition("=")
+        if metric not in thresholds:
+            parser.error(f"未知指标: {metric}")
+        thresholds[metric] = float(value)
+
+    server, base_url = start_stub_server(args.script, ttft=args.ttft, tps=args.tps, seed=args.seed)
+    summaries, skipped, errors = {}, {}, {}
+    try:
+        for paradigm in args.paradigms:
+            print(f"运行 {paradigm} ...", flush=True)
+            result = run_one(paradigm, base_url, args.tasks, args.verbose)
+            if "error" in result:
+                errors[paradigm] = result["error"]
+            elif "skipped" in result:
+                skipped[paradigm] = result["skipped"]
+            else:
+                summaries[paradigm] = summarize(result)
+    finally:
+        server.shutdown()
+
+    print()
+    print_table(summaries, skipped, errors)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"summaries": summaries, "skipped": skipped, "errors": errors}, f, ensure_ascii=False, indent=2)
+
+    if errors:
+        print(f"\n❌ 有范式运行失败: {', '.join(errors)}" + ("，基线未更新" if args.update_baseline else ""))
+        return 1
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(summaries)  #本次跳过的范式保留原有基线
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+        print(f"\n基线已更新: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\n没有基线文件 {args.baseline}，使用 --update-baseline 生成")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(summaries, baseline, thresholds)
+    failed_tasks = [p for p, m in summaries.items() if m["failed"]]
+    if failed_tasks:
+        regressions.append(f"有任务执行失败: {', '.join(failed_tasks)}")
+    if regressions:
+        print("\n❌ 发现性能回归:")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    print("\n✅ 所有指标均在阈值之内")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
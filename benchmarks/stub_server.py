@@ -0,0 +1,325 @@
+'''
+确定性的 OpenAI 兼容桩服务(stub server)
+用于在没有真实LLM的情况下测量智能体编排代码本身的开销、做压测、在笔记本上复现延迟回归。
+- 回答来源：
+  1) 录制的回答(JSONL，按请求内容哈希精确匹配)，可用 --record 代理到真实服务自动录制
+  2) 脚本规则(JSON)：按顺序用正则匹配，第一条命中的规则给出回答；
+     默认匹配"全部消息拼接后的文本"，"scope": "last" 时只匹配最后一条消息，
+     这样规则依据的是对话当前的状态，而不是系统提示里的格式说明和示例
+  3) 都未命中时返回 default 回答
+- 延迟模型：首token延迟(TTFT)与生成速率(token/s)各自服从可配置的分布；
+  随机数种子由 (--seed, 请求内容, 该请求第几次出现) 决定，同样的请求序列得到同样的延迟
+- 支持 stream、stream_options.include_usage、stop、max_tokens
+- /stats 中的 completion_tokens 只统计实际写出的token：流式客户端提前断开时，没发出去的部分不计入
+
+脚本格式：
+{
+  "default": "Thought: ...\\nAction: Finish[...]",
+  "rules": [
+    {"match": "Observation:(?:(?!Thought:|Action:).)*$", "scope": "last", "response": "Thought: 我已经有了最终答案。\\nAction: Finish[...]"},
+    {"match": "汇率", "response": "Thought: ...\\nAction: Search[...]"}
+  ]
+}
+
+用法：
+    python stub_server.py --script stub_scripts/default.json --port 8900 --ttft lognormal:-1.6,0.4 --tps normal:60,10
+    然后 LLM_BASE_URL=http://127.0.0.1:8900/v1
+'''
+import re
+import json
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+
+# 近似分词：英文单词/数字为一个token，每个中文字符或标点为一个token，空白单独成token
+_TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_']+|\s+|[^\sA-Za-z0-9_']")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall(text)
+
+
+class Distribution:
+    '''
+    用字符串描述的随机分布：const:x | uniform:a,b | normal:mu,sigma | lognormal:mu,sigma
+    采样结果截断到不小于 0
+    '''
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",")] if params else []
+        if kind not in ("const", "uniform", "normal", "lognormal"):
+            raise ValueError(f"未知分布: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "const":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(*self.params)
+        elif self.kind == "normal":
+            value = rng.gauss(*self.params)
+        else:
+            value = rng.lognormvariate(*self.params)
+        return max(0.0, value)
+
+
+class StubScript:
+    '''
+    回答的查找：录制 -> 规则 -> 默认
+    '''
+    def __init__(self, script_path: Optional[str] = None, recordings_path: Optional[str] = None):
+        self.default = "Thought: 我已经有了最终答案。\nAction: Finish[这是桩服务的默认回答。]"
+        self.rules: List[Tuple[re.Pattern, str, str]] = []  #(正则, 匹配范围 all/last, 回答)
+        self.recordings = {}
+        self.recordings_path = recordings_path
+        self._lock = threading.Lock()
+        if script_path:
+            with open(script_path, encoding="utf-8") as f:
+                script = json.load(f)
+            self.default = script.get("default", self.default)
+            self.rules = [(re.compile(r["match"], re.DOTALL), r.get("scope", "all"), r["response"])
+                          for r in script.get("rules", [])]
+            for _, scope, _ in self.rules:
+                if scope not in ("all", "last"):
+                    raise ValueError(f"未知的匹配范围: {scope}")
+        if recordings_path:
+            try:
+                with open(recordings_path, encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            item = json.loads(line)
+                            self.recordings[item["key"]] = item["response"]
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def request_key(messages: List[dict], stop: List[str]) -> str:
+        canonical = json.dumps({"messages": messages, "stop": stop}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def respond(self, key: str, messages: List[dict]) -> Optional[str]:
+        if key in self.recordings:
+            return self.recordings[key]
+        prompt = "\n".join(str(m.get("content") or "") for m in messages)
+        last = str(messages[-1].get("content") or "") if messages else ""
+        for pattern, scope, response in self.rules:
+            if pattern.search(last if scope == "last" else prompt):
+                return response
+        return None
+
+    def record(self, key: str, messages: List[dict], response: str):
+        with self._lock:
+            self.recordings[key] = response
+            if self.recordings_path:
+                with open(self.recordings_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"key": key, "messages": messages, "response": response}, ensure_ascii=False) + "\n")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    script: StubScript = None
+    ttft: Distribution = Distribution("const:0")
+    tps: Distribution = Distribution("const:0")  #0 表示不限速
+    seed = 0
+    upstream = None       #录制模式下转发的真实服务(OpenAI客户端)
+    upstream_model = None
+    model_id = "stub"
+    stats = {"requests": 0, "streams": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    _occurrences = {}
+    _lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/v1/models":
+            self._send_json(200, {"object": "list", "data": [{"id": self.model_id, "object": "model", "owned_by": "stub"}]})
+        elif self.path.rstrip("/") == "/stats":
+            self._send_json(200, dict(self.stats))
+        else:
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def _rng(self, key: str) -> random.Random:
+        with self._lock:
+            n = self._occurrences.get(key, 0)
+            self._occurrences[key] = n + 1
+        return random.Random(f"{self.seed}:{key}:{n}")
+
+    def _resolve(self, key: str, body: dict) -> str:
+        response = self.script.respond(key, body["messages"])
+        if response is not None:
+            return response
+        if self.upstream is not None:
+            completion = self.upstream.chat.completions.create(
+                model=self.upstream_model or body.get("model"),
+                messages=body["messages"],
+                temperature=body.get("temperature", 0),
+                stop=body.get("stop"),
+                max_tokens=body.get("max_tokens"),
+            )
+            response = completion.choices[0].message.content or ""
+            self.script.record(key, body["messages"], response)
+            return response
+        return self.script.default
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            messages = body["messages"]
+        except (KeyError, ValueError) as e:
+            self._send_json(400, {"error": {"message": f"invalid request: {e}"}})
+            return
+
+        stop = body.get("stop") or []
+        stop = [stop] if isinstance(stop, str) else list(stop)
+        key = StubScript.request_key(messages, stop)
+        rng = self._rng(key)
+        text = self._resolve(key, body)
+
+        #先截断到stop序列，再按 max_tokens 截断
+        finish_reason = "stop"
+        for s in stop:
+            index = text.find(s)
+            if index != -1:
+                text = text[:index]
+        tokens = tokenize(text)
+        max_tokens = body.get("max_tokens")
+        if max_tokens and len(tokens) > max_tokens:
+            tokens = tokens[:max_tokens]
+            finish_reason = "length"
+
+        prompt_tokens = sum(len(tokenize(str(m.get("content") or ""))) for m in messages)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens), "total_tokens": prompt_tokens + len(tokens)}
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["streams"] += 1 if body.get("stream") else 0
+            self.stats["prompt_tokens"] += prompt_tokens
+
+        ttft = self.ttft.sample(rng)
+        tps = self.tps.sample(rng)
+        token_interval = 1.0 / tps if tps > 0 else 0.0
+        completion_id = f"chatcmpl-stub-{uuid.uuid4().hex[:16]}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            time.sleep(ttft + token_interval * max(len(tokens) - 1, 0))
+            self._count_completion(len(tokens))
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": self.model_id,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+            return
+
+        def chunk(delta: dict, finish: Optional[str] = None, with_usage: bool = False) -> dict:
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": self.model_id,
+                "choices": [] if with_usage else [{"index": 0, "delta": delta, "finish_reason": finish}],
+                "usage": usage if with_usage else None,
+            }
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        written = 0
+        try:
+            time.sleep(ttft)
+            self._write_event(chunk({"role": "assistant", "content": ""}))
+            for i, token in enumerate(tokens):
+                if i > 0 and token_interval:
+                    time.sleep(token_interval)
+                self._write_event(chunk({"content": token}))
+                written += 1
+            self._write_event(chunk({}, finish=finish_reason))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                self._write_event(chunk({}, with_usage=True))
+            self._write_event("[DONE]")
+        except (BrokenPipeError, ConnectionResetError):
+            pass #客户端读到需要的内容后提前断开
+        finally:
+            self._count_completion(written)
+
+    def _count_completion(self, tokens: int):
+        with self._lock:
+            self.stats["completion_tokens"] += tokens
+
+    def _write_event(self, payload):
+        data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+        self.wfile.write(f"data: {data}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+
+def start_stub_server(script_path: Optional[str] = None, host: str = "127.0.0.1", port: int = 0,
+                      ttft: str = "const:0", tps: str = "const:0", seed: int = 0,
+                      recordings_path: Optional[str] = None) -> Tuple[ThreadingHTTPServer, str]:
+    '''
+    在后台线程启动桩服务，返回 (server, base_url)；port=0 时由系统分配空闲端口
+    用完后调用 server.shutdown()
+    '''
+    handler = type("ConfiguredStubHandler", (StubHandler,), {
+        "script": StubScript(script_path, recordings_path),
+        "ttft": Distribution(ttft),
+        "tps": Distribution(tps),
+        "seed": seed,
+        "stats": {"requests": 0, "streams": 0, "prompt_tokens": 0, "completion_tokens": 0},
+        "_occurrences": {},
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-server", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="确定性的 OpenAI 兼容桩服务")
+    parser.add_argument("--script", help="规则脚本(JSON)")
+    parser.add_argument("--recordings", help="录制回答的JSONL文件，回放时按请求哈希匹配")
+    parser.add_argument("--record", metavar="BASE_URL", help="未命中的请求转发到该真实服务并录制到 --recordings")
+    parser.add_argument("--record-api-key", default="EMPTY")
+    parser.add_argument("--record-model", help="转发时使用的模型id，默认沿用请求中的model")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--ttft", default="const:0", help="首token延迟分布(秒)，例如 lognormal:-1.6,0.4")
+    parser.add_argument("--tps", default="const:0", help="生成速率分布(token/s)，0 表示不限速，例如 normal:60,10")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.record and not args.recordings:
+        parser.error("--record 需要同时指定 --recordings")
+    server, base_url = start_stub_server(args.script, args.host, args.port, args.ttft, args.tps, args.seed, args.recordings)
+    if args.record:
+        from openai import OpenAI
+        server.RequestHandlerClass.upstream = OpenAI(api_key=args.record_api_key, base_url=args.record)
+        server.RequestHandlerClass.upstream_model = args.record_model
+    print(f"桩服务已启动: {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()